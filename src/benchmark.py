@@ -0,0 +1,311 @@
+import argparse
+import asyncio
+import contextlib
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from debug_dumps import debug_dumps
+from iso_dates import normalize_grouped_dates, parse_iso
+from monday import MondayBoards
+from project_table import ProjectTable
+from main import build_kpi_table_requests
+from synthetic_board import SyntheticBoard
+
+"""
+Benchmarks every stage of the KPI pipeline on synthetic boards (see synthetic_board.py), no network
+Each stage is timed on its own (best of --repeat runs, and more runs for the fast stages until --min-time
+has been measured) and its peak memory is measured with tracemalloc in one extra run, so the profiler
+doesn't slow down the timings.
+
+    python src/benchmark.py --save-baseline              # record benchmarks/baseline.json
+    python src/benchmark.py                              # compare with it, exits 1 on a regression
+    python src/benchmark.py --sizes 1000 100000 --stages enrich group_projects_by_month
+
+Every run also times a fixed calibration workload, and throughputs are compared relative to it, so a
+slower or busier machine doesn't show up as a regression of every stage.
+A stage regresses when its relative throughput (projects/s) drops, or its peak memory grows,
+by more than the thresholds (20% by default) compared to the baseline for the same size.
+Comparing without a baseline, or with sizes or stages the baseline doesn't have, fails (exit code 2).
+benchmarks/baseline.json is recorded with the default sizes and seed.
+"""
+
+default_sizes = [1_000, 10_000, 50_000]
+default_baseline_path = 'benchmarks/baseline.json'
+
+
+# Synthetic items in the shape the items queries return them, before enrichment
+def fetched_board(size, seed=0):
+    synthetic_board = SyntheticBoard(498075709, items=size, seed=seed)
+    board = {'id': synthetic_board.id, 'name': synthetic_board.name, 'columns': synthetic_board.columns, 'groups': synthetic_board.groups}
+    return synthetic_board, board
+
+
+def fetched_items(monday_projects, synthetic_board, board):
+    column_variables = monday_projects.column_variables(board['id'])
+    column_ids = set(column_variables['columnIds'])
+    value_column_ids = set(column_variables['valueColumnIds'])
+
+    grouped_items = {group['title']: [] for group in board['groups']}
+    for item in synthetic_board.board_items(0, synthetic_board.item_count):
+        grouped_items[item['group']['title']].append({
+            'id': item['id'],
+            'name': item['name'],
+            'created_at': item['created_at'],
+            'updated_at': item['updated_at'],
+            'column_values': [{'id': value['id'], 'text': value['text']} for value in item['column_values'] if value['id'] in column_ids],
+            'status_values': [{'id': value['id'], 'value': value['value']} for value in item['column_values'] if value['id'] in value_column_ids],
+        })
+    return grouped_items
+
+
+# Fixed pure Python workload (dict and string operations, like the pipeline stages), best of repeat runs
+# Its time is the unit the stage throughputs are compared in
+def calibrate(repeat=5):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        counts = {}
+        for i in range(200_000):
+            key = f'{i % 97}-{i % 12}'
+            counts[key] = counts.get(key, 0) + 1
+        seconds = time.perf_counter() - started
+        best = seconds if best is None else min(best, seconds)
+    return round(best, 6)
+
+
+# The pipeline stages, each takes the output of the ones it depends on
+# Stages run in this order, inputs are prepared outside of the measured runs
+async def stage_enrich(monday_projects, inputs):
+    # Same processing as get_board_items once the pages are in
+    board = inputs['board']
+    grouped_items = {group_title: [dict(item) for item in items] for group_title, items in inputs['fetched_items'].items()}
+    started = time.perf_counter()
+    for group_title, items in grouped_items.items():
+        for item in items:
+            monday_projects.tag_item(item, board)
+            monday_projects.enrich_item(item)
+    return grouped_items, time.perf_counter() - started
+
+
+async def stage_normalize_dates(monday_projects, inputs):
+    grouped_items = {group_title: [dict(item) for item in items] for group_title, items in inputs['enrich'].items()}
+    # Start from a cold cache, like a fresh run
+    parse_iso.cache_clear()
+    started = time.perf_counter()
+    normalize_grouped_dates(grouped_items)
+    return grouped_items, time.perf_counter() - started
+
+
+async def stage_group_projects_by_region(monday_projects, inputs):
+    return await timed(monday_projects.group_projects_by_region(inputs['normalize_dates']))
+
+
+async def stage_group_projects_by_month(monday_projects, inputs):
+    return await timed(monday_projects.group_projects_by_month(inputs['group_projects_by_region']))
+
+
+async def stage_data_by_int_manager(monday_projects, inputs):
+    started = time.perf_counter()
+    result = monday_projects.data_by_int_manager(inputs['group_projects_by_month'])
+    return result, time.perf_counter() - started
+
+
+async def stage_gather_kpi_stats(monday_projects, inputs):
+    return await timed(monday_projects.gather_kpi_stats(inputs['group_projects_by_month']))
+
+
+async def stage_aggregate_kpi_stats(monday_projects, inputs):
+    return await timed(monday_projects.aggregate_kpi_stats(inputs['normalize_dates']))
+
+
+# Loading the projects into the columnar table used by the duration KPIs and the streaming pipeline
+async def stage_project_table(monday_projects, inputs):
+    started = time.perf_counter()
+    result = ProjectTable.from_grouped_data(inputs['normalize_dates'])
+    return result, time.perf_counter() - started
+
+
+# Same counts as aggregate_kpi_stats, from the table instead of the project dicts
+async def stage_aggregate_kpi_stats_table(monday_projects, inputs):
+    return await timed(monday_projects.aggregate_kpi_stats(inputs['project_table']))
+
+
+async def stage_duration_kpis(monday_projects, inputs):
+    return await timed(monday_projects.gather_duration_kpis(inputs['project_table']))
+
+
+async def stage_kpi_table_requests(monday_projects, inputs):
+    kpi_by_month, kpi_by_quarter = inputs['gather_kpi_stats'][:2]
+    started = time.perf_counter()
+    result = build_kpi_table_requests(kpi_by_month, kpi_by_quarter)
+    return result, time.perf_counter() - started
+
+
+async def timed(coroutine):
+    started = time.perf_counter()
+    result = await coroutine
+    return result, time.perf_counter() - started
+
+
+stages = {
+    'enrich': stage_enrich,
+    'normalize_dates': stage_normalize_dates,
+    'group_projects_by_region': stage_group_projects_by_region,
+    'group_projects_by_month': stage_group_projects_by_month,
+    'data_by_int_manager': stage_data_by_int_manager,
+    'gather_kpi_stats': stage_gather_kpi_stats,
+    'aggregate_kpi_stats': stage_aggregate_kpi_stats,
+    'project_table': stage_project_table,
+    'aggregate_kpi_stats_table': stage_aggregate_kpi_stats_table,
+    'duration_kpis': stage_duration_kpis,
+    'kpi_table_requests': stage_kpi_table_requests,
+}
+
+
+# Run one stage at least repeat times, and until min_time seconds have been measured so a stage taking
+# a millisecond isn't judged on 3 samples. Returns its output and {seconds, projects_per_second, peak_memory_bytes}
+async def measure(stage, monday_projects, inputs, size, repeat, min_time=0, max_runs=1000):
+    best = None
+    runs = 0
+    measured = 0
+    while runs < repeat or (measured < min_time and runs < max_runs):
+        gc.collect()
+        result, seconds = await stage(monday_projects, inputs)
+        best = seconds if best is None else min(best, seconds)
+        runs += 1
+        measured += seconds
+        del result
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        baseline_memory = tracemalloc.get_traced_memory()[0]
+        result, _ = await stage(monday_projects, inputs)
+        peak_memory = tracemalloc.get_traced_memory()[1] - baseline_memory
+    finally:
+        tracemalloc.stop()
+
+    return result, {
+        'seconds': round(best, 6),
+        'projects_per_second': round(size / best) if best else None,
+        'peak_memory_bytes': peak_memory,
+    }
+
+
+async def run_benchmarks(sizes, selected_stages, repeat, seed=0, min_time=0):
+    results = {}
+    for size in sizes:
+        synthetic_board, board = fetched_board(size, seed)
+        monday_projects = MondayBoards([board['id']])
+        # Synthetic boards span 2023 and 2024, count 2024 whatever today's year is so runs stay comparable
+        monday_projects.kpi_years = {2024}
+        monday_projects.resolve_columns(board)
+        inputs = {'board': board, 'fetched_items': fetched_items(monday_projects, synthetic_board, board)}
+
+        results[str(size)] = {}
+        for name, stage in stages.items():
+            # Later stages need the output of the earlier ones, so those run even when not selected
+            with contextlib.redirect_stdout(open(os.devnull, 'w')):
+                output, stats = await measure(stage, monday_projects, inputs, size, *((repeat, min_time) if name in selected_stages else (1, 0)))
+            inputs[name] = output
+            if name in selected_stages:
+                results[str(size)][name] = stats
+                print(f'{size:>9} {name:<26} {stats["seconds"]:>9.4f}s {stats["projects_per_second"] or 0:>12,} projects/s '
+                      f'{stats["peak_memory_bytes"] / 2 ** 20:>9.1f} MiB peak')
+    return results
+
+
+# Sizes and stages of the results the baseline has no entry for
+def missing_from_baseline(results, baseline):
+    missing = []
+    for size, size_results in results.items():
+        baseline_results = baseline.get('results', {}).get(size)
+        if baseline_results is None:
+            missing.append(f'{size} projects')
+            continue
+        missing.extend(f'{stage} at {size} projects' for stage in size_results if stage not in baseline_results)
+    return missing
+
+
+# Returns the list of regressions compared to the baseline
+# Throughputs are scaled by each run's calibration time, so only the change relative to the machine's speed counts
+def compare(results, calibration_seconds, baseline, time_threshold, memory_threshold):
+    regressions = []
+    for size, size_results in results.items():
+        for stage, stats in size_results.items():
+            baseline_stats = baseline['results'][size][stage]
+            if stats['projects_per_second'] and baseline_stats['projects_per_second']:
+                relative = stats['projects_per_second'] * calibration_seconds
+                baseline_relative = baseline_stats['projects_per_second'] * baseline['calibration_seconds']
+                change = relative / baseline_relative - 1
+                if change < -time_threshold:
+                    regressions.append(f'{stage} at {size} projects: relative throughput {change:+.0%} '
+                                       f'({baseline_stats["projects_per_second"]:,} -> {stats["projects_per_second"]:,} projects/s, '
+                                       f'calibration {baseline["calibration_seconds"]:.4f}s -> {calibration_seconds:.4f}s)')
+            if baseline_stats['peak_memory_bytes']:
+                change = stats['peak_memory_bytes'] / baseline_stats['peak_memory_bytes'] - 1
+                if change > memory_threshold:
+                    regressions.append(f'{stage} at {size} projects: peak memory {change:+.0%} '
+                                       f'({baseline_stats["peak_memory_bytes"]:,} -> {stats["peak_memory_bytes"]:,} bytes)')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the KPI pipeline stages on synthetic boards')
+    parser.add_argument('--sizes', type=int, nargs='+', default=default_sizes, help='number of projects per run')
+    parser.add_argument('--stages', nargs='+', choices=list(stages), default=list(stages))
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per stage, the best one is kept')
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds to measure at least per stage, fast stages get more runs')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=default_baseline_path)
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--time-threshold', type=float, default=0.2, help='allowed throughput drop, 0.2 = 20%%')
+    parser.add_argument('--memory-threshold', type=float, default=0.2, help='allowed peak memory growth, 0.2 = 20%%')
+    args = parser.parse_args()
+
+    # Stages are measured without the debug dumps
+    debug_dumps.mode = 'off'
+    calibration_seconds = calibrate()
+    print(f'Calibration workload: {calibration_seconds:.4f}s')
+    results = asyncio.run(run_benchmarks(args.sizes, args.stages, args.repeat, args.seed, args.min_time))
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w') as file:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                       'calibration_seconds': calibration_seconds, 'results': results}, file, indent=4)
+        print(f'Baseline saved to {args.baseline}')
+        return 0
+
+    # Comparing against nothing would pass every run, a missing baseline is an error
+    if not os.path.exists(args.baseline):
+        print(f'ERROR: no baseline at {args.baseline}, nothing to compare with. Record one with --save-baseline')
+        return 2
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    if not baseline.get('calibration_seconds'):
+        print(f'ERROR: {args.baseline} has no calibration time, record it again with --save-baseline')
+        return 2
+    # A size or stage without a baseline entry would never be checked, so it's an error too
+    missing = missing_from_baseline(results, baseline)
+    if missing:
+        print(f'ERROR: no baseline entry in {args.baseline} for: {", ".join(missing)}. Record them with --save-baseline')
+        return 2
+    regressions = compare(results, calibration_seconds, baseline, args.time_threshold, args.memory_threshold)
+    if regressions:
+        print('Regressions against the baseline:')
+        for regression in regressions:
+            print(f'  {regression}')
+        return 1
+    print(f'No regression against {args.baseline}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+import time
+started = time.perf_counter()
+
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import sys
+
+"""
+Command line entry point for the KPI pipeline, every step can run on its own:
+
+    python src/cli.py fetch [--incremental]      # Monday -> raw_data/projects.json
+    python src/cli.py aggregate                  # raw_data/projects.json -> raw_data/kpis.json
+    python src/cli.py render                     # raw_data/kpis.json -> Google Slides
+    python src/cli.py full                       # everything, same as python src/main.py
+
+Each command only imports the libraries it needs (no Google libraries to fetch or aggregate,
+no gql or aiohttp to aggregate or render) and reports how long imports and startup took.
+"""
+
+import_times = {}
+
+
+# Import a module and record how long it took, modules already imported cost nothing
+def timed_import(name):
+    import_started = time.perf_counter()
+    module = importlib.import_module(name)
+    import_times[name] = time.perf_counter() - import_started
+    return module
+
+
+def report_startup(command):
+    imports = ', '.join(f'{name} {seconds * 1000:.0f} ms' for name, seconds in import_times.items())
+    print(f'{command}: started in {(time.perf_counter() - started) * 1000:.0f} ms (imports: {imports})')
+
+
+def write_json(path, data):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump(data, file, default=str)
+    print(f'Wrote {path}')
+
+
+async def fetch(args):
+    main = timed_import('main')
+    report_startup('fetch')
+    monday_projects = main.MondayBoards()
+    try:
+        if args.incremental:
+            grouped_project_boards = await monday_projects.sync_project_board()
+        else:
+            grouped_project_boards = await monday_projects.get_project_board()
+    finally:
+        await monday_projects.close()
+    write_json(args.output, grouped_project_boards)
+
+
+async def aggregate(args):
+    main = timed_import('main')
+    replay = timed_import('replay')
+    report_startup('aggregate')
+    # Like replay.py, keep our dumps away from the debug snapshot we may be reading from
+    replay.debug_dumps.snapshot_path = 'raw_data/aggregate_debug_snapshot.ndjson.gz'
+    grouped_project_boards = replay.load_recorded_projects(args.input)
+    # Never connects, aggregating doesn't talk to Monday
+    kpi_by_month, kpi_by_quarter, duration_kpis = await main.aggregate_monday_data(main.MondayBoards(), grouped_project_boards)
+    write_json(args.output, {'kpi_by_month': kpi_by_month, 'kpi_by_quarter': kpi_by_quarter, 'duration_kpis': duration_kpis})
+
+
+async def render(args):
+    main = timed_import('main')
+    timed_import('gsuite')
+    report_startup('render')
+    with open(args.input) as file:
+        kpis = json.load(file)
+    kpi_task = asyncio.get_running_loop().create_future()
+    # kpis.json written before the duration KPIs were added has no durations table to fill
+    kpi_task.set_result((kpis['kpi_by_month'], kpis['kpi_by_quarter'], kpis.get('duration_kpis')))
+    await main.publish_slides(kpi_task)
+
+
+async def full(args):
+    main = timed_import('main')
+    timed_import('gsuite')
+    report_startup('full')
+    await main.main()
+
+
+commands = {
+    'fetch': fetch,
+    'aggregate': aggregate,
+    'render': render,
+    'full': full,
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Monday project KPIs to Google Slides')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    fetch_parser = subparsers.add_parser('fetch', help='fetch the projects from Monday')
+    fetch_parser.add_argument('--incremental', action='store_true', help='only fetch what changed since the last snapshot')
+    fetch_parser.add_argument('--output', default='raw_data/projects.json')
+
+    aggregate_parser = subparsers.add_parser('aggregate', help='compute the KPIs from fetched or recorded projects')
+    aggregate_parser.add_argument('--input', default='raw_data/projects.json', help='projects from fetch, or any recording replay.py reads')
+    aggregate_parser.add_argument('--output', default='raw_data/kpis.json')
+
+    render_parser = subparsers.add_parser('render', help='create or update the presentation from computed KPIs')
+    render_parser.add_argument('--input', default='raw_data/kpis.json')
+
+    subparsers.add_parser('full', help='fetch, aggregate and render in one run')
+    return parser.parse_args(argv)
+
+
+def run(argv=None):
+    args = parse_args(argv)
+    command_started = time.perf_counter()
+    try:
+        asyncio.run(commands[args.command](args))
+    finally:
+        # Let the background writer finish the debug dumps, imported by every command through main
+        if 'debug_dumps' in sys.modules:
+            sys.modules['debug_dumps'].debug_dumps.close()
+    print(f'{args.command}: done in {time.perf_counter() - command_started:.2f}s')
+
+
+if __name__ == '__main__':
+    run()
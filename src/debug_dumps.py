@@ -0,0 +1,111 @@
+import atexit
+import gzip
+import json
+import os
+import queue
+import threading
+
+
+# Debug dumps of the intermediate pipeline stages (raw_data/*.json)
+# A background thread serializes the dumps and writes them, the pipeline only queues them.
+# The data is read from that thread, so it must not be changed once it's been handed to write().
+# MONDAY_DEBUG_DUMPS picks what gets written:
+#   off     - nothing
+#   compact - (default) one gzipped newline-delimited JSON snapshot per run, one {"stage", "data"} line per dump
+#   pretty  - one indented JSON file per stage, like we used to write them
+class DebugDumpWriter:
+    modes = ['off', 'compact', 'pretty']
+
+    def __init__(self, mode=None, snapshot_path=None):
+        self.mode = (mode or os.getenv('MONDAY_DEBUG_DUMPS', 'compact')).lower()
+        if self.mode not in self.modes:
+            raise ValueError(f'MONDAY_DEBUG_DUMPS should be one of {self.modes}, got {self.mode}')
+        self.snapshot_path = snapshot_path or os.getenv('MONDAY_DEBUG_SNAPSHOT', 'raw_data/debug_snapshot.ndjson.gz')
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.snapshot_file = None
+        # Files the run reads from, never overwritten by a dump
+        self.input_paths = set()
+
+    def protect(self, path):
+        self.input_paths.add(os.path.realpath(path))
+
+    # Queue a dump for the worker, data must be left as is from here on
+    def write(self, filename, data):
+        if self.mode == 'off':
+            return
+        target = filename if self.mode == 'pretty' else self.snapshot_path
+        if os.path.realpath(target) in self.input_paths:
+            print(f'Not writing the {filename} debug dump, {target} is an input of this run')
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.worker, name='debug-dumps', daemon=True)
+                self.thread.start()
+        self.queue.put((filename, data))
+
+    def worker(self):
+        while True:
+            dump = self.queue.get()
+            try:
+                if dump is None:
+                    return
+                filename, data = dump
+                if self.mode == 'pretty':
+                    self.write_pretty(filename, json.dumps(data, indent=4, default=str))
+                else:
+                    stage = os.path.splitext(os.path.basename(filename))[0]
+                    self.write_compact(json.dumps({'stage': stage, 'data': data}, separators=(',', ':'), default=str))
+            except Exception as e:
+                print(f'Could not write debug dump: {e}')
+            finally:
+                self.queue.task_done()
+
+    def write_pretty(self, filename, text):
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+        with open(filename, 'w') as file:
+            file.write(text)
+
+    def write_compact(self, text):
+        if self.snapshot_file is None:
+            os.makedirs(os.path.dirname(self.snapshot_path) or '.', exist_ok=True)
+            # A fresh snapshot for every run, fast compression since this is only for debugging
+            self.snapshot_file = gzip.open(self.snapshot_path, 'wt', compresslevel=1)
+        self.snapshot_file.write(text)
+        self.snapshot_file.write('\n')
+
+    # Wait for the queued dumps to be written
+    def flush(self):
+        if self.thread is not None:
+            self.queue.join()
+            if self.snapshot_file is not None:
+                self.snapshot_file.flush()
+
+    def close(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        if self.snapshot_file is not None:
+            self.snapshot_file.close()
+            self.snapshot_file = None
+        # Files the run reads from, never overwritten by a dump
+        self.input_paths = set()
+
+    def protect(self, path):
+        self.input_paths.add(os.path.realpath(path))
+
+
+# Reads back the stages of a compact snapshot, {stage: data}
+def read_debug_snapshot(snapshot_path):
+    stages = {}
+    with gzip.open(snapshot_path, 'rt') as file:
+        for line in file:
+            record = json.loads(line)
+            stages[record['stage']] = record['data']
+    return stages
+
+
+debug_dumps = DebugDumpWriter()
+atexit.register(debug_dumps.close)
@@ -0,0 +1,72 @@
+import hashlib
+import json
+import os
+from json_state import load_json, save_json
+
+
+# What we last wrote to each presentation, so a refresh with unchanged KPIs skips the Slides API entirely
+# Stored as {presentation id: hash of the table cells} in .cache/deck_state.json (GOOGLE_DECK_STATE)
+class DeckState:
+    def __init__(self, path=None):
+        self.path = path or os.getenv('GOOGLE_DECK_STATE', '.cache/deck_state.json')
+        self.hashes = {}
+        self.load()
+
+    def load(self):
+        self.hashes = load_json(self.path, 'deck state') or {}
+
+    def save(self):
+        save_json(self.path, self.hashes, indent=4)
+
+    def unchanged(self, presentation_id, cells):
+        return self.hashes.get(presentation_id) == cells_hash(cells)
+
+    def record(self, presentation_id, cells):
+        self.hashes[presentation_id] = cells_hash(cells)
+        self.save()
+
+
+def cells_hash(cells):
+    payload = json.dumps(sorted([table_id, row, column, text] for (table_id, row, column), text in cells.items()))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+# The text every table cell ends up with once the insertText requests are applied to empty tables
+# {(table id, row, column): text}, cells that stay empty are left out
+def expected_table_cells(requests):
+    cells = {}
+    for request in requests:
+        insert_text = request.get('insertText')
+        if not insert_text or 'cellLocation' not in insert_text or not insert_text.get('text'):
+            continue
+        location = insert_text['cellLocation']
+        key = (insert_text['objectId'], location['rowIndex'], location['columnIndex'])
+        text = cells.get(key, '')
+        index = insert_text.get('insertionIndex', 0)
+        cells[key] = text[:index] + insert_text['text'] + text[index:]
+    return cells
+
+
+# Requests turning the current cells into the expected ones, only for the cells that differ
+# Cells of tables that aren't in the presentation can't be updated and are returned apart
+def table_cell_updates(expected_cells, current_cells, table_ids):
+    requests = []
+    missing_tables = set()
+    # Only the tables we fill, anything else on the deck is left alone
+    our_tables = {table_id for table_id, row, column in expected_cells}
+    our_current_cells = {key: text for key, text in current_cells.items() if key[0] in our_tables}
+    for key in sorted(set(expected_cells) | set(our_current_cells)):
+        table_id, row, column = key
+        if table_id not in table_ids:
+            missing_tables.add(table_id)
+            continue
+        expected = expected_cells.get(key, '')
+        current = our_current_cells.get(key, '')
+        if expected == current:
+            continue
+        cell_location = {'rowIndex': row, 'columnIndex': column}
+        if current:
+            requests.append({'deleteText': {'objectId': table_id, 'cellLocation': cell_location, 'textRange': {'type': 'ALL'}}})
+        if expected:
+            requests.append({'insertText': {'objectId': table_id, 'cellLocation': cell_location, 'text': expected, 'insertionIndex': 0}})
+    return requests, missing_tables
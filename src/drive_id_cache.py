@@ -0,0 +1,43 @@
+import os
+import time
+from json_state import load_json, save_json
+
+
+# Drive name -> id cache, so finding our folder and presentation takes no request when it's warm
+# Entries are keyed by (mime type, parent id, name) and stored in .cache/drive_ids.json (GOOGLE_DRIVE_ID_CACHE).
+# Entries younger than ttl seconds (GOOGLE_DRIVE_ID_CACHE_TTL) are trusted as is, older ones are revalidated
+# with a files.get of the id by GoogleDrive before being used.
+class DriveIdCache:
+    def __init__(self, path=None, ttl=None):
+        self.path = path or os.getenv('GOOGLE_DRIVE_ID_CACHE', '.cache/drive_ids.json')
+        self.ttl = ttl if ttl is not None else int(os.getenv('GOOGLE_DRIVE_ID_CACHE_TTL', 3600))
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        self.entries = load_json(self.path, 'Drive id cache') or {}
+
+    def save(self):
+        save_json(self.path, self.entries, indent=4)
+
+    # Returns (id, fresh) or (None, False), fresh entries don't need revalidating
+    def get(self, mime_type, parent_id, name):
+        entry = self.entries.get(cache_key(mime_type, parent_id, name))
+        if not entry:
+            return None, False
+        return entry['id'], time.time() - entry['checked_at'] < self.ttl
+
+    def set(self, mime_type, parent_id, name, file_id):
+        self.entries[cache_key(mime_type, parent_id, name)] = {'id': file_id, 'checked_at': time.time()}
+        self.save()
+
+    def evict(self, file_id):
+        stale = [key for key, entry in self.entries.items() if entry['id'] == file_id]
+        for key in stale:
+            del self.entries[key]
+        if stale:
+            self.save()
+
+
+def cache_key(mime_type, parent_id, name):
+    return f'{mime_type}|{parent_id or ""}|{name}'
@@ -0,0 +1,142 @@
+import numpy as np
+from period_index import FiscalCalendar, month_label
+
+# Tech setup targets from the README: connectors in under 3 months, custom integrations in under 6
+int_type_targets_days = {
+    'connector': 90,
+    'custom': 180,
+}
+
+# Ordinal of 1970-01-01, lets us turn ProjectTable ordinals into numpy datetimes
+epoch_ordinal = 719163
+
+breakdowns = ['global', 'region', 'int_manager']
+
+
+# Duration KPIs computed with numpy over the date columns of a ProjectTable
+# Every metric is a difference of two date columns, grouped with np.unique/np.bincount,
+# so there is no Python loop per project, only per (breakdown, period) bucket.
+#   kickoff_lag: project_creation_date -> start_date, counted on the start month
+#   planned_length: start_date -> due_date, counted on the start month
+#   completed_length: start_date -> closed_date of completed projects, counted on the closing month
+#   sla: share of completed projects within their int type target, counted on the closing month
+# Returns {metric: {breakdown: {value: {period: stats}}}}, 'global' has a single 'All' value, sla also has an int_type breakdown
+# Quarters and years follow the fiscal calendar, same labels as the KPI counts ('2024-01', '2024-Q1')
+# years is the set of (fiscal) years counted, None for every year
+def compute_duration_kpis(table, period='month', years=None, calendar=None):
+    if period not in ('month', 'quarter'):
+        raise ValueError(f"period should be 'month' or 'quarter', got {period}")
+    calendar = calendar or FiscalCalendar()
+
+    dates = {column: np.frombuffer(table.dates[column], dtype=np.int32) for column in table.dates}
+    codes = {column: np.frombuffer(table.codes[column], dtype=np.uint16) for column in ('region', 'int_manager', 'int_type')}
+    statuses = table.dictionaries['project_status'].values
+    completed_codes = [code for code, status in enumerate(statuses) if status and status.lower() == 'completed']
+    completed = np.isin(np.frombuffer(table.codes['project_status'], dtype=np.uint16), completed_codes)
+
+    start, creation, due, closed = dates['start_date'], dates['project_creation_date'], dates['due_date'], dates['closed_date']
+    start_periods, start_labels = period_codes(start, period, calendar)
+    closed_periods, closed_labels = period_codes(closed, period, calendar)
+
+    # Negative durations are data entry errors (e.g. due date before start date) and are left out
+    kickoff_lag = start - creation
+    planned_length = due - start
+    completed_length = closed - start
+    metrics = {
+        'kickoff_lag': (kickoff_lag, (start > 0) & (creation > 0) & (kickoff_lag >= 0), start_periods, start_labels),
+        'planned_length': (planned_length, (start > 0) & (due > 0) & (planned_length >= 0), start_periods, start_labels),
+        'completed_length': (completed_length, completed & (start > 0) & (closed > 0) & (completed_length >= 0), closed_periods, closed_labels),
+    }
+
+    duration_kpis = {}
+    year_masks = {}
+    for metric, (values, mask, periods, labels) in metrics.items():
+        if years is not None:
+            mask = mask & np.isin(period_years(periods, period, calendar), list(years))
+        year_masks[metric] = mask
+        duration_kpis[metric] = {}
+        for breakdown in breakdowns:
+            duration_kpis[metric][breakdown] = grouped_averages(table, breakdown, breakdown_keys(codes, breakdown, periods), values, mask, labels)
+
+    # SLA attainment goes through the same breakdowns, plus int type since the targets depend on it
+    within_target, sla_mask = sla_attainment(table, codes, completed_length, year_masks['completed_length'])
+    duration_kpis['sla'] = {}
+    for breakdown in breakdowns + ['int_type']:
+        duration_kpis['sla'][breakdown] = grouped_averages(table, breakdown, breakdown_keys(codes, breakdown, closed_periods),
+                                                           within_target, sla_mask, closed_labels, sla_stats)
+    return duration_kpis
+
+
+def breakdown_keys(codes, breakdown, periods):
+    return [periods] if breakdown == 'global' else [codes[breakdown], periods]
+
+
+def average_days_stats(count, total):
+    return {'projects': count, 'average_days': round(total / count, 1)}
+
+
+def sla_stats(count, total):
+    return {'projects': count, 'within_target': int(total), 'share_within_target': round(total / count, 3)}
+
+
+# Count and sum of values per unique key combination, formatted by stats (average days by default)
+def grouped_averages(table, breakdown, keys, values, mask, labels, stats=average_days_stats):
+    if not mask.any():
+        return {}
+    unique_keys, inverse = np.unique(np.stack([key[mask] for key in keys], axis=1), axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    counts = np.bincount(inverse, minlength=len(unique_keys))
+    sums = np.bincount(inverse, weights=values[mask], minlength=len(unique_keys))
+
+    grouped = {}
+    for key, count, total in zip(unique_keys, counts, sums):
+        value = 'All' if breakdown == 'global' else table.dictionaries[breakdown].decode(int(key[0]))
+        if value is None:
+            continue
+        grouped.setdefault(value, {})[labels[int(key[-1])]] = stats(int(count), float(total))
+    return grouped
+
+
+# 1 for completed projects delivered within the target of their int type, 0 otherwise
+# Returns it with the mask of the projects that have a target
+def sla_attainment(table, codes, completed_length, mask):
+    targets = np.array([target_days(int_type) for int_type in table.dictionaries['int_type'].values], dtype=np.int32)
+    project_targets = targets[codes['int_type']]
+    mask = mask & (project_targets > 0)
+    within_target = ((completed_length < project_targets) & mask).astype(np.int32)
+    return within_target, mask
+
+
+def target_days(int_type):
+    if not int_type:
+        return 0
+    for name, days in int_type_targets_days.items():
+        if name in int_type.lower():
+            return days
+    return 0
+
+
+# Ordinals -> period code and a label for each code
+# Month codes are period ids (see period_index.py), quarter codes are the calendar's quarter ids
+# Missing dates (ordinal 0) get period -1
+def period_codes(ordinals, period, calendar):
+    months = (ordinals.astype(np.int64) - epoch_ordinal).astype('datetime64[D]').astype('datetime64[M]').astype(np.int64) + 1970 * 12
+    if period == 'month':
+        periods = months
+    else:
+        shifted = months - calendar.offset
+        periods = (shifted // 12 + calendar.year_shift) * 4 + (shifted % 12) // 3
+    periods = np.where(ordinals > 0, periods, -1)
+
+    labels = {}
+    for period_code in np.unique(periods[ordinals > 0]):
+        period_code = int(period_code)
+        labels[period_code] = month_label(period_code) if period == 'month' else calendar.quarter_label(period_code)
+    return periods, labels
+
+
+# (Fiscal) year of each period code
+def period_years(periods, period, calendar):
+    if period == 'month':
+        return (periods - calendar.offset) // 12 + calendar.year_shift
+    return periods // 4
@@ -1,30 +1,155 @@
 from dotenv import load_dotenv
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
 from google.oauth2 import service_account
 from googleapiclient.http import MediaFileUpload
 load_dotenv()  # Load environment variables
 from googleapiclient.errors import HttpError
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import google_auth_httplib2
+import httplib2
+import json
+import os
+import threading
+from drive_id_cache import DriveIdCache
+
+folder_mime_type = 'application/vnd.google-apps.folder'
+presentation_mime_type = 'application/vnd.google-apps.presentation'
+
+# A deck is sent in batchUpdate calls of at most this many requests / bytes of JSON, see DeckBuilder
+slides_batch_max_requests = 500
+slides_batch_max_bytes = 1_000_000
+
+# Placeholders of the predefined layouts we map to our own ids when creating a slide
+# Mapping a placeholder the layout doesn't have fails the whole batch, so only list the ones we know are there
+layout_placeholders = {
+    'BLANK': [],
+    'TITLE_ONLY': ['TITLE'],
+    'TITLE_AND_BODY': ['TITLE', 'BODY'],
+    'SECTION_HEADER': ['TITLE'],
+    'CAPTION_ONLY': ['BODY'],
+}
+
+# Fields read by GoogleSlides.get_slide, enough to find the placeholders of every slide
+presentation_placeholder_fields = 'slides(objectId,pageElements(objectId,shape(placeholder(type,index))))'
+# Fields read by GoogleSlides.read_table_cells, the text of every table cell
+presentation_table_fields = 'slides(pageElements(objectId,table(tableRows(tableCells(text(textElements(textRun(content))))))))'
+
+# googleapiclient only has blocking calls, they run on this bounded pool so the event loop keeps going
+# (Monday fetch, other Google calls) while Google answers. GOOGLE_MAX_WORKERS caps the calls in flight.
+google_executor = ThreadPoolExecutor(max_workers=int(os.getenv('GOOGLE_MAX_WORKERS', 4)), thread_name_prefix='google')
+
+# Shared by every GoogleBase: the service account is read once, tokens are refreshed in one place
+# and services are built from discovery documents cached in memory and on disk (.cache/google_discovery),
+# so a GoogleDrive or GoogleSlides costs no network round trip and no discovery parsing after the first one.
+class GoogleClientFactory:
+    def __init__(self, service_account_file=None, discovery_cache_dir=None):
+        self.service_account_file = service_account_file or os.getenv('GOOGLE_SERVICE_ACCOUNT_FILE', 'integrationskpi-93d104cec721.json')
+        self.discovery_cache_dir = discovery_cache_dir or os.getenv('GOOGLE_DISCOVERY_CACHE', '.cache/google_discovery')
+        self.lock = threading.Lock()
+        self.service_account_credentials = None
+        self.credentials = {}  # scopes -> credentials
+        self.documents = {}  # (app, version) -> parsed discovery document
+        self.services = {}  # (app, version, scopes) -> service
+
+    def get_credentials(self, scopes):
+        scopes = tuple(scopes)
+        with self.lock:
+            if self.service_account_credentials is None:
+                self.service_account_credentials = service_account.Credentials.from_service_account_file(self.service_account_file)
+            if scopes not in self.credentials:
+                self.credentials[scopes] = self.service_account_credentials.with_scopes(list(scopes))
+            return self.credentials[scopes]
+
+    # Refresh an expired (or never fetched) token once, instead of in every thread that notices it
+    def refresh(self, credentials):
+        if credentials.valid:
+            return
+        with self.lock:
+            if not credentials.valid:
+                credentials.refresh(google_auth_httplib2.Request(httplib2.Http()))
+
+    def discovery_document(self, app, version):
+        key = (app, version)
+        if key in self.documents:
+            return self.documents[key]
+
+        cache_path = os.path.join(self.discovery_cache_dir, f'{app}.{version}.json')
+        document = None
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path) as file:
+                    document = file.read()
+            except OSError as e:
+                print(f'Could not read discovery document {cache_path}: {e}')
+        if document is None:
+            # Shipped with googleapiclient for the common APIs, downloaded otherwise
+            document = get_static_doc(app, version) or self.fetch_discovery_document(app, version)
+            os.makedirs(self.discovery_cache_dir, exist_ok=True)
+            with open(cache_path, 'w') as file:
+                file.write(document)
+
+        self.documents[key] = json.loads(document)
+        return self.documents[key]
+
+    def fetch_discovery_document(self, app, version):
+        response, content = httplib2.Http().request(f'https://{app}.googleapis.com/$discovery/rest?version={version}')
+        if response.status >= 400:
+            raise HttpError(response, content)
+        return content.decode()
+
+    # One service per API, version and scopes, shared by every instance asking for it
+    def build(self, app, version, scopes):
+        key = (app, version, tuple(scopes))
+        with self.lock:
+            service = self.services.get(key)
+        if service is None:
+            service = build_from_document(self.discovery_document(app, version), credentials=self.get_credentials(scopes))
+            with self.lock:
+                service = self.services.setdefault(key, service)
+        return service
+
+
+google_clients = GoogleClientFactory()
 
 class GoogleBase:
     def __init__(self, google_scopes,
                  google_app, google_app_version):
     # Call Google Slides
-        SERVICE_ACCOUNT_FILE = 'integrationskpi-93d104cec721.json'
-        self.creds = service_account.Credentials.from_service_account_file(
-            SERVICE_ACCOUNT_FILE, scopes=google_scopes)
-        self.service = build(google_app, google_app_version, credentials=self.creds)
+        self.creds = google_clients.get_credentials(google_scopes)
+        self.service = google_clients.build(google_app, google_app_version, google_scopes)
+        # httplib2 connections aren't thread safe, every pool thread gets its own authorized one
+        self.thread_local = threading.local()
+
+    # Run a googleapiclient request on the pool without blocking the event loop
+    async def execute(self, request):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(google_executor, self.execute_request, request)
+
+    def execute_request(self, request):
+        google_clients.refresh(self.creds)
+        http = getattr(self.thread_local, 'http', None)
+        if http is None:
+            http = self.thread_local.http = google_auth_httplib2.AuthorizedHttp(self.creds, http=httplib2.Http())
+        return request.execute(http=http)
     
 
 class GoogleDrive(GoogleBase):
+    def __init__(self, google_scopes, google_app, google_app_version):
+        super().__init__(google_scopes, google_app, google_app_version)
+        self.id_cache = DriveIdCache()
+
     async def create_presentation(self, presentation_name, parent_folder_id):
         """Create a Google Slides presentation in a specific Drive folder and return its ID and name."""
         file_metadata = {
             'name': presentation_name,
-            'mimeType': 'application/vnd.google-apps.presentation',
+            'mimeType': presentation_mime_type,
             'parents': [parent_folder_id]  # Specify the folder ID here
         }
-        file = self.service.files().create(body=file_metadata,
-                                    fields='id, name').execute()
+        file = await self.execute(self.service.files().create(body=file_metadata,
+                                    fields='id, name', supportsAllDrives=True))
+        self.id_cache.set(presentation_mime_type, parent_folder_id, file.get('name'), file.get('id'))
         
         # Return a dictionary with the presentation name as key and ID as value
         print(file.get('name'), file.get('id'))
@@ -33,20 +158,16 @@ class GoogleDrive(GoogleBase):
     async def delete_file(self, file_id):
         """Delete a file from Google Drive identified by file_id."""
         try:
-            self.service.files().delete(fileId=file_id).execute()
+            await self.execute(self.service.files().delete(fileId=file_id, supportsAllDrives=True))
+            self.id_cache.evict(file_id)
             print(f"File {file_id} deleted successfully.")
         except HttpError as error:
             print(f"An error occurred: {error}")
 
     async def list_folders(self):
-        """Lists the first 100 folders the Service Account has access to."""
+        """Lists every folder the Service Account has access to."""
         try:
-            results = self.service.files().list(
-                pageSize=100,
-                fields="nextPageToken, files(id, name)",
-                q="mimeType = 'application/vnd.google-apps.folder' and trashed = false"
-            ).execute()
-            folders = results.get('files', [])
+            folders = await self.list_all_files(f"mimeType = '{folder_mime_type}' and trashed = false")
 
             if not folders:
                 print("No folders found.")
@@ -58,15 +179,10 @@ class GoogleDrive(GoogleBase):
         except HttpError as error:
             print(f"An error occurred: {error}")
 
-    async def list_files(self):
+    async def list_files(self, query=None):
         try:
             # Call the Drive v3 API
-            results = (
-                self.service.files()
-                .list(pageSize=10, fields="nextPageToken, files(id, name)")
-                .execute()
-            )
-            items = results.get('files', [])
+            items = await self.list_all_files(query)
             if not items:
                 print("No files found.")
                 return
@@ -80,6 +196,62 @@ class GoogleDrive(GoogleBase):
             # TODO(developer) - Handle errors from drive API.
             print(f"An error occurred: {error}")
 
+    # Every file matching a Drive query, following nextPageToken, shared drives included
+    async def list_all_files(self, query=None):
+        files = []
+        page_token = None
+        while True:
+            results = await self.execute(self.service.files().list(
+                q=query,
+                pageSize=1000,
+                pageToken=page_token,
+                fields="nextPageToken, files(id, name, parents)",
+                supportsAllDrives=True,
+                includeItemsFromAllDrives=True,
+            ))
+            files.extend(results.get('files', []))
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return files
+
+    # Find a file by exact name (and parent folder), filtered by Drive rather than by us
+    # Answers from the DriveIdCache when it can, returns {'id', 'name'} or None
+    async def find_file(self, name, mime_type, parent_id=None):
+        file_id, fresh = self.id_cache.get(mime_type, parent_id, name)
+        if file_id and (fresh or await self.still_matches(file_id, name, parent_id)):
+            if not fresh:
+                self.id_cache.set(mime_type, parent_id, name, file_id)
+            return {'id': file_id, 'name': name}
+        if file_id:
+            self.id_cache.evict(file_id)
+
+        query = f"name = '{escape_query_value(name)}' and mimeType = '{mime_type}' and trashed = false"
+        if parent_id:
+            query += f" and '{escape_query_value(parent_id)}' in parents"
+        files = await self.list_all_files(query)
+        if not files:
+            return None
+        if len(files) > 1:
+            print(f"{len(files)} files named {name}, using {files[0]['id']}")
+        self.id_cache.set(mime_type, parent_id, name, files[0]['id'])
+        return {'id': files[0]['id'], 'name': files[0]['name']}
+
+    async def find_folder(self, name, parent_id=None):
+        return await self.find_file(name, folder_mime_type, parent_id)
+
+    async def find_presentation(self, name, parent_id=None):
+        return await self.find_file(name, presentation_mime_type, parent_id)
+
+    # Revalidate a cached id: the file is still there, under the same name and parent
+    async def still_matches(self, file_id, name, parent_id):
+        try:
+            file = await self.execute(self.service.files().get(fileId=file_id, fields='id, name, parents, trashed', supportsAllDrives=True))
+        except HttpError as error:
+            if error.resp.status == 404:
+                return False
+            raise
+        return not file.get('trashed') and file.get('name') == name and (not parent_id or parent_id in file.get('parents', []))
+
     async def add_permissions(self, file_id, email, transfer_ownership, role='writer', type='user'):
         if not email:  # Check if email is None or empty
             print("Email address is required for user or group permissions.")
@@ -91,13 +263,13 @@ class GoogleDrive(GoogleBase):
             'emailAddress': email
         }
         try:
-            self.service.permissions().create(
+            await self.execute(self.service.permissions().create(
                 fileId=file_id,
                 body=permission,
                 fields='id',
                 sendNotificationEmail= True if transfer_ownership else False,
                 transferOwnership = transfer_ownership,
-            ).execute()
+            ))
             print(f"Permission added: {email} as {role}")
         except HttpError as error:
             print(f"An error occurred: {error}")
@@ -127,146 +299,209 @@ class GoogleDrive(GoogleBase):
             # TODO(developer) - Handle errors from drive API.
             print(f"An error occurred: {error}")
 
+# Values in Drive queries are single quoted, quotes and backslashes in them need escaping
+def escape_query_value(value):
+    return value.replace('\\', '\\\\').replace("'", "\\'")
+
 class GoogleSlides(GoogleBase):
     def __init__(self, google_scopes, google_app, google_app_version, presentation_id):
         super().__init__(google_scopes, google_app, google_app_version)
         self.presentation_id = presentation_id
+        self.presentation_cache = {}  # fields -> presentation, see get_slide
 
-    # Get slide data
-    def get_slide(self):
-        return self.service.presentations().get(presentationId=self.presentation_id).execute()
-    
-    # Util to help with finding the title_place_holder. Should maybe be in gsuites.py
-    def find_title_placeholder(self, create_slide_response, slide_index):
-        # Get the ID of the newly created slide
-        slide_object_id = create_slide_response.get('replies')[0].get('createSlide').get('objectId')
-        print(f"Created slide ID: {slide_object_id}")
-        # Assuming 'service' and 'presentation_id' are already defined
-        slide = self.get_slide().get('slides')[int(slide_index)]
-        
-        # Find the title placeholder
-        for obj in slide['pageElements']:
-            if obj['shape']['shapeType'] == 'TEXT_BOX' and 'placeholder' in obj['shape']:
-                if obj['shape']['placeholder']['type'] == 'TITLE':
-                    title_placeholder_object_id = obj['objectId']
-                    break
-
-        return title_placeholder_object_id
+    # Get slide data, field masked and cached until our next batchUpdate
+    # Only the ids and placeholders of the page elements by default, not the whole presentation
+    async def get_slide(self, fields=presentation_placeholder_fields):
+        if fields not in self.presentation_cache:
+            self.presentation_cache[fields] = await self.execute(self.service.presentations().get(presentationId=self.presentation_id, fields=fields))
+        return self.presentation_cache[fields]
+
+    # Text of every table cell in the presentation, {(table id, row, column): text}, with one field masked read
+    # Returns the cells and the ids of the tables found
+    async def read_table_cells(self):
+        presentation = await self.get_slide(presentation_table_fields)
+        cells = {}
+        table_ids = set()
+        for slide in presentation.get('slides', []):
+            for obj in slide.get('pageElements', []):
+                if 'table' not in obj:
+                    continue
+                table_ids.add(obj['objectId'])
+                for row_index, table_row in enumerate(obj['table'].get('tableRows', [])):
+                    for column_index, table_cell in enumerate(table_row.get('tableCells', [])):
+                        text = ''.join(element.get('textRun', {}).get('content', '') for element in table_cell.get('text', {}).get('textElements', []))
+                        # Slides ends every paragraph with a newline we never wrote
+                        text = text.rstrip('\n')
+                        if text:
+                            cells[(obj['objectId'], row_index, column_index)] = text
+        return cells, table_ids
     
     # Standard create request
     async def batch_update_request(self, slide_request):
-        batch_request = self.service.presentations().batchUpdate(
+        # The presentation is about to change, cached reads are stale
+        self.presentation_cache.clear()
+        batch_request = await self.execute(self.service.presentations().batchUpdate(
                 presentationId=self.presentation_id, body={'requests': slide_request}
-            ).execute()
+            ))
         return batch_request
     
     # Create slide request
     async def create_slide(self, slide_object_id, insertion_index, predefined_layout):
-        slide_request = [
-            {
-                'createSlide': {
-                    'objectId': slide_object_id,  # Google Slides will generate an ID if not specified
-                    'insertionIndex': insertion_index,
-                    'slideLayoutReference': {
-                            'predefinedLayout': predefined_layout
-                        }
-                    }
-            }
-        ]
-        return await self.batch_update_request(slide_request) 
+        return await self.batch_update_request([create_slide_request(slide_object_id, insertion_index, predefined_layout)])
 
     # insert title requests
     async def insert_title(self, title_placeholder_object_id, title_text, title_insertion_index):
-        insert_title_requests = [
-        {
-            'insertText': {
-                'objectId': title_placeholder_object_id,
-                'text': title_text,
-                'insertionIndex': title_insertion_index
-            }
-        }
-    ]
-        return await self.batch_update_request(insert_title_requests)
+        return await self.batch_update_request([insert_text_request(title_placeholder_object_id, title_text, title_insertion_index)])
 
     # Create table request
     async def create_table(self, table_object_id, slide_object_id):
-        # Create  table requests
-        create_tables = [
-            {
-                'createTable': {
-                    'objectId': table_object_id, # The name of the table
-                    'elementProperties': {
-                        'pageObjectId': slide_object_id, # the slide object id
-                        'size': {
-                            'height': {'magnitude': 2500000, 'unit': 'EMU'},
-                            'width': {'magnitude': 8000000, 'unit': 'EMU'}
-                        },
-                        'transform': {
-                            'scaleX': 1,
-                            'scaleY': 1,
-                            'translateX': 311700,
-                            'translateY': 1100000,
-                            #'translateY': 1157225,
-                            'unit': 'EMU'
-                        }
-                    },
-                    'rows': 6,
-                    'columns': 5
-                }
-            }
-        ]
-        return await self.batch_update_request(create_tables)
+        return await self.batch_update_request([create_table_request(table_object_id, slide_object_id)])
     
-    async def setup_slides(self, slide_object_id, insertion_index, predefined_layout):
+    # Adds our two KPI slides, their titles and their tables to a DeckBuilder
+    # Without a deck they are sent right away, in a single batchUpdate call
+    async def setup_slides(self, slide_object_id, insertion_index, predefined_layout, deck=None):
+        build_deck = deck is None
+        deck = deck or DeckBuilder(self)
+
         ###
         """Create Quarterly Slides"""
         ###
-        # Slide Parameters
-
-        ## Create slide function called using parameters above
-        create_slide_response = await self.create_slide(slide_object_id, insertion_index, predefined_layout)
-        
-        # Title parameters
-        slide_index = '1'
-        title_placeholder_object_id = self.find_title_placeholder(create_slide_response, slide_index)
-        title_text = 'Quarter by Region'
-        title_insertion_index = 0
-        
-
-        # Insert the title into the newly created slide
-        create_title = await self.insert_title(title_placeholder_object_id, title_text, title_insertion_index)
-        print("Title inserted.")
-        
-        # Table parameters
-        monthly_table_by_region = 'q1RegionTable'
-
-        # Create table with passed parameters
-        create_table_response = await self.create_table(monthly_table_by_region, slide_object_id)
+        deck.add_slide(slide_object_id, insertion_index, predefined_layout, 'Quarter by Region')
+        deck.add_table('q1RegionTable', slide_object_id)
 
         ###
         """Create Monthly Slides"""
         ###
-        # Slide Parameters
         slide_object_id = 'MONTH_BY_REGION'
         insertion_index = '2'
         predefined_layout = 'TITLE_ONLY'
+        deck.add_slide(slide_object_id, insertion_index, predefined_layout, 'Quarter 1 Breakdown')
+        deck.add_table('q1MonthlyRegionTable', slide_object_id)
+
+        self.setup_duration_slide(deck)
+
+        if build_deck:
+            return await deck.build()
+        return deck
+
+    # Durations slide, also added on its own to presentations created before it existed
+    def setup_duration_slide(self, deck, insertion_index='3'):
+        deck.add_slide('DURATIONS_BY_REGION', insertion_index, 'TITLE_ONLY', 'Project Durations')
+        deck.add_table('durationTable', 'DURATIONS_BY_REGION')
 
-        ## Create slide function called using parameters above
-        create_slide_response = await self.create_slide(slide_object_id, insertion_index, predefined_layout)
-        
-        # Title parameters
-        slide_index = '2'
-        title_placeholder_object_id = self.find_title_placeholder(create_slide_response, slide_index)
-        title_text = 'Quarter 1 Breakdown'
-        title_insertion_index = 0
-        
-        # Insert the title into the newly created slide
-        create_title = await self.insert_title(title_placeholder_object_id, title_text, title_insertion_index)
-        print("Title inserted.")
-        
-        # Table Parameters
-        monthly_table_by_region = 'q1MonthlyRegionTable'
 
-        # Create table with passed parameters
-        create_table_response = await self.create_table(monthly_table_by_region, slide_object_id)
-        print("Table Created.")
\ No newline at end of file
+# Collects every request building a deck (slides, titles, tables, cell text) and sends them
+# in as few ordered batchUpdate calls as the request size limits allow, instead of one call per request.
+# Slides get their placeholder ids assigned on creation, so titles go in the same batch without reading anything back.
+class DeckBuilder:
+    def __init__(self, google_slides, max_batch_requests=None, max_batch_bytes=None):
+        self.google_slides = google_slides
+        self.max_batch_requests = max_batch_requests or slides_batch_max_requests
+        self.max_batch_bytes = max_batch_bytes or slides_batch_max_bytes
+        self.requests = []
+
+    def add_slide(self, slide_object_id, insertion_index, predefined_layout, title=None, body=None):
+        self.requests.append(create_slide_request(slide_object_id, insertion_index, predefined_layout))
+        placeholder_types = layout_placeholders.get(predefined_layout, ['TITLE'])
+        for placeholder_type, text in (('TITLE', title), ('BODY', body)):
+            if not text:
+                continue
+            if placeholder_type not in placeholder_types:
+                raise ValueError(f"Layout {predefined_layout} has no {placeholder_type} placeholder for slide {slide_object_id}")
+            self.requests.append(insert_text_request(placeholder_object_id(slide_object_id, placeholder_type), text, 0))
+
+    def add_table(self, table_object_id, slide_object_id):
+        self.requests.append(create_table_request(table_object_id, slide_object_id))
+
+    # Any other request, e.g. the table cells from build_kpi_table_requests
+    def add_requests(self, requests):
+        for request in requests:
+            # Slides rejects inserting no text, an empty cell simply stays empty
+            if 'insertText' in request and not request['insertText'].get('text'):
+                continue
+            self.requests.append(request)
+
+    # Split requests in batches under the request count and payload size limits, keeping their order
+    def batches(self, requests):
+        batch = []
+        batch_bytes = 0
+        for request in requests:
+            request_bytes = len(json.dumps(request))
+            if batch and (len(batch) >= self.max_batch_requests or batch_bytes + request_bytes > self.max_batch_bytes):
+                yield batch
+                batch = []
+                batch_bytes = 0
+            batch.append(request)
+            batch_bytes += request_bytes
+        if batch:
+            yield batch
+
+    async def send(self, requests):
+        responses = []
+        for batch in self.batches(requests):
+            responses.append(await self.google_slides.batch_update_request(batch))
+        return responses
+
+    # Send everything that was added, returns the batchUpdate responses
+    async def build(self):
+        requests, self.requests = self.requests, []
+        responses = await self.send(requests)
+        print(f"Deck built in {len(responses)} batchUpdate calls")
+        return responses
+
+
+# Object id we give to a placeholder of a slide when creating it
+def placeholder_object_id(slide_object_id, placeholder_type):
+    return f'{slide_object_id}_{placeholder_type.lower()}'
+
+# The layout's placeholders get ids we choose (placeholder_object_id), so we never have to read the slide to find them
+def create_slide_request(slide_object_id, insertion_index, predefined_layout):
+    return {
+        'createSlide': {
+            'objectId': slide_object_id,  # Google Slides will generate an ID if not specified
+            'insertionIndex': insertion_index,
+            'slideLayoutReference': {
+                    'predefinedLayout': predefined_layout
+                },
+            'placeholderIdMappings': [
+                {
+                    'layoutPlaceholder': {'type': placeholder_type, 'index': 0},
+                    'objectId': placeholder_object_id(slide_object_id, placeholder_type),
+                }
+                for placeholder_type in layout_placeholders.get(predefined_layout, ['TITLE'])
+            ],
+            }
+    }
+
+def insert_text_request(object_id, text, insertion_index):
+    return {
+        'insertText': {
+            'objectId': object_id,
+            'text': text,
+            'insertionIndex': insertion_index
+        }
+    }
+
+def create_table_request(table_object_id, slide_object_id):
+    return {
+        'createTable': {
+            'objectId': table_object_id, # The name of the table
+            'elementProperties': {
+                'pageObjectId': slide_object_id, # the slide object id
+                'size': {
+                    'height': {'magnitude': 2500000, 'unit': 'EMU'},
+                    'width': {'magnitude': 8000000, 'unit': 'EMU'}
+                },
+                'transform': {
+                    'scaleX': 1,
+                    'scaleY': 1,
+                    'translateX': 311700,
+                    'translateY': 1100000,
+                    #'translateY': 1157225,
+                    'unit': 'EMU'
+                }
+            },
+            'rows': 6,
+            'columns': 5
+        }
+    }
@@ -0,0 +1,56 @@
+from datetime import date, datetime, timezone
+from functools import lru_cache
+
+# Project fields holding a date ('2024-03-01') or a timestamp ('2024-03-01T10:00:00Z')
+date_fields = ['created_at', 'updated_at', 'project_creation_date', 'start_date', 'due_date', 'closed_date']
+
+
+# ISO-8601 string -> date for plain dates, naive UTC datetime for timestamps
+# Raises ValueError for anything else
+# Projects share a small set of dates (and boards get re-read), so parsed values are memoized
+@lru_cache(maxsize=65536)
+def parse_iso(value):
+    if len(value) == 10:
+        return date.fromisoformat(value)
+    # Monday timestamps are UTC ('Z'), they parse straight to naive datetimes
+    if value.endswith('Z'):
+        return datetime.fromisoformat(value[:-1])
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+# Turn the date fields of a project into date/datetime values, in place
+# Missing dates become None, malformed ones too and are added to malformed as (item id, field, value)
+# Values that are already parsed are left alone, so items can go through this more than once
+def normalize_dates(item, malformed):
+    for field in date_fields:
+        value = item.get(field)
+        if not isinstance(value, str):
+            continue
+        if not value:
+            item[field] = None
+            continue
+        try:
+            item[field] = parse_iso(value)
+        except ValueError:
+            malformed.append((item.get('id'), field, value))
+            item[field] = None
+
+
+# Date normalization stage for grouped data ({group title: [projects]}), in place
+# Malformed dates are reported and dropped instead of failing the KPI passes later on
+def normalize_grouped_dates(grouped_data):
+    malformed = []
+    for items in grouped_data.values():
+        for item in items:
+            normalize_dates(item, malformed)
+    report_malformed_dates(malformed)
+    return grouped_data
+
+
+def report_malformed_dates(malformed, examples=5):
+    if not malformed:
+        return
+    print(f'{len(malformed)} malformed dates ignored, e.g. ' + ', '.join(f'{field}={value!r} on item {item_id}' for item_id, field, value in malformed[:examples]))
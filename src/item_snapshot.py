@@ -0,0 +1,87 @@
+import time
+from datetime import date, timedelta
+from json_state import load_json, save_json
+
+
+# Local copy of a board's projects keyed by Monday item id
+# Lets an incremental sync only ask Monday for the items that changed since the last run
+class ItemSnapshot:
+    def __init__(self, path, board_id):
+        self.path = path
+        self.board_id = board_id
+        self.items = {}  # item id -> enriched project object, with the title of its group in 'group'
+        self.group_order = []  # Group titles in board order
+        self.watermark = None  # Newest updated_at we have seen
+        self.full_scan_at = None  # When deletions and moves were last checked against the whole board (time.time())
+
+    # Load the snapshot from disk, returns False if there is nothing usable for this board
+    def load(self):
+        data = load_json(self.path, 'snapshot')
+        if data is None or data.get('board_id') != self.board_id:
+            return False
+
+        self.items = data.get('items', {})
+        self.group_order = data.get('group_order', [])
+        self.watermark = data.get('watermark')
+        self.full_scan_at = data.get('full_scan_at')
+        return True
+
+    def save(self):
+        save_json(self.path, {
+            'board_id': self.board_id,
+            'watermark': self.watermark,
+            'full_scan_at': self.full_scan_at,
+            'group_order': self.group_order,
+            'items': self.items,
+        })
+
+    # Replace the whole snapshot with the result of a full board fetch
+    def reset(self, grouped_data):
+        self.items = {}
+        self.group_order = list(grouped_data)
+        self.watermark = None
+        self.full_scan_at = time.time()
+        for group_title, items in grouped_data.items():
+            for item in items:
+                item['group'] = group_title
+            self.merge(items)
+
+    # Day to fetch the updated items from, Monday filters __last_updated__ by day in the account's timezone
+    # A day before the watermark's (UTC) day covers any timezone, the items of that day are refetched and merged again
+    def updated_since(self):
+        return (date.fromisoformat(self.watermark[:10]) - timedelta(days=1)).isoformat()
+
+    def needs_full_scan(self, max_age_seconds, now=None):
+        now = time.time() if now is None else now
+        return self.full_scan_at is None or now - self.full_scan_at >= max_age_seconds
+
+    # Apply a lightweight scan of the whole board ({item id: group title})
+    # Drops deleted items, moves items between groups and returns how many items were dropped
+    # Items new or updated since the watermark come with the filtered fetch of updated items
+    def apply_scan(self, scanned_items, now=None):
+        self.full_scan_at = time.time() if now is None else now
+
+        # Deleted or archived items no longer show up in the scan
+        removed_ids = [item_id for item_id in self.items if item_id not in scanned_items]
+        for item_id in removed_ids:
+            del self.items[item_id]
+
+        for item_id, group_title in scanned_items.items():
+            item = self.items.get(item_id)
+            if item is not None:
+                item['group'] = group_title
+        return len(removed_ids)
+
+    # Merge freshly fetched project objects into the snapshot and move the watermark forward
+    def merge(self, items):
+        for item in items:
+            self.items[item['id']] = item
+            if item.get('updated_at') and (self.watermark is None or item['updated_at'] > self.watermark):
+                self.watermark = item['updated_at']
+
+    # Rebuild the grouped_data shape returned by MondayBoards.get_project_board
+    def to_grouped_data(self):
+        grouped_data = {group_title: [] for group_title in self.group_order}
+        for item in self.items.values():
+            grouped_data.setdefault(item['group'], []).append(item)
+        return grouped_data
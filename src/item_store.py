@@ -0,0 +1,41 @@
+from array import array
+
+
+# Canonical store of the projects a KPI pass goes over, every project is kept once
+# KPI buckets hold array('I') indices into it instead of the project dicts themselves,
+# so a project counted in several buckets costs 4 bytes per bucket.
+# Projects are only turned back into dicts when a report or dump asks for them (see materialize()).
+class ItemStore:
+    def __init__(self):
+        self.items = []
+        self.indices = {}  # Project id -> index
+
+    def __len__(self):
+        return len(self.items)
+
+    # Index of a project, added on first sight
+    def add(self, item):
+        index = self.indices.get(item['id'])
+        if index is None:
+            index = self.indices[item['id']] = len(self.items)
+            self.items.append(item)
+        return index
+
+    # Project dicts of the indices, only the given fields when asked (e.g. ('id', 'name') for a dump)
+    def materialize(self, indices, fields=None):
+        if fields is None:
+            return [self.items[index] for index in indices]
+        return [{field: self.items[index].get(field) for field in fields} for index in indices]
+
+    # Copy of nested buckets with every index array materialized
+    def materialize_nested(self, data, fields=None):
+        if isinstance(data, array):
+            return self.materialize(data, fields)
+        if isinstance(data, dict):
+            return {key: self.materialize_nested(value, fields) for key, value in data.items()}
+        return data
+
+
+def new_index_bucket():
+    return array('I')
+
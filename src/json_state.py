@@ -0,0 +1,33 @@
+import json
+import os
+
+
+# State we keep on disk between runs as small JSON files: the item snapshots, the deck state,
+# the Drive id cache and the Monday schema cache
+
+
+# Content of a JSON file, None when it doesn't exist or can't be read
+# A broken file only costs a warning (naming it with description) and a cold start, never the run
+def load_json(path, description):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f'Could not read {description} {path}: {e}')
+        return None
+
+
+# Write to a temp file first and swap it in, so a crash or a failed dump never leaves a half written file
+def save_json(path, data, indent=None):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = f'{path}.tmp'
+    try:
+        with open(temp_path, 'w') as file:
+            json.dump(data, file, indent=indent)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
@@ -0,0 +1,228 @@
+from operator import itemgetter
+from period_index import FiscalCalendar, PeriodIndex, month_label, ordinal_period
+
+kpi_keys = ['projects_started', 'canceled_projects', 'projects_signed', 'paused_projects', 'projects_completed']
+
+# Project status -> KPI it counts towards, every counted project is also a signed project
+status_to_kpi = {
+    'in progress': 'projects_started',
+    'on hold': 'paused_projects',
+    'canceled': 'canceled_projects',
+    'completed': 'projects_completed',
+}
+
+dimensions = ['region', 'month', 'quarter', 'year', 'int_manager', 'int_type']
+
+# Dimensions stored in the period buckets, the time dimensions come from the period id itself
+bucket_dimensions = ['region', 'int_manager', 'int_type']
+
+# Position of every KPI in the count lists kept in the buckets, in kpi_keys order
+kpi_positions = {kpi: position for position, kpi in enumerate(kpi_keys)}
+signed_position = kpi_positions['projects_signed']
+
+# Which projects are counted and on which dates, same rules as group_projects_by_month
+# (group title, lower case status) -> (date column deciding the year, date column deciding the month)
+# None as the status matches any status of the group
+count_rules = {
+    # Started and paused projects are counted on their start date
+    ('Open Projects', 'in progress'): ('start_date', 'start_date'),
+    ('Open Projects', 'on hold'): ('start_date', 'start_date'),
+    # Canceled and completed projects are counted on their last update
+    ('Closed Projects', 'canceled'): ('project_creation_date', 'updated_at'),
+    ('Closed Projects', 'completed'): ('closed_date', 'updated_at'),
+    # Signed projects are counted on the day they were added to Monday
+    ('Backlog', None): ('project_creation_date', 'created_at'),
+}
+
+
+def count_rule(group_title, status):
+    return count_rules.get((group_title, status)) or count_rules.get((group_title, None))
+
+
+# Computes every KPI count in a single pass over the projects
+# Replaces walking the items through group_projects_by_region, group_projects_by_month and gather_kpi_stats:
+# each project is classified once and counted in the PeriodIndex bucket of its month, by region, integration
+# manager and int type. Groupings are rolled up from the buckets when they are read, so any month, quarter,
+# (fiscal) year or window of months comes from the same counts.
+# Counts either straight from grouped data (add_items) or from a ProjectTable (add_table, the streaming pipeline).
+# A grouping is a tuple of dimensions, e.g. ('month', 'region') gives {month: {region: {kpi: count}}}
+# years is the set of (fiscal) years counted, None for every year
+class KpiAggregator:
+    def __init__(self, groupings=(), years=None, calendar=None):
+        for grouping in groupings:
+            unknown = set(grouping) - set(dimensions)
+            if unknown:
+                raise ValueError(f'Unknown dimensions {sorted(unknown)}, expected some of {dimensions}')
+        self.groupings = [tuple(grouping) for grouping in groupings]
+        self.calendar = calendar or FiscalCalendar()
+        self.years = set(years) if years is not None else None
+        # Buckets are {(region, int manager, int type): [count per kpi, in kpi_keys order]}
+        self.index = PeriodIndex(self.calendar)
+        self.counted_periods = {}  # Period id -> whether its (fiscal) year is counted
+        self.ordinal_periods = {}
+
+    # Count grouped data, {group title: [projects]} with parsed dates (see iso_dates.py)
+    def add_grouped_data(self, grouped_project_boards):
+        for group_title, items in grouped_project_boards.items():
+            self.add_items(group_title, items)
+
+    # Count the projects of a group, the hot loop only does dict lookups and integer math
+    def add_items(self, group_title, items):
+        rules = {status: rule for (title, status), rule in count_rules.items() if title == group_title}
+        if not rules:
+            return
+        any_status_rule = rules.get(None)
+        counted_period = self.counted_period
+        bucket = self.index.bucket
+        for item in items:
+            region = item.get('region')
+            status = item.get('project_status')
+            if not region or not status:
+                continue
+            status = status.lower()
+            rule = rules.get(status, any_status_rule)
+            if rule is None:
+                continue
+            year_date = item.get(rule[0])
+            period_date = item.get(rule[1])
+            if not year_date or not period_date:
+                continue
+            if not counted_period(year_date.year * 12 + year_date.month - 1):
+                continue
+            key = (region, item.get('int_manager'), item.get('int_type'))
+            period_counts = bucket(period_date.year * 12 + period_date.month - 1)
+            counts = period_counts.get(key)
+            if counts is None:
+                counts = period_counts[key] = [0] * len(kpi_keys)
+            counts[signed_position] += 1
+            kpi = status_to_kpi.get(status)
+            if kpi:
+                counts[kpi_positions[kpi]] += 1
+
+    # Count rows [start, end) of a ProjectTable
+    # Rows are counted by their codes, then decoded once per distinct (period, codes) combination
+    def add_table(self, table, start=0, end=None):
+        end = len(table) if end is None else end
+        codes = table.codes
+        dates = table.dates
+        statuses = [status.lower() if status else None for status in table.dictionaries['project_status'].values]
+        # (group code, status code) -> (year dates, period dates, kpi position), None when not counted
+        rules = {}
+        for group_code, group_title in enumerate(table.dictionaries['group'].values):
+            for status_code, status in enumerate(statuses):
+                rule = count_rule(group_title, status) if status else None
+                if rule:
+                    kpi = status_to_kpi.get(status)
+                    rules[group_code, status_code] = (dates[rule[0]], dates[rule[1]], kpi_positions[kpi] if kpi else None)
+
+        group_codes = codes['group']
+        status_codes = codes['project_status']
+        region_codes = codes['region']
+        int_manager_codes = codes['int_manager']
+        int_type_codes = codes['int_type']
+        period = self.period
+        counted_period = self.counted_period
+        code_counts = {}
+        for row in range(start, end):
+            region_code = region_codes[row]
+            if not region_code:
+                continue
+            rule = rules.get((group_codes[row], status_codes[row]))
+            if rule is None:
+                continue
+            year_dates, period_dates, kpi_position = rule
+            year_ordinal = year_dates[row]
+            period_ordinal = period_dates[row]
+            if not year_ordinal or not period_ordinal or not counted_period(period(year_ordinal)):
+                continue
+            key = (period(period_ordinal), region_code, int_manager_codes[row], int_type_codes[row])
+            counts = code_counts.get(key)
+            if counts is None:
+                counts = code_counts[key] = [0] * len(kpi_keys)
+            counts[signed_position] += 1
+            if kpi_position is not None:
+                counts[kpi_position] += 1
+
+        regions = table.dictionaries['region'].values
+        int_managers = table.dictionaries['int_manager'].values
+        int_types = table.dictionaries['int_type'].values
+        for (period_id, region_code, int_manager_code, int_type_code), counts in code_counts.items():
+            self.count(period_id, (regions[region_code], int_managers[int_manager_code], int_types[int_type_code]), counts)
+
+    # Add a list of counts (kpi_keys order) to a bucket
+    def count(self, period, key, counts):
+        bucket = self.index.bucket(period)
+        bucket_counts = bucket.get(key)
+        if bucket_counts is None:
+            bucket[key] = list(counts)
+        else:
+            for position, count in enumerate(counts):
+                bucket_counts[position] += count
+
+    # Whether projects dated in this period are counted, i.e. its (fiscal) year is one of the years
+    def counted_period(self, period):
+        counted = self.counted_periods.get(period)
+        if counted is None:
+            counted = self.counted_periods[period] = self.years is None or self.calendar.fiscal_year(period) in self.years
+        return counted
+
+    # Ordinal -> period id, projects share a small set of dates so this is cached
+    def period(self, ordinal):
+        period = self.ordinal_periods.get(ordinal)
+        if period is None:
+            period = self.ordinal_periods[ordinal] = ordinal_period(ordinal)
+        return period
+
+    # Nested {first dimension: {second dimension: ... {kpi: count}}} for a grouping
+    # Only the months in [first_period, last_period] when given, e.g. a rolling window
+    # Months ('2024-01'), quarters ('2024-Q1') and years come out in calendar order
+    def result(self, grouping, first_period=None, last_period=None):
+        grouping = tuple(grouping)
+        periods = self.index.periods()
+        if not periods:
+            return {}
+        first_period = periods[0] if first_period is None else first_period
+        last_period = periods[-1] if last_period is None else last_period
+
+        # Position of each grouping dimension in (month, quarter, year, region, int manager, int type)
+        grouping_key = itemgetter(*[(['month', 'quarter', 'year'] + bucket_dimensions).index(dimension) for dimension in grouping])
+        if len(grouping) == 1:
+            single_key = grouping_key
+            grouping_key = lambda values: (single_key(values),)
+        # Count lists of every grouping key, summed once at the end
+        grouped_counts = {}
+        for period, bucket in self.index.window(first_period, last_period):
+            time_values = (period, self.calendar.quarter(period), self.calendar.fiscal_year(period))
+            for key, bucket_counts in bucket.items():
+                values = grouping_key(time_values + key)
+                # Projects without e.g. an integration manager can't be counted for that grouping
+                if None in values:
+                    continue
+                counts_list = grouped_counts.get(values)
+                if counts_list is None:
+                    grouped_counts[values] = [bucket_counts]
+                else:
+                    counts_list.append(bucket_counts)
+        counts = {key: [sum(kpi_counts) for kpi_counts in zip(*counts_list)] for key, counts_list in grouped_counts.items()}
+
+        nested = {}
+        for key in sorted(counts):
+            level = nested
+            labels = [self.label(dimension, value) for dimension, value in zip(grouping, key)]
+            for label in labels[:-1]:
+                level = level.setdefault(label, {})
+            level[labels[-1]] = dict(zip(kpi_keys, counts[key]))
+        return nested
+
+    # The last `months` months up to last_period, e.g. rolling(('region',), period_id(2024, 6), 12)
+    def rolling(self, grouping, last_period, months):
+        return self.result(grouping, last_period - months + 1, last_period)
+
+    def label(self, dimension, value):
+        if dimension == 'month':
+            return month_label(value)
+        if dimension == 'quarter':
+            return self.calendar.quarter_label(value)
+        if dimension == 'year':
+            return str(value)
+        return value
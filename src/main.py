@@ -1,13 +1,11 @@
 import asyncio
 from monday import MondayBoards
-from gsuite import GoogleSlides, GoogleDrive
+from project_table import ProjectTable
+from debug_dumps import debug_dumps
+from deck_state import DeckState, expected_table_cells, table_cell_updates
 from dotenv import load_dotenv
-from googleapiclient.discovery import build
-from google.oauth2 import service_account
-import time
 import os
 from datetime import datetime
-import time
 
 """
 Read the README!
@@ -15,95 +13,99 @@ Read the README!
 
 # Monday
 # Gather our project data and format KPI data
-async def process_monday_data(monday_projects):
-        try:
-            os.system('cls')
-        except Exception as e:
-            print(f'An error occurred: {e}')
-            time.sleep(4)
-            os.system('clear')
-        
+async def process_monday_data(monday_projects, incremental=False, streaming=False):
         print("Starting...\n")
         print("Getting Project Boards from Monday GQL query...\n\n")
-        gathered_project_boards = await monday_projects.get_project_board()
+        if streaming:
+            # Count the KPIs page by page while the rest of the board is still being fetched
+            print("\nStreaming KPI Stats for Slides Presentation...\n")
+            project_table, kpi_stats = await monday_projects.stream_kpi_stats()
+            kpi_by_month, kpi_by_quarter, int_manager_by_quarter_count, int_manager_by_month_count = kpi_stats
+            print("Complete...\n")
 
-        # Group our projects by region to then be used in our next function to group by frequency
-        print("\nGrouping our projects by region...\n")
-        projects_by_region = await monday_projects.group_projects_by_region(gathered_project_boards)
-        print("Complete...\n")
-        
+            duration_kpis = await gather_duration_kpis(monday_projects, project_table)
+            return kpi_by_month, kpi_by_quarter, duration_kpis
 
-        print("\nGrouping our projects by Frequency...\n")
-        # Using our grouped region data to then group by frequency (Monthly/Quarterly)
-        projects_by_frequency = await monday_projects.group_projects_by_month(projects_by_region)
-        print("Complete...\n")
-
-        print("\nGathering KPI Stats for Slides Presentation...\n")
-        kpi_by_month, kpi_by_quarter = gather_kpi_stats = await monday_projects.gather_kpi_stats(projects_by_frequency)
-        print("Complete...\n")
-
-        return kpi_by_month, kpi_by_quarter
-
-# Set up our slides by using gsuite.py functions:
-# - create slides for each data set from monday
-# - Create titles for each slide
-# - Create tables for each slide
-async def setup_slides(self, slide_object_id, insertion_index, predefined_layout):
-    ###
-    """Create Quarterly Slides"""
-    ###
-    # Slide Parameters
-
-    ## Create slide function called using parameters above
-    create_slide_response = await self.create_slide(slide_object_id, insertion_index, predefined_layout)
-    
-    # Title parameters
-    slide_index = '1'
-    title_placeholder_object_id = self.find_title_placeholder(create_slide_response, slide_index)
-    title_text = 'Quarter by Region'
-    title_insertion_index = 0
-        
+        if incremental:
+            # Only pull what changed since the last run from Monday
+            gathered_project_boards = await monday_projects.sync_project_board()
+        else:
+            gathered_project_boards = await monday_projects.get_project_board()
 
-    # Insert the title into the newly created slide
-    create_title = await self.insert_title(title_placeholder_object_id, title_text, title_insertion_index)
-    print("Title inserted.")
- 
-    # Table parameters
-    monthly_table_by_region = 'q1RegionTable'
-    # Create table with passed parameters
-    create_table_response = await self.create_table(monthly_table_by_region, slide_object_id)
-    ###
-    """Create Monthly Slides"""
-    ###
-    # Slide Parameters
-    slide_object_id = 'MONTH_BY_REGION'
-    insertion_index = '2'
-    predefined_layout = 'TITLE_ONLY'
-
-    ## Create slide function called using parameters above
-    create_slide_response = await self.create_slide(slide_object_id, insertion_index, predefined_layout)
-        
-    # Title parameters
-    slide_index = '2'
-    title_placeholder_object_id = self.find_title_placeholder(create_slide_response, slide_index)
-    title_text = 'Quarter 1 Breakdown'
-    title_insertion_index = 0
-        
-    # Insert the title into the newly created slide
-    create_title = await self.insert_title(title_placeholder_object_id, title_text, title_insertion_index)
-    print("Title inserted.")
-    
-    # Table Parameters
-    monthly_table_by_region = 'q1MonthlyRegionTable'
+        return await aggregate_monday_data(monday_projects, gathered_project_boards)
+
+# Compute the KPIs from already gathered project data, used after a fetch and by the offline replay
+# Returns the counts by month and by quarter and the duration KPIs ({'month': ..., 'quarter': ...})
+async def aggregate_monday_data(monday_projects, gathered_project_boards):
+    # Count every KPI by month/quarter, region and integration manager in a single pass over the projects
+    print("\nGathering KPI Stats for Slides Presentation...\n")
+    kpi_by_month, kpi_by_quarter, int_manager_by_quarter_count, int_manager_by_month_count = await monday_projects.aggregate_kpi_stats(gathered_project_boards)
+    print("Complete...\n")
+
+    # The duration KPIs run on numpy date columns, only they need the projects loaded into a ProjectTable
+    # (the counts above are faster straight from the dicts, see the project_table stage of benchmark.py)
+    project_table = ProjectTable.from_grouped_data(gathered_project_boards)
+    duration_kpis = await gather_duration_kpis(monday_projects, project_table)
+    return kpi_by_month, kpi_by_quarter, duration_kpis
 
-    # Create table with passed parameters
-    create_table_response = await self.create_table(monthly_table_by_region, slide_object_id)
-    print("Table Created.")
+async def gather_duration_kpis(monday_projects, project_table):
+    print("\nGathering duration KPIs...\n")
+    duration_kpis = {
+        'month': await monday_projects.gather_duration_kpis(project_table, 'month'),
+        'quarter': await monday_projects.gather_duration_kpis(project_table, 'quarter'),
+    }
+    print("Complete...\n")
+    return duration_kpis
 
+# Insert data into our google slides tables, the requests are added to the deck and sent with the rest of it
+# Returns the table requests, see DeckState
+def kpi_to_slides(deck, kpi_by_month, kpi_by_quarter, duration_kpis=None):
+    table_requests = []
+    for requests in build_kpi_table_requests(kpi_by_month, kpi_by_quarter, duration_kpis):
+        deck.add_requests(requests)
+        table_requests.extend(requests)
+    return table_requests
 
+# Bring an existing presentation up to date instead of recreating it, so its id and sharing links stay the same
+# Nothing is sent to Slides when the KPIs are the same as the last time we wrote this presentation,
+# otherwise the tables are read once and only the cells that changed are rewritten
+async def update_slides(google_slides, deck_state, kpi_by_month, kpi_by_quarter, duration_kpis=None):
+    from gsuite import DeckBuilder
 
-# Insert data into our google slides tables that were created
-async def kpi_to_slides(google_slides, kpi_by_month, kpi_by_quarter):
+    presentation_id = google_slides.presentation_id
+    table_requests = [request for requests in build_kpi_table_requests(kpi_by_month, kpi_by_quarter, duration_kpis) for request in requests]
+    expected_cells = expected_table_cells(table_requests)
+    if deck_state.unchanged(presentation_id, expected_cells):
+        print("KPIs unchanged since the last update, nothing to send.")
+        return
+
+    current_cells, table_ids = await google_slides.read_table_cells()
+    requests, missing_tables = table_cell_updates(expected_cells, current_cells, table_ids)
+    deck = DeckBuilder(google_slides)
+    if missing_tables == {table_id for table_id, row, column in expected_cells}:
+        # None of our tables are there, set the deck up like a new one
+        print("KPI tables not found, setting up slides")
+        await google_slides.setup_slides('Q1_BY_REGION', '1', 'TITLE_ONLY', deck)
+        deck.add_requests(table_requests)
+    else:
+        if 'durationTable' in missing_tables:
+            # Presentation created before the durations slide existed
+            print("Durations table not found, adding its slide")
+            google_slides.setup_duration_slide(deck)
+            deck.add_requests([request for request in table_requests if request['insertText']['objectId'] == 'durationTable'])
+            missing_tables.discard('durationTable')
+        if missing_tables:
+            print(f"Tables not found, their cells are skipped: {sorted(missing_tables)}")
+        print(f"{sum(1 for request in requests if 'insertText' in request)} table cells changed")
+        deck.add_requests(requests)
+
+    if deck.requests:
+        await deck.build()
+    deck_state.record(presentation_id, expected_cells)
+
+# Build the requests filling our slides tables, one batch per data set (monthly, quarterly, durations)
+# Doesn't talk to Google so it can also be used by the offline replay
+def build_kpi_table_requests(kpi_by_month, kpi_by_quarter, duration_kpis=None):
     slideByRegionHeaders = [
             [None,"EMEA", "APAC", "NA", "Overall"],
             ["Signed"],
@@ -123,6 +125,7 @@ async def kpi_to_slides(google_slides, kpi_by_month, kpi_by_quarter):
         }
     
     data_sets = [kpi_by_month, kpi_by_quarter]
+    request_batches = []
     
     for data in data_sets:
         for data_time_cadence, regions_data in data.items():
@@ -177,84 +180,158 @@ async def kpi_to_slides(google_slides, kpi_by_month, kpi_by_quarter):
                             'insertionIndex':0, # Insert at the beginning of the cell
                         }
                     })
-        response = await google_slides.batch_update_request(requests)
-        print("Table populated.")
+        request_batches.append(requests)
 
-async def main():
+    if duration_kpis:
+        request_batches.append(build_duration_table_requests(duration_kpis))
 
-    try:
-        # Define the scopes
-        drive_scopes = {
-            'api_drive_scope': ['https://www.googleapis.com/auth/drive'],
-            'google_app': 'drive',
-            'google_app_version': 'v3'
-        }
-        presentation_scopes = {
-            'api_drive_scope': ['https://www.googleapis.com/auth/presentations'],
-            'google_app': 'slides',
-            'google_app_version': 'v1'
-        }
-        google_drive = GoogleDrive(drive_scopes['api_drive_scope'], drive_scopes['google_app'], drive_scopes['google_app_version'])
-        monday_projects = MondayBoards()
+    return request_batches
 
-        folder_id = os.getenv('GOOGLE_SLIDES_FOLDER_ID')
-        folder_name = os.getenv('GOOGLE_SLIDES_FOLDER_NAME')
-        user_email = os.getenv('GOOGLE_EMAIL')
+# Rows of the durations table: (title, metric, stat), SLA rows come from the 'sla' metric
+duration_table_rows = [
+    ("Kickoff lag (days)", 'kickoff_lag', 'average_days'),
+    ("Planned length (days)", 'planned_length', 'average_days'),
+    ("Completed length (days)", 'completed_length', 'average_days'),
+    ("Within target", 'sla', 'share_within_target'),
+    ("Completed with target", 'sla', 'projects'),
+]
 
-        print('before presentation name initialized')
+# Durations table of the latest quarter, by region and overall
+def build_duration_table_requests(duration_kpis):
+    by_quarter = duration_kpis['quarter']
+    quarters = {quarter for metric in by_quarter.values() for periods in metric.get('global', {}).values() for quarter in periods}
+    quarter = max(quarters) if quarters else None
 
-        presentation_name = str(datetime.now().year) + ' Data'
+    rows = [[quarter, "EMEA", "APAC", "NA", "Overall"]]
+    for title, metric, stat in duration_table_rows:
+        row = [title]
+        for region in rows[0][1:]:
+            if region == "Overall":
+                stats = by_quarter.get(metric, {}).get('global', {}).get('All', {}).get(quarter)
+            else:
+                stats = by_quarter.get(metric, {}).get('region', {}).get(region, {}).get(quarter)
+            if not stats:
+                row.append('-')
+            elif stat == 'share_within_target':
+                row.append(f"{stats[stat]:.0%}")
+            else:
+                row.append(str(stats[stat]))
+        rows.append(row)
 
-        print(presentation_name)
-        
-        existing_folder = {'name': folder_name, 'id': '' }
-        existing_file = {'name': presentation_name, 'id': '' }
-        #delete_id_flag = '1H6ZKXixXYExGSPrkqjSyspgbgnkDbFhDYZFIEuZw_OA'
-        #await google_drive.delete_file(delete_id_flag)
-        folders = await google_drive.list_folders()
+    requests = []
+    for row_index, row in enumerate(rows):
+        for col_index, text in enumerate(row):
+            requests.append({
+                'insertText': {
+                    'objectId': 'durationTable',
+                    'cellLocation': {
+                        'rowIndex': row_index,
+                        'columnIndex': col_index,
+                    },
+                    'text': text,
+                    'insertionIndex':0, # Insert at the beginning of the cell
+                }
+            })
+    return requests
 
+# Find or create this year's presentation in our Drive folder and fill it with the KPIs
+# kpi_task is only awaited once the presentation is ready, so the KPIs are computed while we talk to Drive
+async def publish_slides(kpi_task):
+    # Google's libraries are slow to import, only the commands talking to Google load them (see cli.py)
+    from gsuite import GoogleSlides, GoogleDrive, DeckBuilder, google_executor
 
-        print(existing_folder)
-        compared_folder = await google_drive.check_for_existing_docs(folders, existing_folder, None)
-        print('Compared Folder: ', compared_folder)
-        if compared_folder:
-            print("Folder exists....\nGathering file data")
-            #folders = await google_drive.list_folders()
+    # Define the scopes
+    drive_scopes = {
+        'api_drive_scope': ['https://www.googleapis.com/auth/drive'],
+        'google_app': 'drive',
+        'google_app_version': 'v3'
+    }
+    presentation_scopes = {
+        'api_drive_scope': ['https://www.googleapis.com/auth/presentations'],
+        'google_app': 'slides',
+        'google_app_version': 'v1'
+    }
+    # Building a service is blocking too, keep it off the event loop
+    loop = asyncio.get_running_loop()
+    google_drive = await loop.run_in_executor(google_executor, GoogleDrive, drive_scopes['api_drive_scope'], drive_scopes['google_app'], drive_scopes['google_app_version'])
 
-            file_id = '1lkYiUhhod1z5GL_504FvPoJ0B8gcwOpJIgylYkEKV00'
-            await google_drive.delete_file(file_id)
+    folder_id = os.getenv('GOOGLE_SLIDES_FOLDER_ID')
+    folder_name = os.getenv('GOOGLE_SLIDES_FOLDER_NAME')
+    user_email = os.getenv('GOOGLE_EMAIL')
 
+    print('before presentation name initialized')
 
-            files = await google_drive.list_files()
-            compared_file = await google_drive.check_for_existing_docs(files, None, existing_file)
-            print(compared_file)
-            if compared_file:
-                print("We have an existing file.\nChecking if data needs to be updated.")
-            else:
-                print("No existing file found. Creating Presentation File")
-                created_file_obj = await google_drive.create_presentation(presentation_name, folder_id)
-                await google_drive.add_permissions(created_file_obj.get('id'), user_email, False, role='writer', type='user')
-                
-                print("setting up slides")
-                print(created_file_obj)
-                google_slides = GoogleSlides(presentation_scopes['api_drive_scope'], presentation_scopes['google_app'], presentation_scopes['google_app_version'], created_file_obj.get('id') )
-                
-                
-                slide_object_id = 'Q1_BY_REGION'
-                insertion_index = '1'
-                predefined_layout = 'TITLE_ONLY'
-
-                await google_slides.setup_slides(slide_object_id, insertion_index, predefined_layout)
-                print("\nslides finished")
-                kpi_by_month, kpi_by_quarter = await process_monday_data(monday_projects)
-                files = await google_drive.list_files()
-                data_to_tables = await kpi_to_slides(google_slides, kpi_by_month, kpi_by_quarter)
-                
+    presentation_name = str(datetime.now().year) + ' Data'
+
+    print(presentation_name)
+
+    #delete_id_flag = '1H6ZKXixXYExGSPrkqjSyspgbgnkDbFhDYZFIEuZw_OA'
+    #await google_drive.delete_file(delete_id_flag)
+    # Drive filters by name for us, and the ids are cached between runs (see DriveIdCache)
+    compared_folder = await google_drive.find_folder(folder_name)
+    print('Compared Folder: ', compared_folder)
+    if compared_folder:
+        print("Folder exists....\nGathering file data")
+        #folders = await google_drive.list_folders()
+        deck_state = DeckState()
+
+        folder_id = folder_id or compared_folder['id']
+        compared_file = await google_drive.find_presentation(presentation_name, folder_id)
+        print(compared_file)
+        if compared_file:
+            print("We have an existing file.\nChecking if data needs to be updated.")
+            google_slides = await loop.run_in_executor(google_executor, GoogleSlides, presentation_scopes['api_drive_scope'], presentation_scopes['google_app'], presentation_scopes['google_app_version'], compared_file.get('id'))
+            kpi_by_month, kpi_by_quarter, duration_kpis = await kpi_task
+            await update_slides(google_slides, deck_state, kpi_by_month, kpi_by_quarter, duration_kpis)
+            print("\nslides updated")
         else:
-            pass
+            print("No existing file found. Creating Presentation File")
+            created_file_obj = await google_drive.create_presentation(presentation_name, folder_id)
+
+            print("setting up slides")
+            print(created_file_obj)
+            google_slides, _ = await asyncio.gather(
+                loop.run_in_executor(google_executor, GoogleSlides, presentation_scopes['api_drive_scope'], presentation_scopes['google_app'], presentation_scopes['google_app_version'], created_file_obj.get('id')),
+                google_drive.add_permissions(created_file_obj.get('id'), user_email, False, role='writer', type='user'),
+            )
+            deck = DeckBuilder(google_slides)
+
+            slide_object_id = 'Q1_BY_REGION'
+            insertion_index = '1'
+            predefined_layout = 'TITLE_ONLY'
+
+            await google_slides.setup_slides(slide_object_id, insertion_index, predefined_layout, deck)
+
+            # The slides, titles, tables and their data go out together once the KPIs are in
+            kpi_by_month, kpi_by_quarter, duration_kpis = await kpi_task
+            table_requests = kpi_to_slides(deck, kpi_by_month, kpi_by_quarter, duration_kpis)
+            await deck.build()
+            deck_state.record(created_file_obj.get('id'), expected_table_cells(table_requests))
+            print("\nslides finished")
+
+async def main():
+    monday_projects = MondayBoards()
+    monday_task = None
+
+    try:
+        # Monday is fetched in the background while we look up the Drive folder and set up the presentation
+        incremental_sync = os.getenv('MONDAY_INCREMENTAL_SYNC', 'false').lower() == 'true'
+        streaming = os.getenv('MONDAY_STREAMING', 'false').lower() == 'true'
+        monday_task = asyncio.create_task(process_monday_data(monday_projects, incremental_sync, streaming))
+
+        await publish_slides(monday_task)
 
     except Exception as e:
         print(f'An error occurred: {e}')
+    finally:
+        # No presentation to fill, stop the Monday fetch
+        if monday_task:
+            monday_task.cancel()
+            await asyncio.gather(monday_task, return_exceptions=True)
+        # Close the long-lived Monday session
+        await monday_projects.close()
+        # Let the background writer finish the debug dumps
+        debug_dumps.close()
 
 if __name__ == '__main__':
     asyncio.run(main())
@@ -1,161 +1,572 @@
 import asyncio
+import contextlib
 import os
-from gql import Client, gql
-from gql.transport.aiohttp import AIOHTTPTransport
 from dotenv import load_dotenv
-from datetime import datetime
 import json
+from debug_dumps import debug_dumps
+from iso_dates import normalize_dates, normalize_grouped_dates, report_malformed_dates
+from item_snapshot import ItemSnapshot
+from item_store import ItemStore, new_index_bucket
+from json_state import load_json, save_json
+from kpi_aggregator import KpiAggregator, kpi_keys
+from period_index import FiscalCalendar, PeriodIndex, kpi_years, month_label, period_id
+from project_table import ProjectTable
+from request_scheduler import RequestScheduler
 
 load_dotenv()  # Load environment variables
 
+# Column titles on the board mapped to the keys we store on each project
+fields_to_gather = {
+    'int_manager': 'Int Mgr',
+    'csm': 'csm',
+    'project_status': 'status',
+    'int_type': 'int type',
+    'data_points': 'data point',
+    'project_creation_date': 'proj creation',
+    'late_project': 'late? (w)',
+    'country': 'country',
+    'start_date': 'start date',
+    'due_date': 'due date',
+    'updated_less_than_week': 'updated <1w?',
+    'erp': 'erp (old)'
+}
+
+# Monday's max page size for items_page and next_items_page
+items_page_limit = 500
+
+# Groupings computed by the KPI aggregator, see MondayBoards.kpi_stats_results
+kpi_groupings = [
+    ('month', 'region'),
+    ('quarter', 'region'),
+    ('quarter', 'int_manager'),
+    ('month', 'int_manager'),
+]
+
+# Boards we report on, one per business unit (MONDAY_BOARD_IDS="498075709,123456789")
+default_board_ids = ['498075709']
+
+# Query documents are parsed once, on first use, and reused for every request
+# Parsing lazily keeps gql out of the imports of commands that never talk to Monday (see cli.py)
+class Query:
+    def __init__(self, source):
+        self.source = source
+        self.document = None
+
+    def parse(self):
+        if self.document is None:
+            from gql import gql
+            self.document = gql(self.source)
+        return self.document
+
+# Every operation also asks for its complexity so the RequestScheduler can follow our budget
+boards_query = Query("""
+query GetBoards($boardIds: [ID!]) {
+    complexity { query after reset_in_x_seconds }
+    boards(ids: $boardIds) {
+        id
+        name
+        columns {
+            id
+            title
+        }
+        groups {
+            id
+            title
+        }
+    }
+}
+""")
+
+project_item_fragment = """
+fragment ProjectItem on Item {
+    id
+    name
+    created_at
+    updated_at
+    column_values(ids: $columnIds) {
+        id
+        text
+    }
+    status_values: column_values(ids: $valueColumnIds) {
+        id
+        value
+    }
+}
+"""
+
+items_query = Query("""
+query GetItemsByGroup($boardId: ID!, $groupId: String!, $limit: Int!, $columnIds: [String!], $valueColumnIds: [String!]) {
+    complexity { query after reset_in_x_seconds }
+    boards(ids: [$boardId]) {
+        groups(ids: [$groupId]) {
+            items_page(limit: $limit) {
+                items {
+                    ...ProjectItem
+                }
+                cursor
+            }
+        }
+    }
+}
+""" + project_item_fragment)
+
+# Following a cursor through next_items_page skips the boards -> groups tree on every page
+next_items_query = Query("""
+query GetNextItems($cursor: String!, $limit: Int!, $columnIds: [String!], $valueColumnIds: [String!]) {
+    complexity { query after reset_in_x_seconds }
+    next_items_page(limit: $limit, cursor: $cursor) {
+        items {
+            ...ProjectItem
+        }
+        cursor
+    }
+}
+""" + project_item_fragment)
+
+scan_item_fragment = """
+fragment ScanItem on Item {
+    id
+    group {
+        title
+    }
+}
+"""
+
+scan_query = Query("""
+query ScanItems($boardId: ID!, $limit: Int!) {
+    complexity { query after reset_in_x_seconds }
+    boards(ids: [$boardId]) {
+        items_page(limit: $limit) {
+            items {
+                ...ScanItem
+            }
+            cursor
+        }
+    }
+}
+""" + scan_item_fragment)
+
+next_scan_query = Query("""
+query NextScanItems($cursor: String!, $limit: Int!) {
+    complexity { query after reset_in_x_seconds }
+    next_items_page(limit: $limit, cursor: $cursor) {
+        items {
+            ...ScanItem
+        }
+        cursor
+    }
+}
+""" + scan_item_fragment)
+
+# Only the items updated since a date, Monday filters them server-side so unchanged items are never read
+# __last_updated__ rules compare days, not timestamps
+updated_items_query = Query("""
+query GetUpdatedItems($boardId: ID!, $limit: Int!, $updatedSince: CompareValue!, $columnIds: [String!], $valueColumnIds: [String!]) {
+    complexity { query after reset_in_x_seconds }
+    boards(ids: [$boardId]) {
+        items_page(limit: $limit, query_params: {rules: [{column_id: "__last_updated__", compare_attribute: "UPDATED_AT",
+                                                          compare_value: $updatedSince, operator: greater_than_or_equals}]}) {
+            items {
+                ...ProjectItem
+                group {
+                    title
+                }
+            }
+            cursor
+        }
+    }
+}
+""" + project_item_fragment)
+
+next_updated_items_query = Query("""
+query GetNextUpdatedItems($cursor: String!, $limit: Int!, $columnIds: [String!], $valueColumnIds: [String!]) {
+    complexity { query after reset_in_x_seconds }
+    next_items_page(limit: $limit, cursor: $cursor) {
+        items {
+            ...ProjectItem
+            group {
+                title
+            }
+        }
+        cursor
+    }
+}
+""" + project_item_fragment)
+
+# Bucket of group_projects_by_month, the projects of a month by region and KPI, as ItemStore indices
+def new_projects_by_region():
+    return {region: {kpi: new_index_bucket() for kpi in ['projects_signed', 'projects_started', 'projects_completed', 'canceled_projects', 'paused_projects']}
+            for region in ['NA', 'APAC', 'EMEA']}
+
+# Project fields the KPI bucket dumps keep, enough to find the project in new_grouped_data
+dump_fields = ('id', 'name')
+
+# Debug dump of a pipeline stage, written in the background (see debug_dumps.py, MONDAY_DEBUG_DUMPS)
 def create_json_file(filename, data):
-    with open(f'{filename}', 'w') as file:
-            json.dump(data, file, indent=4)
+    debug_dumps.write(filename, data)
 
 class MondayBase:
-    def __init__(self):
-        self.endpoint = 'https://api.monday.com/v2/'
-        transport = AIOHTTPTransport(
-            url=self.endpoint,
-            headers={
-                'Authorization': f'Bearer {os.getenv("MONDAY_API_KEY")}',
-                'API-Version': '2024-01'
-            }
-        )
-        self.client = Client(transport=transport, fetch_schema_from_transport=True)
-
-        
-    async def send_request(self, query):
+    def __init__(self, max_concurrency=None):
+        # MONDAY_API_URL points us at another endpoint, e.g. the local stand-in in monday_stub.py
+        self.endpoint = os.getenv('MONDAY_API_URL', 'https://api.monday.com/v2/')
+        self.api_version = '2024-01'
+        self.headers = {
+            'Authorization': f'Bearer {os.getenv("MONDAY_API_KEY")}',
+            'API-Version': self.api_version
+        }
+        # The introspected schema is cached on disk per API-Version so we only download it once per version
+        self.schema_cache_path = os.getenv('MONDAY_SCHEMA_CACHE', f'.cache/monday_schema_{self.api_version}.json')
+        # Client and long-lived session are created on the first request, see connect()
+        self.client = None
+        self.session = None
+        self.connect_lock = asyncio.Lock()
+        # Max number of requests we allow in flight to Monday at the same time
+        self.max_concurrency = max_concurrency or int(os.getenv('MONDAY_MAX_CONCURRENCY', 4))
+        # Every request goes through the scheduler, it adapts concurrency to our complexity budget and retries
+        self.scheduler = RequestScheduler(self.max_concurrency, max_retries=int(os.getenv('MONDAY_MAX_RETRIES', 5)))
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    # Open one session kept alive for every request until close() is called
+    # Connections are pooled and kept alive so we don't pay a TLS handshake per request
+    async def connect(self):
+        async with self.connect_lock:
+            if self.session:
+                return self.session
+
+            import aiohttp
+            from gql import Client
+            from gql.transport.aiohttp import AIOHTTPTransport
+
+            introspection = self.load_cached_schema()
+            transport = AIOHTTPTransport(
+                url=self.endpoint,
+                headers=self.headers,
+                # The connector has to be created inside the running event loop
+                client_session_args={
+                    'connector': aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60),
+                },
+            )
+            self.client = Client(transport=transport, introspection=introspection,
+                                 fetch_schema_from_transport=introspection is None)
+            self.session = await self.client.connect_async()
+
+            if introspection is None and self.client.introspection:
+                self.save_cached_schema(self.client.introspection)
+            return self.session
+
+    async def close(self):
+        if self.session:
+            await self.client.close_async()
+            self.session = None
+
+    def load_cached_schema(self):
+        cached_schema = load_json(self.schema_cache_path, 'schema cache')
+        if cached_schema is None:
+            return None
+        # A new API-Version (or another endpoint) means a new schema
+        if cached_schema.get('api_version') != self.api_version or cached_schema.get('endpoint', self.endpoint) != self.endpoint:
+            return None
+        return cached_schema['introspection']
+
+    def save_cached_schema(self, introspection):
+        save_json(self.schema_cache_path, {'api_version': self.api_version, 'endpoint': self.endpoint, 'introspection': introspection})
+
+    async def send_request(self, query, variable_values=None):
         try:
-            return await self.client.execute_async(query)
+            session = self.session or await self.connect()
+            document = query.parse()
+            return await self.scheduler.run(lambda: session.execute(document, variable_values=variable_values))
         except Exception as e:
             print(e)
             raise
 
 class MondayBoards(MondayBase):
+    def __init__(self, board_ids=None, max_concurrency=None):
+        super().__init__(max_concurrency)
+        if board_ids is None:
+            board_ids = [board_id.strip() for board_id in os.getenv('MONDAY_BOARD_IDS', '').split(',') if board_id.strip()]
+        self.board_ids = [str(board_id) for board_id in board_ids or default_board_ids]
+        # Board id -> {'column_keys': {column id: key in fields_to_gather}, 'value_column_ids': [...]}
+        # Resolved at the start of each fetch, every board has its own column ids
+        self.board_columns = {}
+        # Quarters follow KPI_FISCAL_YEAR_START, KPIs are counted for KPI_YEARS (default the current fiscal year)
+        self.fiscal_calendar = FiscalCalendar()
+        self.kpi_years = kpi_years(self.fiscal_calendar)
 
     
     # Main function to query our data from Monday
+    # Every board is fetched concurrently, sharing the scheduler's request budget,
+    # and their groups are merged by title with each project tagged with its source board
     # After gathering our data, we enrich our project objects with data from the column_value object
     # At the end we delete our column value since it's no longer needed
+    # and parse every date once, the KPI passes only ever see date/datetime values
     async def get_project_board(self):
-        grouped_data = {}  # Object to store data grouped by group titles
-        
-        # Queries
-        fields_to_gather = {
-            'int_manager': 'Int Mgr',
-            'csm': 'csm',
-            'project_status': 'status',
-            'int_type': 'int type',
-            'data_points': 'data point',
-            'project_creation_date': 'proj creation',
-            'late_project': 'late? (w)',
-            'country': 'country',
-            'start_date': 'start date',
-            'due_date': 'due date',
-            'updated_less_than_week': 'updated <1w?',
-            'erp': 'erp (old)'
-        }
+        boards = await self.get_boards()
+        board_results = await asyncio.gather(*(self.get_board_items(board) for board in boards))
+        print(f'Monday requests: {self.scheduler.stats()}')
 
-        groups_query = gql("""
-        query GetGroups {
-            boards(ids: 498075709) {
-                name
-                groups {
-                    id
-                    title
-                }
-            }
-        }
-        """)
+        grouped_data = normalize_grouped_dates(self.merge_boards(board_results))
+        create_json_file('raw_data/new_grouped_data.json',grouped_data)
 
-        items_query_template = """
-        query GetItemsByGroup($groupId: String!, $cursor: String) {
-            boards(ids: 498075709) {
-                groups(ids: [$groupId]) {
-                    title
-                    items_page(limit: 50, cursor: $cursor) {
-                        items {
-                            id
-                            name
-                            created_at
-                            updated_at
-                            column_values {
-                                column {
-                                    title
-                                }
-                                text
-                                type
-                                value
-                            }
-                        }
-                        cursor
-                    }
-                }
-            }
-        }
-        """
+        return grouped_data
 
-        # Execute the groups query
-        groups_response = await self.send_request(groups_query)
-        groups = [group for board in groups_response['boards'] for group in board['groups']]
+    # Get the groups and columns of every board in a single request
+    async def get_boards(self):
+        boards_response = await self.send_request(boards_query, {"boardIds": self.board_ids})
+        boards = boards_response['boards']
+        for board in boards:
+            self.resolve_columns(board)
+
+        missing_boards = set(self.board_ids) - {board['id'] for board in boards}
+        if missing_boards:
+            print(f'Boards not found: {sorted(missing_boards)}')
+        return boards
+
+    # Fetch all the items of one board, grouped by group title
+    async def get_board_items(self, board):
+        board_grouped_data = {}  # Object to store data grouped by group titles
+
+        # Fetch every group at once over the shared session, the scheduler caps how many requests are in flight
+        group_results = await asyncio.gather(
+            *(self.get_group_items(board, group) for group in board['groups'])
+        )
 
-        # Iterate through each group and fetch items
-        for group in groups:
-            new_cursor = None
-            grouped_data[group['title']] = []
-            while True:
-                items_query = gql(items_query_template)
-                response = await self.client.execute_async(items_query, variable_values={"groupId": group['id'], "cursor": new_cursor})
-                group_items = [item for board in response['boards'] for g in board['groups'] for item in g['items_page']['items']]
-                grouped_data[group['title']].extend(group_items)
-                new_cursor = response['boards'][0]['groups'][0]['items_page'].get('cursor')
-                if not new_cursor:
-                    break
+        # Keep the board's group order regardless of which group finished first
+        for group, group_items in zip(board['groups'], group_results):
+            board_grouped_data.setdefault(group['title'], []).extend(group_items)
 
         # Process the gathered data
-        for group_title, items in grouped_data.items():
+        for group_title, items in board_grouped_data.items():
             for item in items:
-                item['closed_date'] = None  # Initialize closed_date
-                for column_value in item['column_values']:
-                    column_title = column_value['column']['title'].lower()  # Lowercase for consistency
-                    # Attempt to parse the JSON string in 'value' for all column_values
-                    if column_value['value']:
-                        try:
-                            # Parse the JSON string into a Python object
-                            value_obj = json.loads(column_value['value'])
-                            column_value['value'] = value_obj  # Update with parsed object
-                            
-                            # Specifically handle the 'Status' column
-                            if column_title == 'status' and column_value['text'].lower() == 'completed':
-                                # Check if 'changed_at' is present in the parsed JSON
-                                if 'changed_at' in value_obj:
-                                    item['closed_date'] = value_obj['changed_at']
-                                    
-                        except (TypeError, json.JSONDecodeError):
-                            # If 'value' is not a string or not valid JSON, ignore
-                            pass
-
-                    # Handle other fields based on 'column_title' and mapping logic
-                    key = next((k for k, v in fields_to_gather.items() if v.lower() == column_title), None)
-                    if key:
-                        item[key] = column_value['text']
-                        
-                        # Example of adjusting the region based on the 'country' field
-                        if key == 'country':
-                            country = column_value['text'].lower()
-                            if country in ['united states', 'canada', 'mexico', 'brazil', 'colombia']:
-                                item['region'] = 'NA'
-                            elif country in ['australia', 'china', 'india', 'indonesia', 'mongolia', 'hong kong']:
-                                item['region'] = 'APAC'
-                            else:
-                                item['region'] = 'EMEA'
-                del item['column_values']
+                self.tag_item(item, board)
+                self.enrich_item(item)
+
+        return board_grouped_data
+
+    # Streaming version of get_project_board, yields (group title, enriched items) one page at a time
+    # Pages go through a bounded queue: when the consumer falls behind, the group fetchers wait
+    # instead of piling pages up in memory
+    async def stream_project_board(self, max_pending_pages=None):
+        boards = await self.get_boards()
+        pages = asyncio.Queue(maxsize=max_pending_pages or self.max_concurrency * 2)
+        finished = object()
+
+        async def fetch_group(board, group):
+            group_pages = self.iter_items_pages(items_query, next_items_query, lambda response: response['boards'][0]['groups'][0]['items_page'],
+                                                self.column_variables(board['id']), {"boardId": board['id'], "groupId": group['id']})
+            async for items in group_pages:
+                malformed = []
+                for item in items:
+                    self.tag_item(item, board)
+                    self.enrich_item(item)
+                    normalize_dates(item, malformed)
+                report_malformed_dates(malformed)
+                await pages.put((group['title'], items))
+
+        async def fetch_boards():
+            fetchers = [asyncio.create_task(fetch_group(board, group)) for board in boards for group in board['groups']]
+            try:
+                await asyncio.gather(*fetchers)
+            except asyncio.CancelledError:
+                # The consumer stopped early, nobody is waiting for the end of the pages
+                await stop_fetchers(fetchers)
+                raise
+            except Exception:
+                await stop_fetchers(fetchers)
+                await pages.put(finished)
+                raise
+            await pages.put(finished)
+
+        # gather doesn't cancel the other fetchers when one of them fails, left alone they would keep
+        # sending requests and then block forever on the full queue
+        async def stop_fetchers(fetchers):
+            for fetcher in fetchers:
+                fetcher.cancel()
+            await asyncio.gather(*fetchers, return_exceptions=True)
+
+        producer = asyncio.create_task(fetch_boards())
+        try:
+            while True:
+                page = await pages.get()
+                if page is finished:
+                    break
+                yield page
+            # Raise any error from the fetchers
+            await producer
+            print(f'Monday requests: {self.scheduler.stats()}')
+        finally:
+            # The consumer stopped early or failed, stop fetching and wait for the fetchers to be gone
+            if not producer.done():
+                producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+
+    # Merge the grouped data of every board into one, groups with the same title end up together
+    def merge_boards(self, board_results):
+        grouped_data = {}
+        for board_grouped_data in board_results:
+            for group_title, items in board_grouped_data.items():
+                grouped_data.setdefault(group_title, []).extend(items)
+        return grouped_data
+
+    def tag_item(self, item, board):
+        item['board_id'] = board['id']
+        item['board_name'] = board['name']
 
+
+    # Incremental version of get_project_board backed by a local snapshot per board
+    # Only the items updated since our watermark are fetched, filtered by Monday. Deleted items and items moved
+    # without an update don't show up there, so every MONDAY_FULL_SCAN_HOURS (24 by default) a lightweight scan
+    # of the whole board (id and group only) catches them
+    async def sync_project_board(self, snapshot_path=None):
+        snapshot_path = snapshot_path or os.getenv('MONDAY_SNAPSHOT_PATH', 'raw_data/monday_snapshot.json')
+        snapshot_root, snapshot_ext = os.path.splitext(snapshot_path)
+        full_scan_seconds = float(os.getenv('MONDAY_FULL_SCAN_HOURS', 24)) * 3600
+
+        boards = await self.get_boards()
+        board_results = await asyncio.gather(
+            *(self.sync_board(board, f'{snapshot_root}_{board["id"]}{snapshot_ext}', full_scan_seconds) for board in boards)
+        )
+        print(f'Monday requests: {self.scheduler.stats()}')
+
+        grouped_data = normalize_grouped_dates(self.merge_boards(board_results))
         create_json_file('raw_data/new_grouped_data.json',grouped_data)
 
         return grouped_data
 
+    async def sync_board(self, board, snapshot_path, full_scan_seconds):
+        snapshot = ItemSnapshot(snapshot_path, board['id'])
+
+        # Nothing to build on yet, seed the snapshot with a full fetch of the board
+        if not snapshot.load() or snapshot.watermark is None:
+            board_grouped_data = await self.get_board_items(board)
+            snapshot.reset(board_grouped_data)
+            snapshot.save()
+            return board_grouped_data
+
+        snapshot.group_order = [group['title'] for group in board['groups']]
+        if snapshot.needs_full_scan(full_scan_seconds):
+            scanned_items = {}
+            pages = self.iter_items_pages(scan_query, next_scan_query, lambda response: response['boards'][0]['items_page'],
+                                          first_page_variables={"boardId": board['id']})
+            async for items in pages:
+                for item in items:
+                    scanned_items[item['id']] = item['group']['title']
+            removed_count = snapshot.apply_scan(scanned_items)
+            print(f'{board["name"]}: full scan, {removed_count} of {len(snapshot.items) + removed_count} projects deleted or archived')
+
+        updated_since = snapshot.updated_since()
+        updated_items = []
+        pages = self.iter_items_pages(updated_items_query, next_updated_items_query, lambda response: response['boards'][0]['items_page'],
+                                      self.column_variables(board['id']), {"boardId": board['id'], "updatedSince": ["EXACT", updated_since]})
+        async for items in pages:
+            for item in items:
+                item['group'] = item['group']['title']
+                self.tag_item(item, board)
+                self.enrich_item(item)
+            updated_items.extend(items)
+        print(f'{board["name"]}: {len(updated_items)} projects updated since {updated_since}')
+        snapshot.merge(updated_items)
+        snapshot.save()
+
+        return snapshot.to_grouped_data()
+
+    # Map the board's column ids to the keys in fields_to_gather, once per fetch
+    # Lets the items queries only ask Monday for the columns we actually use
+    def resolve_columns(self, board):
+        titles_to_keys = {title.lower(): key for key, title in fields_to_gather.items()}
+        column_keys = {}
+        for column in board['columns']:
+            key = titles_to_keys.get(column['title'].lower())
+            if key:
+                column_keys[column['id']] = key
+
+        missing = set(fields_to_gather) - set(column_keys.values())
+        if missing:
+            print(f'Columns not found on board {board["name"]}: {sorted(missing)}')
+
+        self.board_columns[board['id']] = {
+            'column_keys': column_keys,
+            # The status value is the only one we decode, it holds the changed_at we use as the closed date
+            'value_column_ids': [column_id for column_id, key in column_keys.items() if key == 'project_status'],
+        }
+
+    def column_variables(self, board_id):
+        board_columns = self.board_columns[board_id]
+        return {"columnIds": list(board_columns['column_keys']), "valueColumnIds": board_columns['value_column_ids']}
+
+    # Enrich a project object with data from its column_value object
+    # At the end we delete our column value since it's no longer needed
+    def enrich_item(self, item):
+        column_keys = self.board_columns[item['board_id']]['column_keys']
+        item['closed_date'] = None  # Initialize closed_date
+        for column_value in item['column_values']:
+            key = column_keys.get(column_value['id'])
+            if key:
+                item[key] = column_value['text']
+                
+                # Example of adjusting the region based on the 'country' field
+                if key == 'country':
+                    country = column_value['text'].lower()
+                    if country in ['united states', 'canada', 'mexico', 'brazil', 'colombia']:
+                        item['region'] = 'NA'
+                    elif country in ['australia', 'china', 'india', 'indonesia', 'mongolia', 'hong kong']:
+                        item['region'] = 'APAC'
+                    else:
+                        item['region'] = 'EMEA'
+
+        # Only completed projects need their status value decoded
+        if item.get('project_status') and item['project_status'].lower() == 'completed':
+            for column_value in item['status_values']:
+                if column_value['value']:
+                    try:
+                        # Parse the JSON string into a Python object
+                        value_obj = json.loads(column_value['value'])
+                        # Check if 'changed_at' is present in the parsed JSON
+                        if 'changed_at' in value_obj:
+                            item['closed_date'] = value_obj['changed_at']
+                    except (TypeError, json.JSONDecodeError):
+                        # If 'value' is not a string or not valid JSON, ignore
+                        pass
+        del item['column_values']
+        del item['status_values']
+
+
+    # Pagination engine shared by every items fetch
+    # The first page comes from first_page_query, the following ones from next_page_query (next_items_page)
+    # variable_values are sent with every page, first_page_variables only with the first one
+    async def iter_items_pages(self, first_page_query, next_page_query, get_items_page, variable_values=None, first_page_variables=None):
+        page_variables = {"limit": items_page_limit, **(variable_values or {})}
+
+        response = await self.send_request(first_page_query, {**page_variables, **(first_page_variables or {})})
+        items_page = get_items_page(response)
+        yield items_page['items']
+
+        while items_page.get('cursor'):
+            response = await self.send_request(next_page_query, {**page_variables, "cursor": items_page['cursor']})
+            items_page = response['next_items_page']
+            yield items_page['items']
+
+    # Pages through all the items of a single group
+    async def get_group_items(self, board, group):
+        group_items = []
+        pages = self.iter_items_pages(items_query, next_items_query, lambda response: response['boards'][0]['groups'][0]['items_page'],
+                                      self.column_variables(board['id']), {"boardId": board['id'], "groupId": group['id']})
+        async for items in pages:
+            group_items.extend(items)
+        return group_items
+
+
+    # Reference implementation of the KPI counts, frozen:
+    # group_projects_by_region -> group_projects_by_month -> gather_kpi_stats (with data_by_int_manager) are no longer
+    # used by the pipeline, which counts with aggregate_kpi_stats (see kpi_aggregator.py). They are kept as the oracle
+    # the aggregator is tested against and as the baseline of the benchmark, changes to the KPI rules go in
+    # kpi_aggregator.py only.
 
     # Groups projects by region
     async def group_projects_by_region(self, grouped_project_boards):
@@ -196,64 +607,64 @@ class MondayBoards(MondayBase):
     
 
 
-    # Helper function to add projects to our object by month/region/kpi
-    def add_to_projects_by_frequency(self, projects_by_monthly_freq, month, region, status, item):
-        # Initialize the month if it doesn't exist
-        if month not in projects_by_monthly_freq:
-            projects_by_monthly_freq[month] = {'NA': {'projects_signed': [], 'projects_started': [], 'projects_completed': [], 'canceled_projects': [], 'paused_projects': []},
-                                            'APAC': {'projects_signed': [], 'projects_started': [], 'projects_completed': [], 'canceled_projects': [], 'paused_projects': []},
-                                            'EMEA': {'projects_signed': [], 'projects_started': [], 'projects_completed': [], 'canceled_projects': [], 'paused_projects': []}}
-        
+    # Helper function to add projects to our index by month/region/kpi
+    # Buckets only get the item's index in the index's item_store
+    def add_to_projects_by_frequency(self, projects_by_period, period, region, status, item):
+        region_projects = projects_by_period.bucket(period)[region]
+        item_index = projects_by_period.item_store.add(item)
+
         # Append the item to the appropriate list based on the status
         if status.lower() == 'in progress':
-            projects_by_monthly_freq[month][region]['projects_started'].append(item)
+            region_projects['projects_started'].append(item_index)
         if status.lower() == 'on hold':
-            projects_by_monthly_freq[month][region]['paused_projects'].append(item)
+            region_projects['paused_projects'].append(item_index)
         if status.lower() == 'canceled':
-            projects_by_monthly_freq[month][region]['canceled_projects'].append(item)
+            region_projects['canceled_projects'].append(item_index)
         if status.lower() == 'completed':
-            projects_by_monthly_freq[month][region]['projects_completed'].append(item)
+            region_projects['projects_completed'].append(item_index)
         if status is not None:
-            projects_by_monthly_freq[month][region]['projects_signed'].append(item)
-
-    # Helper function to sort projects by Month (Feb, Jan, March) -> (Jan, Feb, March)
-    def sort_projects_by_frequency(self, projects_by_monthly_freq):
-        # Sorting the months requires understanding that they are not just strings but represent dates
-        month_order = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December']
-        sorted_projects_by_frequency = {month: projects_by_monthly_freq.get(month, {'NA': {}, 'APAC': {}, 'EMEA': {}})
-                                        for month in month_order if month in projects_by_monthly_freq}
-        return sorted_projects_by_frequency
-
-    def data_by_int_manager(self, sorted_projects_by_frequency):
+            region_projects['projects_signed'].append(item_index)
+
+    # Whether a project dated value (date or datetime) is counted, i.e. falls in one of the KPI (fiscal) years
+    def in_kpi_years(self, value):
+        if not value:
+            return False
+        if self.kpi_years is None:
+            return True
+        return self.fiscal_calendar.fiscal_year(period_id(value.year, value.month)) in self.kpi_years
+
+    # {period id: {int manager: {kpi: item indices}}} and the same with the number of projects
+    def data_by_int_manager(self, projects_by_period):
         int_manager_by_month = {}
         int_manager_by_month_count = {}
+        items = projects_by_period.item_store.items
 
         try: 
-            for month, project_frequency in sorted_projects_by_frequency.items():
-                            if month not in int_manager_by_month:
-                                int_manager_by_month[month] = {}
-                                int_manager_by_month_count[month] = {}
-                            for region, group_title in project_frequency.items():
-                                if region not in sorted_projects_by_frequency[month][region]:
-                                    for project_type, projects in group_title.items():
-                                            count = 1
-                                            for project in projects:
-                                                if project['int_manager'] not in int_manager_by_month[month] and project['int_manager'] is not None:
-                                                    int_manager_by_month[month][project['int_manager']] = {}
-                                                    int_manager_by_month_count[month][project['int_manager']] = {}
-                                                if project_type not in int_manager_by_month[month][project['int_manager']]:
-                                                    int_manager_by_month[month][project['int_manager']][project_type] = []
-                                                    int_manager_by_month_count[month][project['int_manager']][project_type] = count
-                                                int_manager_by_month[month][project['int_manager']][project_type].append(project)
-                                                int_manager_by_month_count[month][project['int_manager']][project_type] += count
+            for period, project_frequency in projects_by_period.items():
+                            int_manager_by_month[period] = {}
+                            int_manager_by_month_count[period] = {}
+                            for region, region_projects in project_frequency.items():
+                                    for project_type, item_indices in region_projects.items():
+                                            for item_index in item_indices:
+                                                int_manager = items[item_index]['int_manager']
+                                                if int_manager is None:
+                                                    continue
+                                                manager_projects = int_manager_by_month[period].setdefault(int_manager, {})
+                                                if project_type not in manager_projects:
+                                                    manager_projects[project_type] = new_index_bucket()
+                                                manager_projects[project_type].append(item_index)
+                            for int_manager, manager_projects in int_manager_by_month[period].items():
+                                int_manager_by_month_count[period][int_manager] = {project_type: len(projects) for project_type, projects in manager_projects.items()}
             return int_manager_by_month, int_manager_by_month_count
         except Exception as e:
             print(e)
 
 
     # Group projects by frequency (Monthly / Quarterly)
+    # Returns a PeriodIndex of {region: {kpi: item indices}} buckets, one per month (period id)
+    # The projects themselves are kept once in its item_store
     async def group_projects_by_month(self, grouped_project_boards):
-        projects_by_monthly_freq = {}
+        projects_by_period = PeriodIndex(self.fiscal_calendar, new_projects_by_region, ItemStore())
 
         try:
             # NA
@@ -266,23 +677,12 @@ class MondayBoards(MondayBase):
                                 for item in items:
                                     project_status = item['project_status']
 
-                                    # Projects with 'in progress' status
-                                    if item['project_status'].lower() == 'in progress':
-                                        project_created_year = item['start_date'].split('-')[0] if item['start_date'] else None
-                                        start_parsed_date = datetime.strptime(item['start_date'],"%Y-%m-%d")
-                                        # Format the datetime object to only show the full month name
-                                        project_start_month = start_parsed_date.strftime('%B')
-                                        if project_created_year == '2024':
-                                            self.add_to_projects_by_frequency(projects_by_monthly_freq, project_start_month, region, project_status, item)
-
-                        # On Hold Projects
-                                    if item['project_status'].lower() == 'on hold':
-                                        project_created_year = item['start_date'].split('-')[0] if item['start_date'] else None
-                                        start_parsed_date = datetime.strptime(item['start_date'],"%Y-%m-%d")
-                                        # Format the datetime object to only show the full month name
-                                        project_start_month = start_parsed_date.strftime('%B')
-                                        if project_created_year == '2024':
-                                            self.add_to_projects_by_frequency(projects_by_monthly_freq, project_start_month, region, project_status, item)
+                                    # Projects with 'in progress' or 'on hold' status are counted on their start month
+                                    if item['project_status'].lower() in ('in progress', 'on hold'):
+                                        start_date = item['start_date']
+                                        if self.in_kpi_years(start_date):
+                                            project_start_period = period_id(start_date.year, start_date.month)
+                                            self.add_to_projects_by_frequency(projects_by_period, project_start_period, region, project_status, item)
 
                             # Completed and Canceled projects
                             elif title == 'Closed Projects':
@@ -291,122 +691,132 @@ class MondayBoards(MondayBase):
 
                                     # Check for canceled projects
                                     if item['project_status'].lower() == 'canceled':
-                                        project_created_year = item['project_creation_date'].split('-')[0] if item['project_creation_date'] else None
-                                        recent_updated_parsed_date = datetime.strptime(item['updated_at'],"%Y-%m-%dT%H:%M:%SZ")
-                                        # Format the datetime object to only show the full month name
-                                        project_closed_month = recent_updated_parsed_date.strftime('%B')
-                                        if project_created_year == '2024':
-                                            self.add_to_projects_by_frequency(projects_by_monthly_freq, project_closed_month, region, project_status, item)
-                                    
+                                        counted = self.in_kpi_years(item['project_creation_date'])
                                     # Check for Completed Projects
-                                    if item['project_status'].lower() == 'completed':
-                                        project_closed_year = item['closed_date'].split('-')[0] if item['project_creation_date'] else None
-                                        recent_updated_parsed_date = datetime.strptime(item['updated_at'],"%Y-%m-%dT%H:%M:%SZ")
-                                        # Format the datetime object to only show the full month name
-                                        project_closed_month = recent_updated_parsed_date.strftime('%B')
-                                        if project_closed_year == '2024':
-                                            self.add_to_projects_by_frequency(projects_by_monthly_freq, project_closed_month, region, project_status, item)
+                                    elif item['project_status'].lower() == 'completed':
+                                        counted = self.in_kpi_years(item['closed_date'])
+                                    else:
+                                        counted = False
+
+                                    updated_at = item['updated_at']
+                                    if counted and updated_at:
+                                        project_closed_period = period_id(updated_at.year, updated_at.month)
+                                        self.add_to_projects_by_frequency(projects_by_period, project_closed_period, region, project_status, item)
                             
                             # Signed Projects
                             elif title == 'Open Projects' or 'Backlog' or 'Closed Projects':
                                 for item in items:
                                     project_status = item['project_status']
-                                    # check for projects matching canceled status
-                                    project_created_year = item['project_creation_date'].split('-')[0] if item['project_creation_date'] else None
-                                    recent_updated_parsed_date = datetime.strptime(item['created_at'],"%Y-%m-%dT%H:%M:%SZ")
-                                    # Format the datetime object to only show the full month name
-                                    project_closed_month = recent_updated_parsed_date.strftime('%B')
-                                    if project_created_year == '2024':
-                                        self.add_to_projects_by_frequency(projects_by_monthly_freq, project_closed_month, region, project_status, item)
-            
-            # After populating projects_by_frequency, sort it before writing to JSON
-            sorted_projects_by_frequency = self.sort_projects_by_frequency(projects_by_monthly_freq)
+                                    created_at = item['created_at']
+                                    if self.in_kpi_years(item['project_creation_date']) and created_at:
+                                        project_created_period = period_id(created_at.year, created_at.month)
+                                        self.add_to_projects_by_frequency(projects_by_period, project_created_period, region, project_status, item)
 
         except Exception as e:
             print(f'An error occurred: {e}')
 
-        create_json_file('raw_data/projects_by_monthly_freq.json',sorted_projects_by_frequency)
-        return sorted_projects_by_frequency
+        # The full projects are in new_grouped_data, the dump only points to them
+        if debug_dumps.mode != 'off':
+            create_json_file('raw_data/projects_by_monthly_freq.json',{month_label(period): projects_by_period.item_store.materialize_nested(projects, dump_fields)
+                                                                      for period, projects in projects_by_period.items()})
+        return projects_by_period
     
+    # Single pass replacement for group_projects_by_region -> group_projects_by_month -> gather_kpi_stats
+    # Returns the same four objects as gather_kpi_stats
+    # Accepts either grouped data (counted straight from the project dicts) or a ProjectTable
+    async def aggregate_kpi_stats(self, grouped_project_boards):
+        aggregator = KpiAggregator(kpi_groupings, self.kpi_years, self.fiscal_calendar)
+        if isinstance(grouped_project_boards, ProjectTable):
+            aggregator.add_table(grouped_project_boards)
+        else:
+            aggregator.add_grouped_data(grouped_project_boards)
+        return self.kpi_stats_results(aggregator)
+
+    # Streaming pipeline from the Monday fetch to the KPI counts
+    # Each page is loaded into the ProjectTable and counted as soon as it arrives, then its project dicts are dropped,
+    # so memory stays flat as the board grows and the parsing overlaps with the requests still in flight
+    # Returns the ProjectTable (for the duration KPIs) and the same four objects as aggregate_kpi_stats
+    async def stream_kpi_stats(self):
+        project_table = ProjectTable()
+        aggregator = KpiAggregator(kpi_groupings, self.kpi_years, self.fiscal_calendar)
+        # Closed right away if counting a page fails, so the fetchers are stopped now rather than when it's garbage collected
+        async with contextlib.aclosing(self.stream_project_board()) as pages:
+            async for group_title, items in pages:
+                start = len(project_table)
+                project_table.extend(group_title, items)
+                aggregator.add_table(project_table, start)
+        return project_table, self.kpi_stats_results(aggregator)
+
+    def kpi_stats_results(self, aggregator):
+        kpi_by_month = aggregator.result(('month', 'region'))
+        kpi_by_quarter = aggregator.result(('quarter', 'region'))
+        int_manager_by_quarter_count = aggregator.result(('quarter', 'int_manager'))
+        int_manager_by_month_count = aggregator.result(('month', 'int_manager'))
+
+        create_json_file('raw_data/kpi_by_quarter.json',kpi_by_quarter)
+        create_json_file('raw_data/kpi_by_month.json',kpi_by_month)
+        create_json_file('raw_data/int_manager_by_quarter_count.json',int_manager_by_quarter_count)
+        create_json_file('raw_data/int_manager_by_month_count.json',int_manager_by_month_count)
+
+        return kpi_by_month, kpi_by_quarter, int_manager_by_quarter_count, int_manager_by_month_count
+
+    # Average kickoff lag, planned length, completed length and SLA attainment by region, integration manager and period
+    # Counted for the same (fiscal) years as the KPI counts
+    async def gather_duration_kpis(self, project_table, period='quarter'):
+        # numpy is only imported by the runs computing these
+        from duration_kpis import compute_duration_kpis
+        duration_kpis = compute_duration_kpis(project_table, period, self.kpi_years, self.fiscal_calendar)
+        create_json_file(f'raw_data/duration_kpis_by_{period}.json',duration_kpis)
+        return duration_kpis
+
     # Gather KPI stats for projects from previous objects
-    async def gather_kpi_stats(self, sorted_projects_by_frequency):
+    # Months are labelled '2024-01' and quarters '2024-Q1', quarters follow the (fiscal) calendar
+    async def gather_kpi_stats(self, projects_by_period):
         kpi_by_month = {}
         kpi_by_quarter = {}
-        int_manager_by_month = {}
+        int_manager_by_period = {}
         int_manager_by_quarter_count = {}
         int_manager_by_month_count = {}
-        month_count = 0
+        calendar = projects_by_period.calendar
 
         try:
-            int_manager_by_month, int_manager_by_month_count = self.data_by_int_manager(sorted_projects_by_frequency)
-            
-
-            print('int_manager_by_month\n',int_manager_by_month)
-            for month, project_frequency in sorted_projects_by_frequency.items():
-                        if month not in kpi_by_month:
-                            kpi_by_month[month] = {}
-                        for region, group_title in project_frequency.items():
-                            if region not in kpi_by_month[month]:
-                                kpi_by_month[month][region] = {}
-                            kpi_by_month[month][region]['projects_started'] = len((sorted_projects_by_frequency[month][region]['projects_started']))
-                            kpi_by_month[month][region]['canceled_projects'] = len((sorted_projects_by_frequency[month][region]['canceled_projects']))
-                            kpi_by_month[month][region]['projects_signed'] = len((sorted_projects_by_frequency[month][region]['projects_signed']))
-                            kpi_by_month[month][region]['paused_projects'] = len((sorted_projects_by_frequency[month][region]['paused_projects']))        
-                            kpi_by_month[month][region]['projects_completed'] = len((sorted_projects_by_frequency[month][region]['projects_completed']))
-
-            for month, project_frequency in sorted_projects_by_frequency.items():
-                month_count += 1
-                # Determine the current quarter based on the month count
-                quarter = f"Q{str((month_count - 1) // 3 + 1)}"
-                
+            int_manager_by_period, int_manager_by_period_count = self.data_by_int_manager(projects_by_period)
+            int_manager_by_month_count = {month_label(period): managers for period, managers in int_manager_by_period_count.items()}
+
+            for period, project_frequency in projects_by_period.items():
+                month = month_label(period)
+                quarter = calendar.quarter_label(calendar.quarter(period))
+                kpi_by_month[month] = {}
                 if quarter not in kpi_by_quarter:
                     kpi_by_quarter[quarter] = {}
-                
-                for region, group_title in project_frequency.items():
+
+                for region, region_projects in project_frequency.items():
+                    kpi_by_month[month][region] = {kpi: len(region_projects[kpi]) for kpi in kpi_keys}
                     if region not in kpi_by_quarter[quarter]:
-                        kpi_by_quarter[quarter][region] = {'projects_started': 0, 'canceled_projects': 0, 'projects_signed': 0, 'paused_projects': 0, 'projects_completed': 0}
-                    
-                    # Now safely update the counts
-                    kpi_by_quarter[quarter][region]['projects_started'] += len(project_frequency[region]['projects_started'])
-                    kpi_by_quarter[quarter][region]['canceled_projects'] += len(project_frequency[region]['canceled_projects'])
-                    kpi_by_quarter[quarter][region]['projects_signed'] += len(project_frequency[region]['projects_signed'])
-                    kpi_by_quarter[quarter][region]['paused_projects'] += len(project_frequency[region]['paused_projects'])
-                    kpi_by_quarter[quarter][region]['projects_completed'] += len(project_frequency[region]['projects_completed'])
-                
-                # Reset the month count after each quarter
-                if month_count % 3 == 0:
-                    month_count = 0
-
-            month_count = 0
-            for month, project_frequency in int_manager_by_month.items():
-                month_count += 1
-                # Determine the current quarter based on the month count
-                quarter = f"Q{str((month_count - 1) // 3 + 1)}"
-                
+                        kpi_by_quarter[quarter][region] = dict.fromkeys(kpi_keys, 0)
+                    for kpi in kpi_keys:
+                        kpi_by_quarter[quarter][region][kpi] += len(region_projects[kpi])
+
+            for period, managers in int_manager_by_period_count.items():
+                quarter = calendar.quarter_label(calendar.quarter(period))
                 if quarter not in int_manager_by_quarter_count:
                     int_manager_by_quarter_count[quarter] = {}
-                
-                for int_manager, group_title in project_frequency.items():
+
+                for int_manager, counts in managers.items():
                     if int_manager not in int_manager_by_quarter_count[quarter]:
-                        int_manager_by_quarter_count[quarter][int_manager] = {'projects_started': 0, 'canceled_projects': 0, 'projects_signed': 0, 'paused_projects': 0, 'projects_completed': 0}
-                    for type, project_types in group_title.items():
-                        if type not in project_frequency[int_manager]:
-                            project_frequency[int_manager][type] = 0
-                        int_manager_by_quarter_count[quarter][int_manager][type] += len(project_frequency[int_manager][type]) if project_frequency[int_manager][type] else 0
-                   
-                
-                # Reset the month count after each quarter
-                if month_count % 3 == 0:
-                    month_count = 0
+                        int_manager_by_quarter_count[quarter][int_manager] = dict.fromkeys(kpi_keys, 0)
+                    for kpi, count in counts.items():
+                        int_manager_by_quarter_count[quarter][int_manager][kpi] += count
     
         except Exception as e:
             print(f'An error occured: {e}')
         
         create_json_file('raw_data/kpi_by_quarter.json',kpi_by_quarter)
         create_json_file('raw_data/kpi_by_month.json',kpi_by_month)
-        create_json_file('raw_data/int_manager_by_month.json',int_manager_by_month)
+        if debug_dumps.mode != 'off':
+            create_json_file('raw_data/int_manager_by_month.json',{month_label(period): projects_by_period.item_store.materialize_nested(managers, dump_fields)
+                                                                   for period, managers in int_manager_by_period.items()})
         create_json_file('raw_data/int_manager_by_quarter_count.json',int_manager_by_quarter_count)
         create_json_file('raw_data/int_manager_by_month_count.json',int_manager_by_month_count)
 
         return kpi_by_month, kpi_by_quarter, int_manager_by_quarter_count, int_manager_by_month_count
-
@@ -0,0 +1,361 @@
+import argparse
+import asyncio
+import base64
+import collections
+import json
+import multiprocessing
+import os
+import random
+import time
+from aiohttp import web
+from graphql import build_schema, graphql_sync
+from synthetic_board import generate_boards
+
+"""
+Local stand-in for Monday's GraphQL API, serving synthetic boards (see synthetic_board.py)
+Covers what monday.py asks for: boards, columns, groups, items_page / next_items_page with cursors,
+items(ids:) and complexity. Latency, server errors, rate limits (429), concurrency limits
+and the complexity budget can all be injected so we can load test MondayBoards on a laptop.
+
+    python src/monday_stub.py --items 100000 --boards 2 --latency 0.2 --error-rate 0.01
+    MONDAY_API_URL=http://localhost:8080/v2/ MONDAY_BOARD_IDS=498075709,498075710 python src/main.py
+
+or serving from a child process while MondayBoards fetches every board, printing timings and request stats:
+
+    python src/monday_stub.py --items 100000 --boards 2 --latency 0.2 --load-test
+"""
+
+# The part of Monday's schema we use, same names and argument types
+schema_sdl = """
+scalar JSON
+
+type Query {
+    complexity: Complexity
+    boards(ids: [ID!], limit: Int): [Board]
+    items(ids: [ID!], limit: Int): [Item]
+    next_items_page(limit: Int!, cursor: String!): ItemsResponse!
+}
+
+type Complexity {
+    before: Int
+    query: Int
+    after: Int
+    reset_in_x_seconds: Int
+}
+
+type Board {
+    id: ID!
+    name: String!
+    columns: [Column]
+    groups(ids: [String]): [Group]
+    items_page(limit: Int, cursor: String): ItemsResponse!
+}
+
+type Column {
+    id: ID!
+    title: String!
+    type: String
+}
+
+type Group {
+    id: ID!
+    title: String!
+    items_page(limit: Int, cursor: String): ItemsResponse!
+}
+
+type ItemsResponse {
+    cursor: String
+    items: [Item!]!
+}
+
+type Item {
+    id: ID!
+    name: String!
+    created_at: String
+    updated_at: String
+    group: Group
+    column_values(ids: [String!]): [ColumnValue]
+}
+
+type ColumnValue {
+    id: ID!
+    text: String
+    value: JSON
+    type: String
+    column: Column
+}
+"""
+
+schema = build_schema(schema_sdl)
+
+# Monday's page size limits
+max_items_page_limit = 500
+max_items_ids_limit = 100
+
+# Complexity model, roughly how Monday charges: a base cost per query plus a cost per item asked for
+query_base_cost = 10
+item_cost = 10
+
+
+class MondayStub:
+    def __init__(self, boards, latency=0, jitter=0, error_rate=0, rate_limit=None, max_in_flight=None,
+                 complexity_budget=10_000_000, budget_window=60, seed=0):
+        self.boards = {board.id: board for board in boards}
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit  # Requests per minute, None for no limit
+        self.max_in_flight = max_in_flight  # Concurrent requests, None for no limit
+        self.complexity_budget = complexity_budget
+        self.budget_window = budget_window
+        self.random = random.Random(seed)
+
+        self.budget_remaining = complexity_budget
+        self.budget_reset_at = time.monotonic() + budget_window
+        self.request_times = collections.deque()
+        self.in_flight = 0
+        self.runner = None
+
+        # Counters
+        self.stats = collections.Counter()
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post('/v2', self.handle)
+        app.router.add_post('/v2/', self.handle)
+        return app
+
+    async def start(self, host='localhost', port=8080):
+        self.runner = web.AppRunner(self.app())
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        print(f'Monday stub serving {len(self.boards)} boards on http://{host}:{port}/v2/')
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def handle(self, request):
+        self.stats['requests'] += 1
+        self.in_flight += 1
+        self.stats['peak_in_flight'] = max(self.stats['peak_in_flight'], self.in_flight)
+        try:
+            if self.rate_limited():
+                self.stats['rate_limited'] += 1
+                return web.Response(status=429, text='Rate limit exceeded', headers={'Retry-After': '60'})
+
+            if self.latency or self.jitter:
+                await asyncio.sleep(self.latency + self.random.uniform(0, self.jitter))
+
+            if self.random.random() < self.error_rate:
+                self.stats['server_errors'] += 1
+                return web.Response(status=500, text='Internal server error')
+
+            if self.max_in_flight and self.in_flight > self.max_in_flight:
+                self.stats['concurrency_limited'] += 1
+                return self.errors_response(f'Concurrency limit exceeded, max {self.max_in_flight} concurrent requests')
+
+            body = await request.json()
+            return self.execute(body.get('query', ''), body.get('variables') or {}, body.get('operationName'))
+        finally:
+            self.in_flight -= 1
+
+    def rate_limited(self):
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        while self.request_times and now - self.request_times[0] > 60:
+            self.request_times.popleft()
+        if len(self.request_times) >= self.rate_limit:
+            return True
+        self.request_times.append(now)
+        return False
+
+    def execute(self, query, variables, operation_name):
+        now = time.monotonic()
+        if now >= self.budget_reset_at:
+            self.budget_remaining = self.complexity_budget
+            self.budget_reset_at = now + self.budget_window
+        reset_in = max(1, int(self.budget_reset_at - now))
+
+        cost = self.query_cost(variables)
+        if cost > self.budget_remaining:
+            self.stats['budget_exhausted'] += 1
+            return self.errors_response(f'Complexity budget exhausted, query cost {cost} budget remaining '
+                                        f'{self.budget_remaining} out of {self.complexity_budget} reset in {reset_in} seconds')
+
+        complexity = {'before': self.budget_remaining, 'query': cost, 'after': self.budget_remaining - cost, 'reset_in_x_seconds': reset_in}
+        self.budget_remaining -= cost
+        self.stats['complexity_used'] += cost
+
+        result = graphql_sync(schema, query, root_value=self.root(), context_value={'complexity': complexity},
+                              variable_values=variables, operation_name=operation_name)
+        response = {'data': result.data}
+        if result.errors:
+            self.stats['query_errors'] += 1
+            response['errors'] = [error.formatted for error in result.errors]
+        return web.json_response(response)
+
+    # Cost is known before running the query from the page size or the number of ids asked for
+    def query_cost(self, variables):
+        items = variables.get('limit') or len(variables.get('ids') or [])
+        return query_base_cost + item_cost * items
+
+    def errors_response(self, message):
+        return web.json_response({'errors': [{'message': message}]})
+
+    # Resolvers, graphql-core calls any callable it finds on a dict with (info, **arguments)
+    def root(self):
+        return {
+            'complexity': lambda info: info.context['complexity'],
+            'boards': lambda info, ids=None, limit=None: [
+                self.board_node(board) for board in self.boards.values() if ids is None or board.id in ids
+            ][:limit],
+            'items': lambda info, ids=None, limit=25: self.items_by_ids((ids or [])[:min(limit, max_items_ids_limit)]),
+            'next_items_page': lambda info, limit, cursor: self.items_page(*self.decode_cursor(cursor), limit),
+        }
+
+    def board_node(self, board):
+        return {
+            'id': board.id,
+            'name': board.name,
+            'columns': board.columns,
+            'groups': lambda info, ids=None: [
+                self.group_node(board, index) for index, group in enumerate(board.groups) if ids is None or group['id'] in ids
+            ],
+            'items_page': lambda info, limit=25, cursor=None: self.items_page(*(self.decode_cursor(cursor) if cursor else (board.id, None, 0)), limit),
+        }
+
+    def group_node(self, board, group_index):
+        return {
+            **board.groups[group_index],
+            'items_page': lambda info, limit=25, cursor=None: self.items_page(*(self.decode_cursor(cursor) if cursor else (board.id, group_index, 0)), limit),
+        }
+
+    # A page of a board or of one of its groups (group_index None), with the cursor to the next one
+    def items_page(self, board_id, group_index, offset, limit):
+        board = self.boards[board_id]
+        limit = min(limit, max_items_page_limit)
+        if group_index is None:
+            items = board.board_items(offset, limit)
+            total = board.item_count
+        else:
+            items = board.group_items(group_index, offset, limit)
+            total = board.group_size(group_index)
+        self.stats['items_served'] += len(items)
+        cursor = self.encode_cursor(board_id, group_index, offset + limit) if offset + limit < total else None
+        return {'cursor': cursor, 'items': [self.item_node(item) for item in items]}
+
+    def items_by_ids(self, ids):
+        items = []
+        for item_id in ids:
+            for board in self.boards.values():
+                index = board.item_index(item_id)
+                if index is not None:
+                    items.append(self.item_node(board.item(index)))
+                    break
+        self.stats['items_served'] += len(items)
+        return items
+
+    def item_node(self, item):
+        column_values = item['column_values']
+        return {
+            **item,
+            'column_values': lambda info, ids=None: [
+                column_value for column_value in column_values if ids is None or column_value['id'] in ids
+            ],
+        }
+
+    # Cursors are opaque to the client, ours carry the board, group and offset of the next page
+    def encode_cursor(self, board_id, group_index, offset):
+        return base64.urlsafe_b64encode(json.dumps([board_id, group_index, offset]).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        board_id, group_index, offset = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return board_id, group_index, offset
+
+
+# Fetch every board from the stub with MondayBoards and report how it went
+# The stub serves from a child process, its GraphQL execution would otherwise run on the client's event loop
+# and the timings would measure both of them
+def run_load_test(stub, host, port, max_concurrency=None):
+    os.environ['MONDAY_API_URL'] = f'http://{host}:{port}/v2/'
+    os.environ.setdefault('MONDAY_SCHEMA_CACHE', '.cache/monday_stub_schema.json')
+
+    ready = multiprocessing.Event()
+    stop = multiprocessing.Event()
+    server = multiprocessing.Process(target=serve_process, args=(stub, host, port, ready, stop))
+    server.start()
+    try:
+        while not ready.wait(0.1):
+            if not server.is_alive():
+                raise RuntimeError(f'Monday stub exited with code {server.exitcode} before serving')
+        asyncio.run(fetch_every_board(list(stub.boards), max_concurrency))
+    finally:
+        # The stub prints its stats as it stops
+        stop.set()
+        server.join()
+
+
+async def fetch_every_board(board_ids, max_concurrency=None):
+    from monday import MondayBoards
+
+    async with MondayBoards(board_ids, max_concurrency) as monday_projects:
+        started = time.perf_counter()
+        grouped_data = await monday_projects.get_project_board()
+        elapsed = time.perf_counter() - started
+    project_count = sum(len(items) for items in grouped_data.values())
+    print(f'Fetched {project_count} projects in {elapsed:.2f}s ({project_count / elapsed:.0f} projects/s)')
+
+
+# Serves until stop is set (a multiprocessing.Event) or forever, ready is set once the stub accepts requests
+async def serve(stub, host, port, ready=None, stop=None):
+    await stub.start(host, port)
+    if ready is not None:
+        ready.set()
+    try:
+        if stop is None:
+            await asyncio.Event().wait()
+        while not stop.is_set():
+            await asyncio.sleep(0.1)
+    finally:
+        print(f'Stub: {dict(stub.stats)}')
+        await stub.stop()
+
+
+def serve_process(stub, host, port, ready, stop):
+    asyncio.run(serve(stub, host, port, ready, stop))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve synthetic Monday boards over a local GraphQL endpoint')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--boards', type=int, default=1)
+    parser.add_argument('--groups', type=int, default=3)
+    parser.add_argument('--items', type=int, default=10_000, help='items across all the boards')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0, help='seconds added to every request')
+    parser.add_argument('--jitter', type=float, default=0, help='random extra latency, up to this many seconds')
+    parser.add_argument('--error-rate', type=float, default=0, help='share of requests failing with a 500')
+    parser.add_argument('--rate-limit', type=int, default=None, help='requests per minute before answering 429')
+    parser.add_argument('--max-in-flight', type=int, default=None, help='concurrent requests before a concurrency limit error')
+    parser.add_argument('--complexity-budget', type=int, default=10_000_000, help='complexity per budget window')
+    parser.add_argument('--budget-window', type=int, default=60, help='seconds before the complexity budget resets')
+    parser.add_argument('--load-test', action='store_true', help='fetch every board with MondayBoards and exit')
+    parser.add_argument('--max-concurrency', type=int, default=None, help='MondayBoards max concurrency for --load-test')
+    args = parser.parse_args()
+
+    stub = MondayStub(generate_boards(args.boards, args.groups, args.items, args.seed),
+                      latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, rate_limit=args.rate_limit,
+                      max_in_flight=args.max_in_flight, complexity_budget=args.complexity_budget,
+                      budget_window=args.budget_window, seed=args.seed)
+    try:
+        if args.load_test:
+            run_load_test(stub, args.host, args.port, args.max_concurrency)
+        else:
+            asyncio.run(serve(stub, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
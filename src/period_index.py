@@ -0,0 +1,122 @@
+import os
+from datetime import date
+
+
+# Months are identified by an integer period id, year * 12 + month - 1, so consecutive months are consecutive ids
+# and any month, quarter, year or rolling window is a plain range of ids
+def period_id(year, month):
+    return year * 12 + month - 1
+
+
+def period_year_month(period):
+    year, month_index = divmod(period, 12)
+    return year, month_index + 1
+
+
+def month_label(period):
+    year, month = period_year_month(period)
+    return f'{year}-{month:02d}'
+
+
+def ordinal_period(ordinal):
+    day = date.fromordinal(ordinal)
+    return period_id(day.year, day.month)
+
+
+# Quarters and years follow the fiscal year, which starts on first_month (KPI_FISCAL_YEAR_START, 1 = calendar year)
+# A fiscal year starting on any other month is named after the calendar year it ends in, e.g. with July
+# as the first month, FY2025 runs from July 2024 to June 2025 and 2025-Q1 is July to September 2024.
+class FiscalCalendar:
+    def __init__(self, first_month=None):
+        self.first_month = first_month or int(os.getenv('KPI_FISCAL_YEAR_START', 1))
+        if not 1 <= self.first_month <= 12:
+            raise ValueError(f'The fiscal year should start on a month between 1 and 12, got {self.first_month}')
+        self.offset = self.first_month - 1
+        self.year_shift = 0 if self.first_month == 1 else 1
+
+    def fiscal_year(self, period):
+        return (period - self.offset) // 12 + self.year_shift
+
+    # Quarter id, fiscal year * 4 + quarter - 1
+    def quarter(self, period):
+        shifted = period - self.offset
+        return (shifted // 12 + self.year_shift) * 4 + (shifted % 12) // 3
+
+    def quarter_label(self, quarter):
+        fiscal_year, quarter_index = divmod(quarter, 4)
+        return f'{fiscal_year}-Q{quarter_index + 1}'
+
+    def quarter_periods(self, quarter):
+        fiscal_year, quarter_index = divmod(quarter, 4)
+        first_period = (fiscal_year - self.year_shift) * 12 + self.offset + quarter_index * 3
+        return range(first_period, first_period + 3)
+
+    def year_periods(self, fiscal_year):
+        first_period = (fiscal_year - self.year_shift) * 12 + self.offset
+        return range(first_period, first_period + 12)
+
+
+# Buckets keyed by period id, filled once while going over the projects
+# Reading a month, quarter, year or rolling window is one dict lookup per month in it, no re-scan of the projects
+# Buckets holding ItemStore indices keep their store with them in item_store
+class PeriodIndex:
+    def __init__(self, calendar=None, new_bucket=dict, item_store=None):
+        self.calendar = calendar or FiscalCalendar()
+        self.new_bucket = new_bucket
+        self.item_store = item_store
+        self.buckets = {}
+
+    def __len__(self):
+        return len(self.buckets)
+
+    def bucket(self, period):
+        bucket = self.buckets.get(period)
+        if bucket is None:
+            bucket = self.buckets[period] = self.new_bucket()
+        return bucket
+
+    def periods(self):
+        return sorted(self.buckets)
+
+    # (period, bucket) of every month, in calendar order
+    def items(self):
+        return [(period, self.buckets[period]) for period in self.periods()]
+
+    # (period, bucket) of the months in [first_period, last_period] that have a bucket, in calendar order
+    def window(self, first_period, last_period):
+        return [(period, self.buckets[period]) for period in range(first_period, last_period + 1) if period in self.buckets]
+
+    def month(self, year, month):
+        return self.buckets.get(period_id(year, month))
+
+    def quarter(self, quarter):
+        periods = self.calendar.quarter_periods(quarter)
+        return self.window(periods[0], periods[-1])
+
+    def fiscal_year(self, fiscal_year):
+        periods = self.calendar.year_periods(fiscal_year)
+        return self.window(periods[0], periods[-1])
+
+    # The last `months` months up to last_period, e.g. rolling(period_id(2024, 6), 12) for July 2023 to June 2024
+    def rolling(self, last_period, months):
+        return self.window(last_period - months + 1, last_period)
+
+    # Period ids grouped by quarter, {quarter: [periods]}, in calendar order
+    def quarters(self):
+        quarters = {}
+        for period in self.periods():
+            quarters.setdefault(self.calendar.quarter(period), []).append(period)
+        return quarters
+
+
+# Years the KPIs are counted for, from KPI_YEARS: "2023,2024", "all", or by default the current (fiscal) year
+# Returns a set of years, or None for every year
+def kpi_years(calendar=None, value=None):
+    value = value if value is not None else os.getenv('KPI_YEARS', '')
+    if value.strip().lower() == 'all':
+        return None
+    years = {int(year) for year in value.split(',') if year.strip()}
+    if years:
+        return years
+    today = date.today()
+    return {(calendar or FiscalCalendar()).fiscal_year(period_id(today.year, today.month))}
@@ -0,0 +1,84 @@
+from array import array
+from datetime import date, datetime
+
+
+# Dictionary encoding for a string column
+# Every distinct value is stored once, rows only hold its small integer code (0 is None)
+class ValueDictionary:
+    def __init__(self):
+        self.values = [None]
+        self.codes = {None: 0}
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def decode(self, code):
+        return self.values[code]
+
+    def __len__(self):
+        return len(self.values)
+
+
+# Compact columnar store for the projects we ingest from Monday
+# Instead of one dict per project, each field is a typed array with one entry per row:
+# - string fields we group on are dictionary encoded as unsigned shorts
+# - dates are stored as proleptic Gregorian ordinals in int arrays (0 when missing)
+# A few dozen bytes per project instead of a dict of strings.
+class ProjectTable:
+    encoded_columns = ['group', 'project_status', 'region', 'int_type', 'country', 'int_manager', 'board_id']
+    date_columns = ['created_at', 'updated_at', 'project_creation_date', 'start_date', 'due_date', 'closed_date']
+
+    def __init__(self):
+        self.ids = array('q')
+        self.names = []
+        self.dictionaries = {column: ValueDictionary() for column in self.encoded_columns}
+        self.codes = {column: array('H') for column in self.encoded_columns}
+        self.dates = {column: array('i') for column in self.date_columns}
+
+    @classmethod
+    def from_grouped_data(cls, grouped_project_boards):
+        table = cls()
+        for group_title, items in grouped_project_boards.items():
+            table.extend(group_title, items)
+        return table
+
+    def __len__(self):
+        return len(self.ids)
+
+    # Column by column instead of row by row, values already in a dictionary only cost a dict lookup
+    def extend(self, group_title, items):
+        self.ids.fromlist([int(item['id']) for item in items])
+        self.names.extend([item.get('name') for item in items])
+        for column in self.encoded_columns:
+            dictionary = self.dictionaries[column]
+            if column == 'group':
+                self.codes[column].fromlist([dictionary.encode(group_title)] * len(items))
+                continue
+            codes = dictionary.codes
+            encode = dictionary.encode
+            self.codes[column].fromlist([codes.get(value) or encode(value) for value in [item.get(column) for item in items]])
+        for column in self.date_columns:
+            self.dates[column].fromlist([value.toordinal() if value.__class__ in parsed_date_types else to_ordinal(value)
+                                         for value in [item.get(column) for item in items]])
+
+
+# Values parsed by iso_dates.py, turned into ordinals without going through to_ordinal()
+parsed_date_types = {date, datetime}
+
+
+# date, datetime, '2024-03-01' or '2024-03-01T10:00:00Z' -> ordinal, 0 when missing or not a date
+def to_ordinal(value):
+    if not value:
+        return 0
+    # Fetched projects carry parsed dates (see iso_dates.py), recordings may still hold strings
+    if isinstance(value, date):
+        return value.toordinal()
+    try:
+        return date(int(value[0:4]), int(value[5:7]), int(value[8:10])).toordinal()
+    except (TypeError, ValueError):
+        return 0
+
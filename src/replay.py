@@ -0,0 +1,94 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from debug_dumps import debug_dumps, read_debug_snapshot
+from iso_dates import normalize_grouped_dates
+from item_snapshot import ItemSnapshot
+from monday import MondayBoards, create_json_file
+from main import aggregate_monday_data, build_kpi_table_requests
+
+"""
+Offline replay of the KPI pipeline from recorded project data, no Monday or Google calls.
+Reruns after a logic change take seconds, and production sized data can be profiled without touching the API.
+
+    python src/replay.py                                     # the last run's recording, see default_recordings
+    python src/replay.py raw_data/new_grouped_data.json
+    python src/replay.py raw_data/debug_snapshot.ndjson.gz
+"""
+
+# What a run records by default: the compact debug snapshot, or new_grouped_data.json with MONDAY_DEBUG_DUMPS=pretty
+default_recordings = ['raw_data/debug_snapshot.ndjson.gz', 'raw_data/new_grouped_data.json']
+
+
+# The first default recording that exists, the compact snapshot when there is none so the error names it
+def default_recording():
+    return next((path for path in default_recordings if os.path.exists(path)), default_recordings[0])
+
+
+# Load recorded projects as grouped data ({group title: [projects]}) from either:
+# - a grouped data dump (raw_data/new_grouped_data.json)
+# - a compact debug snapshot (raw_data/debug_snapshot.ndjson.gz), using its new_grouped_data stage
+# - an incremental sync snapshot (raw_data/monday_snapshot_<board id>.json)
+# Dates are parsed like after a fetch, recordings hold them as strings
+# The debug dumps of the run never overwrite the recording
+def load_recorded_projects(snapshot_path):
+    debug_dumps.protect(snapshot_path)
+    return normalize_grouped_dates(read_recorded_projects(snapshot_path))
+
+
+def read_recorded_projects(snapshot_path):
+    if snapshot_path.endswith('.gz'):
+        stages = read_debug_snapshot(snapshot_path)
+        if 'new_grouped_data' not in stages:
+            raise ValueError(f'{snapshot_path} has no new_grouped_data stage, was it recorded with MONDAY_DEBUG_DUMPS=compact?')
+        return stages['new_grouped_data']
+
+    with open(snapshot_path) as file:
+        recorded = json.load(file)
+
+    if 'board_id' in recorded and 'items' in recorded:
+        item_snapshot = ItemSnapshot(snapshot_path, recorded['board_id'])
+        item_snapshot.load()
+        return item_snapshot.to_grouped_data()
+    return recorded
+
+
+# Runs the aggregation and the slides request building on recorded data
+async def replay(snapshot_path):
+    timings = {}
+    # Keep the replay's own dumps away from the recorded debug snapshot we may be reading from
+    debug_dumps.snapshot_path = 'raw_data/replay_debug_snapshot.ndjson.gz'
+
+    started = time.perf_counter()
+    grouped_project_boards = load_recorded_projects(snapshot_path)
+    timings['load'] = time.perf_counter() - started
+    project_count = sum(len(items) for items in grouped_project_boards.values())
+    print(f'Replaying {project_count} projects from {snapshot_path}')
+
+    # Never connects, the session is only opened on the first request
+    monday_projects = MondayBoards()
+
+    started = time.perf_counter()
+    kpi_by_month, kpi_by_quarter, duration_kpis = await aggregate_monday_data(monday_projects, grouped_project_boards)
+    timings['aggregate'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    request_batches = build_kpi_table_requests(kpi_by_month, kpi_by_quarter, duration_kpis)
+    timings['slides_requests'] = time.perf_counter() - started
+    create_json_file('raw_data/replay_slides_requests.json',request_batches)
+
+    print('Replay timings: ' + ', '.join(f'{stage} {seconds:.3f}s' for stage, seconds in timings.items()))
+    return kpi_by_month, kpi_by_quarter, request_batches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the KPI pipeline from a recorded snapshot, without network access')
+    parser.add_argument('snapshot_path', nargs='?', help=f'recorded projects, defaults to the first of {", ".join(default_recordings)} that exists')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(replay(args.snapshot_path or default_recording()))
+    finally:
+        debug_dumps.close()
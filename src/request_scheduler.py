@@ -0,0 +1,130 @@
+import asyncio
+import random
+import re
+import time
+
+
+# Schedules requests against Monday's complexity budget
+# Every query asks Monday for its complexity, which tells us what the query cost and how much budget is left.
+# The number of requests allowed in flight follows the remaining budget, and budget / rate limit errors,
+# server errors and dropped connections or timeouts are retried with exponential backoff and jitter.
+class RequestScheduler:
+    def __init__(self, max_concurrency, max_retries=5, base_delay=1, max_delay=60):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.concurrency = max_concurrency  # Current limit, moves between 1 and max_concurrency
+        self.in_flight = 0
+        self.condition = asyncio.Condition()
+        self.average_cost = None  # Moving average of the complexity of our queries
+        self.budget_remaining = None
+        self.paused_until = 0  # Monotonic time until which no request is sent (budget exhausted)
+
+        # Counters
+        self.calls = 0
+        self.retries = 0
+        self.complexity_used = 0
+
+    # Send a request through the scheduler, send is a coroutine function returning the response data
+    async def run(self, send):
+        attempt = 0
+        while True:
+            await self.acquire()
+            complexity = None
+            try:
+                self.calls += 1
+                response = await send()
+                if isinstance(response, dict):
+                    complexity = response.pop('complexity', None)
+                return response
+            except Exception as e:
+                delay = self.retry_delay(e, attempt)
+                if delay is None or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.retries += 1
+            finally:
+                await self.release(complexity)
+
+            print(f'Monday request failed, retrying in {delay:.1f}s ({attempt}/{self.max_retries})')
+            await asyncio.sleep(delay)
+
+    async def acquire(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < self.concurrency)
+            self.in_flight += 1
+
+        # Budget exhausted, wait for Monday to reset it
+        delay = self.paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def release(self, complexity=None):
+        async with self.condition:
+            self.in_flight -= 1
+            if complexity:
+                self.record_complexity(complexity)
+            self.condition.notify_all()
+
+    # complexity is the { query after reset_in_x_seconds } object returned by Monday
+    def record_complexity(self, complexity):
+        cost = complexity.get('query') or 0
+        self.complexity_used += cost
+        self.average_cost = cost if self.average_cost is None else 0.8 * self.average_cost + 0.2 * cost
+
+        self.budget_remaining = complexity.get('after')
+        if self.budget_remaining is None or not self.average_cost:
+            return
+
+        # Only allow as many requests in flight as the remaining budget can pay for
+        affordable = int(self.budget_remaining // self.average_cost)
+        self.concurrency = max(1, min(self.max_concurrency, affordable))
+
+        if affordable < 1:
+            self.pause(complexity.get('reset_in_x_seconds') or self.base_delay)
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    # Returns how long to wait before retrying, or None if the error shouldn't be retried
+    def retry_delay(self, error, attempt):
+        # Only needed once something failed, keeps gql and aiohttp out of the import
+        from aiohttp import ClientError
+        from gql.transport.exceptions import TransportQueryError, TransportServerError
+
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+        # Connection refused or reset, server disconnected, request timed out
+        if isinstance(error, (ClientError, ConnectionError, asyncio.TimeoutError)):
+            return backoff
+
+        if isinstance(error, TransportServerError):
+            # 429 rate limited, 5xx Monday having a bad time
+            if error.code == 429 or (error.code and error.code >= 500):
+                return backoff
+            return None
+
+        if isinstance(error, TransportQueryError):
+            message = str(error).lower()
+            if 'complexity budget exhausted' in message:
+                # Monday tells us when the budget resets, e.g. "... reset in 20 seconds"
+                reset_in = re.search(r'reset in (\d+) seconds', message)
+                delay = int(reset_in.group(1)) if reset_in else backoff
+                self.pause(delay)
+                self.concurrency = 1
+                return delay + random.uniform(0, self.base_delay)
+            if 'rate limit' in message or 'concurrency limit' in message:
+                return backoff
+
+        return None
+
+    def stats(self):
+        return {
+            'calls': self.calls,
+            'retries': self.retries,
+            'complexity_used': self.complexity_used,
+            'budget_remaining': self.budget_remaining,
+            'concurrency': self.concurrency,
+        }
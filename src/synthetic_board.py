@@ -0,0 +1,144 @@
+import json
+import random
+from datetime import date, datetime, time, timedelta
+
+"""
+Synthetic Monday project boards for load testing, see monday_stub.py
+Items are generated on demand from (seed, board, index), so a board of 1M items takes no memory
+and always comes back the same.
+"""
+
+group_titles = ['Open Projects', 'Closed Projects', 'Backlog']
+
+# Same column titles as our real board (fields_to_gather in monday.py) plus a column we never read
+columns = [
+    {'id': 'person', 'title': 'Int Mgr', 'type': 'people'},
+    {'id': 'people', 'title': 'CSM', 'type': 'people'},
+    {'id': 'status', 'title': 'Status', 'type': 'status'},
+    {'id': 'dropdown', 'title': 'Int Type', 'type': 'dropdown'},
+    {'id': 'numbers', 'title': 'Data Point', 'type': 'numbers'},
+    {'id': 'date4', 'title': 'Proj Creation', 'type': 'date'},
+    {'id': 'formula', 'title': 'Late? (w)', 'type': 'formula'},
+    {'id': 'country', 'title': 'Country', 'type': 'country'},
+    {'id': 'date', 'title': 'Start Date', 'type': 'date'},
+    {'id': 'date0', 'title': 'Due Date', 'type': 'date'},
+    {'id': 'formula0', 'title': 'Updated <1w?', 'type': 'formula'},
+    {'id': 'text', 'title': 'ERP (old)', 'type': 'text'},
+    {'id': 'long_text', 'title': 'Notes', 'type': 'long_text'},
+]
+
+# (value, weight)
+countries = [
+    ('United States', 30), ('Canada', 5), ('Mexico', 3), ('Brazil', 4), ('Colombia', 2),
+    ('United Kingdom', 12), ('France', 8), ('Germany', 10), ('Spain', 4), ('Netherlands', 3),
+    ('India', 6), ('Australia', 6), ('China', 3), ('Hong Kong', 2), ('Indonesia', 2),
+]
+group_statuses = {
+    'Open Projects': [('In Progress', 60), ('On Hold', 15), ('Not Started', 25)],
+    'Closed Projects': [('Completed', 80), ('Canceled', 20)],
+    'Backlog': [('Not Started', 85), ('On Hold', 15)],
+}
+int_types = [('Connector', 65), ('Custom', 35)]
+int_managers = ['Alex Martin', 'Priya Shah', 'Tom Becker', 'Lucia Gomez', 'Kenji Sato', 'Sarah Cohen', 'Omar Haddad', 'Emma Dubois']
+erps = ['NetSuite', 'SAP', 'Dynamics', 'Sage', 'QuickBooks', '']
+
+# Planned length in days by int type
+planned_days = {'Connector': (45, 120), 'Custom': (100, 240)}
+
+
+class SyntheticBoard:
+    def __init__(self, board_id, name=None, groups=3, items=1000, seed=0, start=date(2023, 1, 1), days=730):
+        self.id = str(board_id)
+        self.name = name or f'Projects {self.id}'
+        self.item_count = items
+        self.seed = seed
+        self.start = datetime.combine(start, time())
+        self.days = days
+        self.columns = columns
+        titles = group_titles + [f'Group {number}' for number in range(len(group_titles) + 1, groups + 1)]
+        self.groups = [{'id': f'group_{index}', 'title': titles[index]} for index in range(groups)]
+
+    # Items are spread round robin over the groups: item index = position * groups + group index
+    def group_size(self, group_index):
+        return max(0, (self.item_count - group_index + len(self.groups) - 1) // len(self.groups))
+
+    def group_items(self, group_index, offset, limit):
+        end = min(offset + limit, self.group_size(group_index))
+        return [self.item(position * len(self.groups) + group_index) for position in range(offset, end)]
+
+    def board_items(self, offset, limit):
+        return [self.item(index) for index in range(offset, min(offset + limit, self.item_count))]
+
+    def item_id(self, index):
+        return str(int(self.id) * 10_000_000 + index)
+
+    def item_index(self, item_id):
+        board_id, index = divmod(int(item_id), 10_000_000)
+        if str(board_id) != self.id or index >= self.item_count:
+            return None
+        return index
+
+    # One item in Monday's shape: column_values with id, text and the raw JSON value
+    def item(self, index):
+        rng = random.Random(f'{self.seed}:{self.id}:{index}')
+        group = self.groups[index % len(self.groups)]
+        status = weighted_choice(rng, group_statuses.get(group['title'], group_statuses['Backlog']))
+        int_type = weighted_choice(rng, int_types)
+
+        created = self.start + timedelta(days=rng.uniform(0, self.days))
+        kickoff = created + timedelta(days=int(rng.expovariate(1 / 25)))
+        due = kickoff + timedelta(days=rng.randint(*planned_days[int_type]))
+        closed = None
+        if status in ('Completed', 'Canceled'):
+            closed = kickoff + timedelta(days=int((due - kickoff).days * rng.uniform(0.6, 1.6)))
+            updated = closed + timedelta(hours=rng.uniform(0, 72))
+        else:
+            updated = created + timedelta(days=rng.uniform(0, max(1, (self.start + timedelta(days=self.days) - created).days)))
+
+        status_value = {'index': 1, 'post_id': None}
+        if closed:
+            status_value['changed_at'] = timestamp(closed)
+
+        values = {
+            'person': (rng.choice(int_managers), None),
+            'people': (rng.choice(int_managers), None),
+            'status': (status, json.dumps(status_value)),
+            'dropdown': (int_type, None),
+            'numbers': (str(rng.randint(1, 40)), None),
+            'date4': (created.date().isoformat(), json.dumps({'date': created.date().isoformat()})),
+            'formula': ('', None),
+            'country': (weighted_choice(rng, countries), None),
+            'date': (kickoff.date().isoformat(), json.dumps({'date': kickoff.date().isoformat()})),
+            'date0': (due.date().isoformat(), json.dumps({'date': due.date().isoformat()})),
+            'formula0': ('', None),
+            'text': (rng.choice(erps), None),
+            'long_text': ('', None),
+        }
+        return {
+            'id': self.item_id(index),
+            'name': f'Project {index}',
+            'created_at': timestamp(created),
+            'updated_at': timestamp(updated),
+            'group': group,
+            'column_values': [
+                {'id': column['id'], 'column': column, 'type': column['type'], 'text': values[column['id']][0], 'value': values[column['id']][1]}
+                for column in self.columns
+            ],
+        }
+
+
+def weighted_choice(rng, weighted_values):
+    values, weights = zip(*weighted_values)
+    return rng.choices(values, weights)[0]
+
+
+def timestamp(moment):
+    return moment.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+# Several boards, one per business unit, items are split evenly between them
+def generate_boards(boards=1, groups=3, items=1000, seed=0, first_board_id=498075709):
+    return [
+        SyntheticBoard(first_board_id + number, groups=groups, items=items // boards + (1 if number < items % boards else 0), seed=seed)
+        for number in range(boards)
+    ]
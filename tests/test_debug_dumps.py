@@ -0,0 +1,62 @@
+import gzip
+import json
+import threading
+
+from debug_dumps import DebugDumpWriter, read_debug_snapshot
+
+
+def test_compact_dumps_are_read_back_by_stage(tmp_path):
+    snapshot_path = str(tmp_path / 'debug_snapshot.ndjson.gz')
+    writer = DebugDumpWriter('compact', snapshot_path)
+    writer.write('raw_data/new_grouped_data.json', {'Group': [{'id': '1'}]})
+    writer.write('raw_data/kpi_by_month.json', {'2024-02': 3})
+    writer.close()
+    assert read_debug_snapshot(snapshot_path) == {'new_grouped_data': {'Group': [{'id': '1'}]}, 'kpi_by_month': {'2024-02': 3}}
+
+
+def test_pretty_dumps_write_one_file_per_stage(tmp_path):
+    filename = str(tmp_path / 'kpi_by_month.json')
+    writer = DebugDumpWriter('pretty')
+    writer.write(filename, {'2024-02': 3})
+    writer.close()
+    with open(filename) as file:
+        assert json.load(file) == {'2024-02': 3}
+
+
+def test_input_snapshot_is_never_overwritten(tmp_path):
+    snapshot_path = str(tmp_path / 'debug_snapshot.ndjson.gz')
+    with gzip.open(snapshot_path, 'wt') as file:
+        file.write(json.dumps({'stage': 'new_grouped_data', 'data': {'Group': []}}) + '\n')
+
+    writer = DebugDumpWriter('compact', snapshot_path)
+    writer.protect(snapshot_path)
+    writer.write('raw_data/kpi_by_month.json', {'2024-02': 3})
+    writer.close()
+    assert read_debug_snapshot(snapshot_path) == {'new_grouped_data': {'Group': []}}
+
+
+def test_input_dump_is_never_overwritten(tmp_path):
+    filename = str(tmp_path / 'new_grouped_data.json')
+    with open(filename, 'w') as file:
+        json.dump({'Group': [{'id': '1'}]}, file)
+
+    writer = DebugDumpWriter('pretty')
+    writer.protect(filename)
+    writer.write(filename, {'Group': []})
+    writer.close()
+    with open(filename) as file:
+        assert json.load(file) == {'Group': [{'id': '1'}]}
+
+
+# str() of this value is what ends up in the dump, and tells which thread serialized it
+class SerializingThread:
+    def __str__(self):
+        return threading.current_thread().name
+
+
+def test_dumps_are_serialized_on_the_worker_thread(tmp_path):
+    snapshot_path = str(tmp_path / 'debug_snapshot.ndjson.gz')
+    writer = DebugDumpWriter('compact', snapshot_path)
+    writer.write('raw_data/new_grouped_data.json', {'serialized_by': SerializingThread()})
+    writer.close()
+    assert read_debug_snapshot(snapshot_path) == {'new_grouped_data': {'serialized_by': 'debug-dumps'}}
@@ -0,0 +1,66 @@
+from deck_state import DeckState, expected_table_cells, table_cell_updates
+
+
+def insert_text(table_id, row, column, text, insertion_index=0):
+    return {'insertText': {'objectId': table_id, 'cellLocation': {'rowIndex': row, 'columnIndex': column},
+                           'text': text, 'insertionIndex': insertion_index}}
+
+
+def delete_text(table_id, row, column):
+    return {'deleteText': {'objectId': table_id, 'cellLocation': {'rowIndex': row, 'columnIndex': column}, 'textRange': {'type': 'ALL'}}}
+
+
+def test_expected_table_cells_applies_the_inserts():
+    requests = [
+        insert_text('kpiTable', 0, 0, 'Region'),
+        insert_text('kpiTable', 0, 0, 'The ', 0),
+        insert_text('kpiTable', 1, 0, ''),
+        {'createSlide': {'objectId': 'slide'}},
+        {'insertText': {'objectId': 'title', 'text': 'Not a cell'}},
+    ]
+    assert expected_table_cells(requests) == {('kpiTable', 0, 0): 'The Region'}
+
+
+def test_unchanged_cells_need_no_requests():
+    cells = {('kpiTable', 0, 0): 'NA', ('kpiTable', 0, 1): '12'}
+    assert table_cell_updates(cells, dict(cells), {'kpiTable'}) == ([], set())
+
+
+def test_changed_cells_are_cleared_then_filled():
+    expected = {('kpiTable', 0, 0): 'NA', ('kpiTable', 0, 1): '13'}
+    current = {('kpiTable', 0, 0): 'NA', ('kpiTable', 0, 1): '12'}
+    requests, missing_tables = table_cell_updates(expected, current, {'kpiTable'})
+    assert requests == [delete_text('kpiTable', 0, 1), insert_text('kpiTable', 0, 1, '13')]
+    assert missing_tables == set()
+
+
+def test_empty_cells_are_filled_and_stale_ones_cleared():
+    expected = {('kpiTable', 1, 1): '4'}
+    current = {('kpiTable', 2, 1): '7'}
+    requests, missing_tables = table_cell_updates(expected, current, {'kpiTable'})
+    assert requests == [insert_text('kpiTable', 1, 1, '4'), delete_text('kpiTable', 2, 1)]
+
+
+def test_other_tables_on_the_deck_are_left_alone():
+    expected = {('kpiTable', 0, 0): 'NA'}
+    current = {('kpiTable', 0, 0): 'NA', ('notesTable', 0, 0): 'hand written'}
+    assert table_cell_updates(expected, current, {'kpiTable', 'notesTable'}) == ([], set())
+
+
+def test_missing_tables_are_reported():
+    expected = {('kpiTable', 0, 0): 'NA', ('durationTable', 0, 0): 'Region'}
+    requests, missing_tables = table_cell_updates(expected, {}, {'kpiTable'})
+    assert requests == [insert_text('kpiTable', 0, 0, 'NA')]
+    assert missing_tables == {'durationTable'}
+
+
+def test_deck_state_remembers_what_was_written(tmp_path):
+    path = str(tmp_path / 'deck_state.json')
+    cells = {('kpiTable', 0, 0): 'NA'}
+    deck_state = DeckState(path)
+    assert not deck_state.unchanged('presentation', cells)
+    deck_state.record('presentation', cells)
+
+    deck_state = DeckState(path)
+    assert deck_state.unchanged('presentation', cells)
+    assert not deck_state.unchanged('presentation', {('kpiTable', 0, 0): 'EMEA'})
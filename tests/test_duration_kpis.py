@@ -0,0 +1,157 @@
+import asyncio
+from datetime import date, datetime
+
+import pytest
+
+import benchmark
+from debug_dumps import debug_dumps
+from duration_kpis import compute_duration_kpis, int_type_targets_days
+from monday import MondayBoards
+from period_index import FiscalCalendar, month_label, period_id
+from project_table import ProjectTable
+
+
+@pytest.fixture(autouse=True)
+def no_debug_dumps(monkeypatch):
+    monkeypatch.setattr(debug_dumps, 'mode', 'off')
+
+
+# Enriched projects with parsed dates from a seeded synthetic board, like after get_project_board
+def synthetic_projects(size=3000, seed=2):
+    synthetic_board, board = benchmark.fetched_board(size, seed)
+    monday_projects = MondayBoards([board['id']])
+    monday_projects.resolve_columns(board)
+    inputs = {'board': board, 'fetched_items': benchmark.fetched_items(monday_projects, synthetic_board, board)}
+    inputs['enrich'] = asyncio.run(benchmark.stage_enrich(monday_projects, inputs))[0]
+    return asyncio.run(benchmark.stage_normalize_dates(monday_projects, inputs))[0]
+
+
+def as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    return value if isinstance(value, date) else None
+
+
+def target_days(int_type):
+    for name, days in int_type_targets_days.items():
+        if int_type and name in int_type.lower():
+            return days
+    return 0
+
+
+# The same KPIs with a plain loop over the projects, one at a time
+def reference_duration_kpis(grouped_data, period='month', years=None, calendar=None):
+    calendar = calendar or FiscalCalendar()
+    sums = {}
+
+    def add(metric, breakdowns, item, counted_on, value):
+        month = period_id(counted_on.year, counted_on.month)
+        if years is not None and calendar.fiscal_year(month) not in years:
+            return
+        label = month_label(month) if period == 'month' else calendar.quarter_label(calendar.quarter(month))
+        for breakdown in breakdowns:
+            key = 'All' if breakdown == 'global' else item.get(breakdown)
+            if key is None:
+                continue
+            bucket = sums.setdefault(metric, {}).setdefault(breakdown, {}).setdefault(key, {}).setdefault(label, [0, 0])
+            bucket[0] += 1
+            bucket[1] += value
+
+    breakdowns = ['global', 'region', 'int_manager']
+    for items in grouped_data.values():
+        for item in items:
+            created, start, due, closed = (as_date(item.get(column)) for column in ('project_creation_date', 'start_date', 'due_date', 'closed_date'))
+            completed = (item.get('project_status') or '').lower() == 'completed'
+            if start and created and (start - created).days >= 0:
+                add('kickoff_lag', breakdowns, item, start, (start - created).days)
+            if start and due and (due - start).days >= 0:
+                add('planned_length', breakdowns, item, start, (due - start).days)
+            if completed and start and closed and (closed - start).days >= 0:
+                add('completed_length', breakdowns, item, closed, (closed - start).days)
+                target = target_days(item.get('int_type'))
+                if target:
+                    add('sla', breakdowns + ['int_type'], item, closed, int((closed - start).days < target))
+
+    duration_kpis = {}
+    for metric, metric_sums in sums.items():
+        for breakdown, values in metric_sums.items():
+            for key, periods in values.items():
+                for label, (count, total) in periods.items():
+                    if metric == 'sla':
+                        stats = {'projects': count, 'within_target': total, 'share_within_target': round(total / count, 3)}
+                    else:
+                        stats = {'projects': count, 'average_days': round(total / count, 1)}
+                    duration_kpis.setdefault(metric, {}).setdefault(breakdown, {}).setdefault(key, {})[label] = stats
+    return duration_kpis
+
+
+@pytest.mark.parametrize('period, years, fiscal_year_start', [('month', None, 1), ('quarter', None, 1), ('quarter', {2024}, 7), ('month', {2023}, 4)])
+def test_same_kpis_as_a_loop_over_the_projects(period, years, fiscal_year_start):
+    grouped_data = synthetic_projects()
+    calendar = FiscalCalendar(fiscal_year_start)
+    computed = compute_duration_kpis(ProjectTable.from_grouped_data(grouped_data), period, years, calendar)
+    expected = reference_duration_kpis(grouped_data, period, years, calendar)
+
+    assert expected['sla']['global']['All']
+    # Metrics with nothing counted have empty breakdowns instead of no entry
+    assert {metric: {breakdown: values for breakdown, values in breakdowns.items() if values} for metric, breakdowns in computed.items()} == expected
+
+
+def test_sla_attainment():
+    projects = {'Closed Projects': [
+        # 89 days for a connector, within its 90 day target
+        completed_project('Connector', date(2024, 1, 1), date(2024, 3, 30), region='NA'),
+        # 90 days is not under the target any more
+        completed_project('Connector', date(2024, 1, 1), date(2024, 3, 31), region='NA'),
+        completed_project('Custom Integration', date(2024, 1, 1), date(2024, 3, 15), region='EMEA'),
+        # No target for this int type, left out of the SLA but not of the completed length
+        completed_project('Partner Managed', date(2024, 1, 1), date(2024, 3, 1), region='EMEA'),
+        # Not completed, no SLA
+        {'project_status': 'In Progress', 'int_type': 'Connector', 'region': 'NA', 'start_date': date(2024, 1, 1), 'closed_date': date(2024, 3, 1)},
+    ]}
+    duration_kpis = compute_duration_kpis(table_of(projects), 'quarter')
+
+    assert duration_kpis['sla']['global'] == {'All': {'2024-Q1': {'projects': 3, 'within_target': 2, 'share_within_target': 0.667}}}
+    assert duration_kpis['sla']['region']['NA'] == {'2024-Q1': {'projects': 2, 'within_target': 1, 'share_within_target': 0.5}}
+    assert duration_kpis['sla']['int_type'] == {
+        'Connector': {'2024-Q1': {'projects': 2, 'within_target': 1, 'share_within_target': 0.5}},
+        'Custom Integration': {'2024-Q1': {'projects': 1, 'within_target': 1, 'share_within_target': 1.0}},
+    }
+    assert duration_kpis['completed_length']['global']['All']['2024-Q1']['projects'] == 4
+
+
+def test_missing_and_inconsistent_dates_are_left_out():
+    projects = {'Open Projects': [
+        {'region': 'NA', 'project_creation_date': date(2024, 1, 1), 'start_date': date(2024, 1, 11), 'due_date': date(2024, 2, 10)},
+        # No start date, nothing to measure
+        {'region': 'NA', 'project_creation_date': date(2024, 1, 1), 'start_date': None, 'due_date': date(2024, 2, 10)},
+        # No creation date, only the planned length
+        {'region': 'NA', 'start_date': datetime(2024, 1, 21, 9, 30), 'due_date': date(2024, 1, 31)},
+        # Due before the start is a data entry error, only the kickoff lag
+        {'region': 'NA', 'project_creation_date': date(2024, 1, 1), 'start_date': date(2024, 1, 31), 'due_date': date(2024, 1, 1)},
+        # No region, only in the global breakdown
+        {'region': None, 'project_creation_date': date(2024, 2, 1), 'start_date': date(2024, 2, 5)},
+    ]}
+    duration_kpis = compute_duration_kpis(table_of(projects))
+
+    assert duration_kpis['kickoff_lag']['global'] == {'All': {'2024-01': {'projects': 2, 'average_days': 20.0},
+                                                              '2024-02': {'projects': 1, 'average_days': 4.0}}}
+    assert duration_kpis['kickoff_lag']['region'] == {'NA': {'2024-01': {'projects': 2, 'average_days': 20.0}}}
+    assert duration_kpis['planned_length']['region'] == {'NA': {'2024-01': {'projects': 2, 'average_days': 20.0}}}
+    assert duration_kpis['completed_length'] == {'global': {}, 'region': {}, 'int_manager': {}}
+    assert duration_kpis['sla'] == {'global': {}, 'region': {}, 'int_manager': {}, 'int_type': {}}
+
+
+def test_unknown_period():
+    with pytest.raises(ValueError):
+        compute_duration_kpis(ProjectTable(), 'week')
+
+
+def completed_project(int_type, start_date, closed_date, **fields):
+    return {'project_status': 'Completed', 'int_type': int_type, 'start_date': start_date, 'closed_date': closed_date, **fields}
+
+
+# Hand made projects only have the fields a test is about, plus an id
+def table_of(grouped_data):
+    return ProjectTable.from_grouped_data({group_title: [{'id': str(index), **item} for index, item in enumerate(items)]
+                                           for group_title, items in grouped_data.items()})
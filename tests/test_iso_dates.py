@@ -0,0 +1,56 @@
+from datetime import date, datetime
+
+import pytest
+
+from iso_dates import normalize_dates, normalize_grouped_dates, parse_iso
+
+
+def test_plain_dates_parse_to_dates():
+    assert parse_iso('2024-03-01') == date(2024, 3, 1)
+    assert type(parse_iso('2024-03-01')) is date
+
+
+def test_utc_timestamps_parse_to_naive_datetimes():
+    assert parse_iso('2024-03-01T10:15:30Z') == datetime(2024, 3, 1, 10, 15, 30)
+    assert parse_iso('2024-03-01T10:15:30Z').tzinfo is None
+
+
+def test_offsets_are_converted_to_utc():
+    assert parse_iso('2024-03-01T01:00:00+02:00') == datetime(2024, 2, 29, 23, 0, 0)
+    assert parse_iso('2024-03-01 10:00:00') == datetime(2024, 3, 1, 10, 0, 0)
+
+
+@pytest.mark.parametrize('value', ['2024-13-01', '01/03/2024', 'soon', '2024-02-30'])
+def test_malformed_values_raise(value):
+    with pytest.raises(ValueError):
+        parse_iso(value)
+
+
+def test_normalize_dates_in_place():
+    item = {'id': '1', 'created_at': '2024-03-01T10:00:00Z', 'start_date': '2024-03-04', 'due_date': '', 'closed_date': None,
+            'project_creation_date': '2024-02-31', 'name': '2024-03-01'}
+    malformed = []
+    normalize_dates(item, malformed)
+    assert item['created_at'] == datetime(2024, 3, 1, 10, 0, 0)
+    assert item['start_date'] == date(2024, 3, 4)
+    assert item['due_date'] is None
+    assert item['closed_date'] is None
+    assert item['project_creation_date'] is None
+    # Only the date fields are parsed
+    assert item['name'] == '2024-03-01'
+    assert malformed == [('1', 'project_creation_date', '2024-02-31')]
+
+
+def test_normalize_dates_is_idempotent():
+    item = {'id': '1', 'start_date': '2024-03-04'}
+    normalize_dates(item, [])
+    normalize_dates(item, [])
+    assert item['start_date'] == date(2024, 3, 4)
+
+
+def test_normalize_grouped_dates_reports_malformed_dates(capsys):
+    grouped_data = {'Backlog': [{'id': '1', 'created_at': 'yesterday'}, {'id': '2', 'created_at': '2024-01-02T00:00:00Z'}]}
+    assert normalize_grouped_dates(grouped_data) is grouped_data
+    assert grouped_data['Backlog'][0]['created_at'] is None
+    assert grouped_data['Backlog'][1]['created_at'] == datetime(2024, 1, 2)
+    assert "created_at='yesterday' on item 1" in capsys.readouterr().out
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from debug_dumps import debug_dumps
+from item_snapshot import ItemSnapshot
+from monday import MondayBoards, scan_query, updated_items_query
+
+
+def project(item_id, group, updated_at, **fields):
+    return {'id': item_id, 'name': f'Project {item_id}', 'group': group, 'updated_at': updated_at, **fields}
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    snapshot = ItemSnapshot(str(tmp_path / 'monday_snapshot_1.json'), '1')
+    snapshot.reset({
+        'Open Projects': [project('1', 'Open Projects', '2024-03-01T10:00:00Z'), project('2', 'Open Projects', '2024-03-02T10:00:00Z')],
+        'Backlog': [project('3', 'Backlog', '2024-02-15T08:30:00Z')],
+    })
+    return snapshot
+
+
+def test_reset_sets_the_watermark_to_the_newest_update(snapshot):
+    assert snapshot.watermark == '2024-03-02T10:00:00Z'
+    assert snapshot.group_order == ['Open Projects', 'Backlog']
+
+
+def test_watermark_compares_timestamps_as_strings(snapshot):
+    # ISO-8601 UTC timestamps sort as strings, a later day with an earlier hour is still newer
+    snapshot.merge([project('4', 'Backlog', '2024-03-10T01:00:00Z')])
+    assert snapshot.watermark == '2024-03-10T01:00:00Z'
+    snapshot.merge([project('5', 'Backlog', '2024-03-09T23:59:59Z')])
+    assert snapshot.watermark == '2024-03-10T01:00:00Z'
+
+
+def test_merge_ignores_items_without_updated_at(snapshot):
+    snapshot.merge([project('4', 'Backlog', None)])
+    assert snapshot.watermark == '2024-03-02T10:00:00Z'
+    assert '4' in snapshot.items
+
+
+def test_updated_since_starts_a_day_before_the_watermark(snapshot):
+    # Monday compares __last_updated__ by day in the account's timezone, which may be behind UTC
+    assert snapshot.updated_since() == '2024-03-01'
+
+
+def test_full_scan_is_due_after_the_interval(snapshot):
+    assert not snapshot.needs_full_scan(3600, now=snapshot.full_scan_at + 60)
+    assert snapshot.needs_full_scan(3600, now=snapshot.full_scan_at + 3600)
+    snapshot.full_scan_at = None
+    assert snapshot.needs_full_scan(3600)
+
+
+def test_apply_scan_drops_deleted_items(snapshot):
+    removed_count = snapshot.apply_scan({'1': 'Open Projects', '3': 'Backlog'}, now=1000)
+    assert '2' not in snapshot.items
+    assert removed_count == 1
+    assert snapshot.full_scan_at == 1000
+
+
+def test_apply_scan_moves_items_between_groups(snapshot):
+    snapshot.group_order = ['Open Projects', 'Closed Projects', 'Backlog']
+    assert snapshot.apply_scan({'1': 'Closed Projects', '2': 'Open Projects', '3': 'Backlog', '4': 'Backlog'}) == 0
+    assert snapshot.items['1']['group'] == 'Closed Projects'
+    # New items come with the fetch of updated items, the scan only knows their id
+    assert '4' not in snapshot.items
+    grouped_data = snapshot.to_grouped_data()
+    assert list(grouped_data) == ['Open Projects', 'Closed Projects', 'Backlog']
+    assert [item['id'] for item in grouped_data['Closed Projects']] == ['1']
+
+
+def test_save_and_load_round_trip(snapshot):
+    snapshot.save()
+    loaded = ItemSnapshot(snapshot.path, '1')
+    assert loaded.load()
+    assert loaded.items == snapshot.items
+    assert loaded.watermark == snapshot.watermark
+    assert loaded.group_order == snapshot.group_order
+    assert not os.path.exists(f'{snapshot.path}.tmp')
+
+
+def test_load_ignores_another_boards_snapshot(snapshot):
+    snapshot.save()
+    assert not ItemSnapshot(snapshot.path, '2').load()
+
+
+def test_load_ignores_a_corrupted_snapshot(tmp_path):
+    path = tmp_path / 'snapshot.json'
+    path.write_text('{"board_id": "1", "items": {')
+    assert not ItemSnapshot(str(path), '1').load()
+
+
+def test_failed_save_keeps_the_previous_snapshot(snapshot):
+    snapshot.save()
+    with open(snapshot.path) as file:
+        saved = file.read()
+
+    # Not JSON serializable, the dump fails half way through the temp file
+    snapshot.merge([project('4', 'Backlog', '2024-04-01T00:00:00Z', owner=object())])
+    with pytest.raises(TypeError):
+        snapshot.save()
+
+    with open(snapshot.path) as file:
+        assert file.read() == saved
+    assert '4' not in json.loads(saved)['items']
+
+
+# MondayBoards answering the scan and the updated items queries from lists, without a network
+class FakeMondayBoards(MondayBoards):
+    def __init__(self, board, scanned_items, updated_items):
+        super().__init__([board['id']])
+        self.resolve_columns(board)
+        self.pages = {scan_query: scanned_items, updated_items_query: updated_items}
+        self.requests = []
+
+    async def iter_items_pages(self, first_page_query, next_page_query, get_items_page, variable_values=None, first_page_variables=None):
+        self.requests.append((first_page_query, first_page_variables))
+        yield [dict(item) for item in self.pages[first_page_query]]
+
+    async def get_board_items(self, board):
+        raise AssertionError('the snapshot should be synced, not fetched again')
+
+
+board = {'id': '1', 'name': 'Projects', 'columns': [],
+         'groups': [{'id': 'open', 'title': 'Open Projects'}, {'id': 'closed', 'title': 'Closed Projects'}, {'id': 'backlog', 'title': 'Backlog'}]}
+
+
+def fetched(item_id, group, updated_at):
+    return {'id': item_id, 'name': f'Project {item_id}', 'created_at': '2024-01-01T00:00:00Z', 'updated_at': updated_at,
+            'column_values': [], 'status_values': [], 'group': {'title': group}}
+
+
+def sync(snapshot, monday_projects, monkeypatch):
+    monkeypatch.setattr(debug_dumps, 'mode', 'off')
+    snapshot.save()
+    return asyncio.run(monday_projects.sync_board(board, snapshot.path, full_scan_seconds=3600))
+
+
+def test_sync_only_fetches_items_updated_since_the_watermark(snapshot, monkeypatch):
+    monday_projects = FakeMondayBoards(board, [], [fetched('2', 'Closed Projects', '2024-03-05T09:00:00Z'), fetched('4', 'Backlog', '2024-03-04T00:00:00Z')])
+    grouped_data = sync(snapshot, monday_projects, monkeypatch)
+
+    # The full scan isn't due, the board is not read item by item
+    assert monday_projects.requests == [(updated_items_query, {'boardId': '1', 'updatedSince': ['EXACT', '2024-03-01']})]
+    assert {group: [item['id'] for item in items] for group, items in grouped_data.items()} == {
+        'Open Projects': ['1'], 'Closed Projects': ['2'], 'Backlog': ['3', '4']}
+
+    synced = ItemSnapshot(snapshot.path, '1')
+    assert synced.load()
+    assert synced.watermark == '2024-03-05T09:00:00Z'
+
+
+def test_sync_scans_the_board_for_deletions_and_moves_when_due(snapshot, monkeypatch):
+    snapshot.full_scan_at -= 3600
+    scanned_items = [{'id': '1', 'group': {'title': 'Closed Projects'}}, {'id': '2', 'group': {'title': 'Open Projects'}}]
+    monday_projects = FakeMondayBoards(board, scanned_items, [])
+    grouped_data = sync(snapshot, monday_projects, monkeypatch)
+
+    assert [query for query, _ in monday_projects.requests] == [scan_query, updated_items_query]
+    assert {group: [item['id'] for item in items] for group, items in grouped_data.items()} == {
+        'Open Projects': ['2'], 'Closed Projects': ['1'], 'Backlog': []}
+    synced = ItemSnapshot(snapshot.path, '1')
+    assert synced.load()
+    assert not synced.needs_full_scan(3600)
@@ -0,0 +1,35 @@
+import os
+
+import pytest
+
+from json_state import load_json, save_json
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / 'cache' / 'state.json')
+    save_json(path, {'presentation': 'abc', 'cells': [1, 2]}, indent=4)
+    assert load_json(path, 'state') == {'presentation': 'abc', 'cells': [1, 2]}
+    assert not os.path.exists(f'{path}.tmp')
+
+
+def test_missing_file_loads_nothing(tmp_path):
+    assert load_json(str(tmp_path / 'state.json'), 'state') is None
+
+
+def test_corrupted_file_loads_nothing_with_a_warning(tmp_path, capsys):
+    path = tmp_path / 'state.json'
+    path.write_text('{"presentation": ')
+    assert load_json(str(path), 'deck state') is None
+    assert f'Could not read deck state {path}' in capsys.readouterr().out
+
+
+def test_failed_save_keeps_the_previous_file(tmp_path):
+    path = str(tmp_path / 'state.json')
+    save_json(path, {'version': 1})
+
+    # Not JSON serializable, the dump fails half way through the temp file
+    with pytest.raises(TypeError):
+        save_json(path, {'version': 2, 'owner': object()})
+
+    assert load_json(path, 'state') == {'version': 1}
+    assert not os.path.exists(f'{path}.tmp')
@@ -0,0 +1,137 @@
+import asyncio
+from datetime import date
+
+import pytest
+
+import benchmark
+from debug_dumps import debug_dumps
+from kpi_aggregator import KpiAggregator, kpi_keys
+from monday import MondayBoards, kpi_groupings
+from period_index import FiscalCalendar, period_id
+from project_table import ProjectTable
+
+
+@pytest.fixture(autouse=True)
+def no_debug_dumps(monkeypatch):
+    monkeypatch.setattr(debug_dumps, 'mode', 'off')
+
+
+# Enriched projects with parsed dates from a seeded synthetic board, like after get_project_board
+def synthetic_projects(size=3000, seed=1, years=None, fiscal_year_start=1):
+    synthetic_board, board = benchmark.fetched_board(size, seed)
+    monday_projects = MondayBoards([board['id']])
+    monday_projects.kpi_years = years
+    monday_projects.fiscal_calendar = FiscalCalendar(fiscal_year_start)
+    monday_projects.resolve_columns(board)
+    inputs = {'board': board, 'fetched_items': benchmark.fetched_items(monday_projects, synthetic_board, board)}
+    inputs['enrich'] = asyncio.run(benchmark.stage_enrich(monday_projects, inputs))[0]
+    grouped_data = asyncio.run(benchmark.stage_normalize_dates(monday_projects, inputs))[0]
+    return monday_projects, grouped_data
+
+
+# The legacy passes list every region and leave out KPIs nobody counted, only compare what was counted
+def counted(data):
+    if not isinstance(data, dict):
+        return data
+    data = {key: counted(value) for key, value in data.items()}
+    return {key: value for key, value in data.items() if value not in (0, {})}
+
+
+def legacy_kpi_stats(monday_projects, grouped_data):
+    async def run():
+        projects_by_region = await monday_projects.group_projects_by_region(grouped_data)
+        projects_by_period = await monday_projects.group_projects_by_month(projects_by_region)
+        return await monday_projects.gather_kpi_stats(projects_by_period)
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize('years, fiscal_year_start', [({2024}, 1), (None, 1), ({2024}, 7), ({2023, 2024}, 4)])
+def test_same_counts_as_the_legacy_passes(years, fiscal_year_start):
+    monday_projects, grouped_data = synthetic_projects(years=years, fiscal_year_start=fiscal_year_start)
+    legacy = legacy_kpi_stats(monday_projects, grouped_data)
+    aggregated = asyncio.run(monday_projects.aggregate_kpi_stats(grouped_data))
+
+    assert len(aggregated) == len(legacy) == 4
+    for legacy_stats, aggregated_stats in zip(legacy, aggregated):
+        assert counted(legacy_stats)
+        assert counted(aggregated_stats) == counted(legacy_stats)
+
+
+def test_table_and_dicts_give_the_same_counts(capsys):
+    monday_projects, grouped_data = synthetic_projects(years={2024})
+    from_dicts = asyncio.run(monday_projects.aggregate_kpi_stats(grouped_data))
+    from_table = asyncio.run(monday_projects.aggregate_kpi_stats(ProjectTable.from_grouped_data(grouped_data)))
+    assert from_table == from_dicts
+
+
+def test_table_counted_page_by_page(capsys):
+    monday_projects, grouped_data = synthetic_projects(years={2024})
+    whole = KpiAggregator(kpi_groupings, {2024})
+    whole.add_table(ProjectTable.from_grouped_data(grouped_data))
+
+    # Like stream_kpi_stats, every page is appended to the table and only its rows are counted
+    paged = KpiAggregator(kpi_groupings, {2024})
+    table = ProjectTable()
+    for group_title, items in grouped_data.items():
+        for start in range(0, len(items), 250):
+            first_row = len(table)
+            table.extend(group_title, items[start:start + 250])
+            paged.add_table(table, first_row)
+
+    for grouping in kpi_groupings:
+        assert paged.result(grouping) == whole.result(grouping)
+
+
+def test_counting_rules():
+    projects = {
+        'Open Projects': [
+            {'region': 'NA', 'project_status': 'In Progress', 'start_date': period_date(2024, 2), 'int_manager': 'Alex', 'int_type': 'Connector'},
+            {'region': 'NA', 'project_status': 'On Hold', 'start_date': period_date(2024, 2), 'int_manager': None, 'int_type': 'Custom'},
+            # Not started yet, not counted
+            {'region': 'NA', 'project_status': 'Not Started', 'start_date': period_date(2024, 2)},
+            # No start date, not counted
+            {'region': 'NA', 'project_status': 'In Progress', 'start_date': None},
+        ],
+        'Closed Projects': [
+            # Counted on the month of its last update, for the year it was closed
+            {'region': 'EMEA', 'project_status': 'Completed', 'closed_date': period_date(2024, 3), 'updated_at': period_date(2024, 4)},
+            # Canceled projects count for the year they were created in
+            {'region': 'EMEA', 'project_status': 'Canceled', 'project_creation_date': period_date(2023, 12), 'updated_at': period_date(2024, 1)},
+        ],
+        'Backlog': [
+            {'region': 'APAC', 'project_status': 'Not Started', 'project_creation_date': period_date(2024, 5), 'created_at': period_date(2024, 5)},
+            # No region, not counted
+            {'region': None, 'project_status': 'Not Started', 'project_creation_date': period_date(2024, 5), 'created_at': period_date(2024, 5)},
+        ],
+    }
+    aggregator = KpiAggregator(kpi_groupings, {2024})
+    aggregator.add_grouped_data(projects)
+
+    assert counted(aggregator.result(('month', 'region'))) == {
+        '2024-02': {'NA': {'projects_started': 1, 'paused_projects': 1, 'projects_signed': 2}},
+        '2024-04': {'EMEA': {'projects_completed': 1, 'projects_signed': 1}},
+        '2024-05': {'APAC': {'projects_signed': 1}},
+    }
+    # Projects without an integration manager are left out of the int manager groupings only
+    assert counted(aggregator.result(('year', 'int_manager'))) == {'2024': {'Alex': {'projects_started': 1, 'projects_signed': 1}}}
+    assert aggregator.result(('year',)) == {'2024': dict(zip(kpi_keys, [1, 0, 4, 1, 1]))}
+
+
+def test_fiscal_quarters_and_rolling_windows():
+    aggregator = KpiAggregator([('quarter', 'region')], None, FiscalCalendar(7))
+    aggregator.add_items('Backlog', [
+        {'region': 'NA', 'project_status': 'Not Started', 'project_creation_date': period_date(year, month), 'created_at': period_date(year, month)}
+        for year, month in [(2024, 6), (2024, 7), (2024, 9), (2024, 10)]
+    ])
+    assert {quarter: regions['NA']['projects_signed'] for quarter, regions in aggregator.result(('quarter', 'region')).items()} == \
+        {'2024-Q4': 1, '2025-Q1': 2, '2025-Q2': 1}
+    assert aggregator.rolling(('region',), period_id(2024, 9), 3) == {'NA': dict(zip(kpi_keys, [0, 0, 2, 0, 0]))}
+
+
+def test_unknown_dimension():
+    with pytest.raises(ValueError):
+        KpiAggregator([('week', 'region')])
+
+
+def period_date(year, month):
+    return date(year, month, 15)
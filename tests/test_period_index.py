@@ -0,0 +1,84 @@
+from datetime import date
+
+import pytest
+
+from period_index import FiscalCalendar, PeriodIndex, kpi_years, month_label, ordinal_period, period_id, period_year_month
+
+
+def test_period_ids_are_consecutive_across_years():
+    assert period_id(2024, 1) - period_id(2023, 12) == 1
+    assert period_year_month(period_id(2024, 12)) == (2024, 12)
+    assert month_label(period_id(2024, 3)) == '2024-03'
+    assert ordinal_period(date(2024, 3, 31).toordinal()) == period_id(2024, 3)
+
+
+def test_calendar_quarters():
+    calendar = FiscalCalendar(1)
+    assert calendar.fiscal_year(period_id(2024, 12)) == 2024
+    assert calendar.quarter_label(calendar.quarter(period_id(2024, 1))) == '2024-Q1'
+    assert calendar.quarter_label(calendar.quarter(period_id(2024, 3))) == '2024-Q1'
+    assert calendar.quarter_label(calendar.quarter(period_id(2024, 4))) == '2024-Q2'
+    assert calendar.quarter_label(calendar.quarter(period_id(2024, 12))) == '2024-Q4'
+
+
+@pytest.mark.parametrize('year, month, label', [
+    (2024, 6, '2024-Q4'),
+    (2024, 7, '2025-Q1'),
+    (2024, 9, '2025-Q1'),
+    (2024, 10, '2025-Q2'),
+    (2025, 1, '2025-Q3'),
+    (2025, 4, '2025-Q4'),
+    (2025, 6, '2025-Q4'),
+])
+def test_fiscal_quarters_starting_in_july(year, month, label):
+    # FY2025 runs from July 2024 to June 2025
+    calendar = FiscalCalendar(7)
+    assert calendar.quarter_label(calendar.quarter(period_id(year, month))) == label
+
+
+def test_fiscal_year_is_named_after_the_year_it_ends_in():
+    calendar = FiscalCalendar(7)
+    assert calendar.fiscal_year(period_id(2024, 6)) == 2024
+    assert calendar.fiscal_year(period_id(2024, 7)) == 2025
+    assert list(calendar.year_periods(2025)) == list(range(period_id(2024, 7), period_id(2025, 6) + 1))
+
+
+@pytest.mark.parametrize('first_month', range(1, 13))
+def test_quarter_periods_round_trip(first_month):
+    calendar = FiscalCalendar(first_month)
+    for period in range(period_id(2023, 1), period_id(2026, 1)):
+        quarter = calendar.quarter(period)
+        assert period in calendar.quarter_periods(quarter)
+        assert calendar.quarter_periods(quarter)[0] in calendar.year_periods(calendar.fiscal_year(period))
+
+
+def test_calendar_rejects_invalid_first_month():
+    with pytest.raises(ValueError):
+        FiscalCalendar(13)
+
+
+def test_fiscal_year_start_from_the_environment(monkeypatch):
+    monkeypatch.setenv('KPI_FISCAL_YEAR_START', '4')
+    assert FiscalCalendar().first_month == 4
+
+
+def test_index_windows_and_quarters():
+    index = PeriodIndex(FiscalCalendar(7), new_bucket=list)
+    for year, month in [(2024, 5), (2024, 7), (2024, 8), (2024, 11), (2025, 2)]:
+        index.bucket(period_id(year, month)).append(month_label(period_id(year, month)))
+
+    assert [bucket for period, bucket in index.items()] == [['2024-05'], ['2024-07'], ['2024-08'], ['2024-11'], ['2025-02']]
+    assert index.month(2024, 6) is None
+    # 2025-Q1 is July to September 2024
+    assert [period for period, bucket in index.quarter(index.calendar.quarter(period_id(2024, 7)))] == [period_id(2024, 7), period_id(2024, 8)]
+    assert [period for period, bucket in index.fiscal_year(2025)] == [period_id(2024, 7), period_id(2024, 8), period_id(2024, 11), period_id(2025, 2)]
+    assert [period for period, bucket in index.rolling(period_id(2024, 11), 4)] == [period_id(2024, 8), period_id(2024, 11)]
+    assert {index.calendar.quarter_label(quarter): len(periods) for quarter, periods in index.quarters().items()} == \
+        {'2024-Q4': 1, '2025-Q1': 2, '2025-Q2': 1, '2025-Q3': 1}
+
+
+def test_kpi_years():
+    assert kpi_years(value='2023, 2024') == {2023, 2024}
+    assert kpi_years(value='all') is None
+    today = date.today()
+    assert kpi_years(FiscalCalendar(1), value='') == {today.year}
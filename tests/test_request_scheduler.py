@@ -0,0 +1,104 @@
+import asyncio
+
+import aiohttp
+import pytest
+from gql.transport.exceptions import TransportQueryError, TransportServerError
+
+from request_scheduler import RequestScheduler
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    # Record the backoff instead of waiting for it
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(asyncio, 'sleep', sleep)
+    return delays
+
+
+def failing(*errors, response=None):
+    errors = list(errors)
+
+    async def send():
+        if errors:
+            raise errors.pop(0)
+        return response if response is not None else {'data': 'ok'}
+    return send
+
+
+def run(scheduler, send):
+    return asyncio.run(scheduler.run(send))
+
+
+@pytest.mark.parametrize('error', [
+    TransportServerError('Too many requests', 429),
+    TransportServerError('Internal server error', 500),
+    TransportServerError('Bad gateway', 502),
+    TransportQueryError('Rate limit exceeded'),
+    TransportQueryError('Concurrency limit exceeded, max 4 concurrent requests'),
+    aiohttp.ServerDisconnectedError(),
+    aiohttp.ClientConnectionError('Connection refused'),
+    ConnectionResetError(104, 'Connection reset by peer'),
+    asyncio.TimeoutError(),
+])
+def test_transient_errors_are_retried(error, delays):
+    scheduler = RequestScheduler(4, max_retries=3, base_delay=1)
+    assert run(scheduler, failing(error, error)) == {'data': 'ok'}
+    assert scheduler.calls == 3
+    assert scheduler.retries == 2
+    assert len(delays) == 2
+
+
+@pytest.mark.parametrize('error', [
+    TransportServerError('Unauthorized', 401),
+    TransportQueryError('Field "boards" argument "ids" has invalid value'),
+    ValueError('not a transport error'),
+])
+def test_other_errors_are_raised_right_away(error, delays):
+    scheduler = RequestScheduler(4, max_retries=3)
+    with pytest.raises(type(error)):
+        run(scheduler, failing(error))
+    assert scheduler.calls == 1
+    assert delays == []
+
+
+def test_gives_up_after_max_retries(delays):
+    scheduler = RequestScheduler(4, max_retries=2)
+    error = TransportServerError('Internal server error', 500)
+    with pytest.raises(TransportServerError):
+        run(scheduler, failing(error, error, error, error))
+    assert scheduler.calls == 3
+    assert scheduler.retries == 2
+
+
+def test_backoff_is_jittered_and_capped(monkeypatch):
+    monkeypatch.setattr('random.uniform', lambda low, high: high)
+    scheduler = RequestScheduler(4, base_delay=1, max_delay=10)
+    error = asyncio.TimeoutError()
+    assert [scheduler.retry_delay(error, attempt) for attempt in range(6)] == [1, 2, 4, 8, 10, 10]
+
+    monkeypatch.setattr('random.uniform', lambda low, high: low)
+    assert scheduler.retry_delay(error, 3) == 0
+
+
+def test_exhausted_budget_waits_for_the_reset(delays, monkeypatch):
+    monkeypatch.setattr('random.uniform', lambda low, high: 0)
+    scheduler = RequestScheduler(4, max_retries=3)
+    error = TransportQueryError('Complexity budget exhausted, query cost 5000 budget remaining 10 out of 10000000 reset in 20 seconds')
+    assert run(scheduler, failing(error)) == {'data': 'ok'}
+    assert scheduler.concurrency == 1
+    # Once before the retry, the retry itself then waits for the pause to be over
+    assert delays[0] == 20
+    assert 19 < delays[1] <= 20
+
+
+def test_concurrency_follows_the_remaining_budget(delays):
+    scheduler = RequestScheduler(8)
+    response = {'data': 'ok', 'complexity': {'query': 1000, 'after': 3500, 'reset_in_x_seconds': 30}}
+    assert run(scheduler, failing(response=response)) == {'data': 'ok'}
+    assert scheduler.concurrency == 3
+    assert scheduler.stats()['complexity_used'] == 1000
+    assert scheduler.in_flight == 0
@@ -0,0 +1,126 @@
+import asyncio
+import contextlib
+
+import pytest
+
+from monday import MondayBoards, boards_query
+from project_table import ProjectTable
+
+
+board = {'id': '1', 'name': 'Projects', 'columns': [],
+         'groups': [{'id': 'open', 'title': 'Open Projects'}, {'id': 'closed', 'title': 'Closed Projects'}, {'id': 'backlog', 'title': 'Backlog'}]}
+
+
+def fetched(item_id):
+    return {'id': item_id, 'name': f'Project {item_id}', 'created_at': '2024-01-01T00:00:00Z', 'updated_at': '2024-01-02T00:00:00Z',
+            'column_values': [], 'status_values': []}
+
+
+# MondayBoards serving every group's pages from memory, without a network
+# failing_group raises after its first page, endless groups keep returning pages until they are stopped
+class FakeMondayBoards(MondayBoards):
+    def __init__(self, failing_group=None, endless_groups=(), pages_per_group=3):
+        super().__init__([board['id']])
+        self.failing_group = failing_group
+        self.endless_groups = set(endless_groups)
+        self.pages_per_group = pages_per_group
+        self.closed_groups = []
+
+    async def send_request(self, query, variable_values=None):
+        assert query is boards_query
+        return {'boards': [board]}
+
+    async def iter_items_pages(self, first_page_query, next_page_query, get_items_page, variable_values=None, first_page_variables=None):
+        group_id = first_page_variables['groupId']
+        try:
+            page = 0
+            while group_id in self.endless_groups or page < self.pages_per_group:
+                if page == 1 and group_id == self.failing_group:
+                    raise RuntimeError(f'{group_id} failed')
+                # Takes a moment like a request, without it the first fetchers would always win the queue's free slot
+                await asyncio.sleep(0.001)
+                yield [fetched(f'{group_id}-{page}-{index}') for index in range(2)]
+                page += 1
+        finally:
+            self.closed_groups.append(group_id)
+
+
+# Tasks started since the test began and still around, should be none once the stream is done
+def leftover_tasks(tasks_before):
+    return [task for task in asyncio.all_tasks() if task not in tasks_before]
+
+
+def test_every_page_is_streamed():
+    async def run():
+        tasks_before = asyncio.all_tasks()
+        monday_projects = FakeMondayBoards()
+        pages = [page async for page in monday_projects.stream_project_board(max_pending_pages=1)]
+        return pages, leftover_tasks(tasks_before)
+
+    pages, tasks = asyncio.run(run())
+    assert sorted(len(items) for _, items in pages) == [2] * 9
+    assert {group_title for group_title, _ in pages} == {'Open Projects', 'Closed Projects', 'Backlog'}
+    assert tasks == []
+
+
+def test_a_failing_group_reaches_the_consumer_and_stops_the_others():
+    async def run():
+        tasks_before = asyncio.all_tasks()
+        # The other groups never end on their own, only stopping them lets the stream finish
+        monday_projects = FakeMondayBoards(failing_group='closed', endless_groups={'open', 'backlog'})
+        consumed = 0
+        with pytest.raises(RuntimeError, match='closed failed'):
+            async for group_title, items in monday_projects.stream_project_board(max_pending_pages=1):
+                consumed += 1
+        return monday_projects, consumed, leftover_tasks(tasks_before)
+
+    monday_projects, consumed, tasks = asyncio.run(asyncio.wait_for(run(), timeout=5))
+    assert consumed >= 1
+    assert tasks == []
+    assert sorted(monday_projects.closed_groups) == ['backlog', 'closed', 'open']
+
+
+def test_a_consumer_stopping_early_stops_the_fetchers():
+    async def run():
+        tasks_before = asyncio.all_tasks()
+        monday_projects = FakeMondayBoards(endless_groups={'open', 'closed', 'backlog'})
+        async with contextlib.aclosing(monday_projects.stream_project_board(max_pending_pages=1)) as pages:
+            async for group_title, items in pages:
+                break
+        return monday_projects, leftover_tasks(tasks_before)
+
+    monday_projects, tasks = asyncio.run(asyncio.wait_for(run(), timeout=5))
+    assert tasks == []
+    assert sorted(monday_projects.closed_groups) == ['backlog', 'closed', 'open']
+
+
+def test_a_failing_consumer_stops_the_fetchers():
+    async def run():
+        tasks_before = asyncio.all_tasks()
+        monday_projects = FakeMondayBoards(endless_groups={'open', 'closed', 'backlog'})
+        with pytest.raises(ValueError):
+            async with contextlib.aclosing(monday_projects.stream_project_board(max_pending_pages=1)) as pages:
+                async for group_title, items in pages:
+                    raise ValueError('could not count the page')
+        return monday_projects, leftover_tasks(tasks_before)
+
+    monday_projects, tasks = asyncio.run(asyncio.wait_for(run(), timeout=5))
+    assert tasks == []
+    assert sorted(monday_projects.closed_groups) == ['backlog', 'closed', 'open']
+
+
+def test_stream_kpi_stats_stops_the_fetchers_when_counting_fails(monkeypatch):
+    async def run():
+        tasks_before = asyncio.all_tasks()
+        monday_projects = FakeMondayBoards(endless_groups={'open', 'closed', 'backlog'})
+        with pytest.raises(ValueError):
+            await monday_projects.stream_kpi_stats()
+        return monday_projects, leftover_tasks(tasks_before)
+
+    def extend(self, group_title, items):
+        raise ValueError('could not load the page')
+    monkeypatch.setattr(ProjectTable, 'extend', extend)
+
+    monday_projects, tasks = asyncio.run(asyncio.wait_for(run(), timeout=5))
+    assert tasks == []
+    assert sorted(monday_projects.closed_groups) == ['backlog', 'closed', 'open']